@@ -0,0 +1,586 @@
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+import psycopg
+import torch
+from pgvector.psycopg import register_vector
+from PIL import Image
+from torch.utils.data import DataLoader
+
+from patchcore import PatchCore
+from projection import knn_verdicts
+from rag_core import (WEIGHTS_DIR, DefectImageDataset, DefectRAG_Postgres, aspect_size, defect_type_of, list_image_files,
+                      model_weights_tag)
+from runtime import RUNTIMES, BackboneRuntime, make_runtime
+from vector_store import BUMP_GENERATION_SQL, PROTOTYPE_CELLS, DefectRow, PostgresVectorStore
+
+# ★ build_db.py와 동일한 DB 접속 정보 ★
+DB_CONFIG = {
+    "host": "localhost",
+    "port": "5432",
+    "dbname": "postgres",
+    "user": "postgres",
+    "password": "3510"
+}
+
+
+def _max_id(db_info):
+    with psycopg.connect(**db_info) as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM defect_images").fetchone()[0]
+
+
+def _delete_after(db_info, last_id):
+    # 벤치마크 중 추가된 행은 지워서 DB를 원래 상태로 되돌림
+    with psycopg.connect(**db_info, autocommit=True) as conn:
+        with conn.transaction():
+            conn.execute("DELETE FROM defect_images WHERE id > %s", (last_id,))
+            conn.execute(BUMP_GENERATION_SQL)
+
+
+def bench_ingest(rag, folder_path, batch_size, num_workers, write_workers=1):
+    """
+    기존 1장씩 루프 vs 배치/파이프라인 ingest 처리 속도(images/sec) 비교 (단계별 사용률은 ingest가 출력)
+    """
+    results = {}
+    for name, kwargs in [
+        ("per-image", {"batch_size": None}),
+        (f"pipelined (bs={batch_size}, decode={num_workers}, write={write_workers})",
+         {"batch_size": batch_size, "num_workers": num_workers, "write_workers": write_workers}),
+    ]:
+        last_id = _max_id(rag.db_info)
+        try:
+            results[name] = rag.ingest_data_folder(folder_path, **kwargs)
+        finally:
+            _delete_after(rag.db_info, last_id)
+
+    print("\n📊 [Ingest 벤치마크]")
+    print("-" * 70)
+    base = results["per-image"]["images_per_sec"]
+    for name, stats in results.items():
+        speedup = stats["images_per_sec"] / base if base > 0 else 0.0
+        print(f"   {name:<40} {stats['images_per_sec']:>8.2f} images/sec  (x{speedup:.2f})")
+    print("-" * 70)
+    return results
+
+
+def bench_search(rag, query_paths, top_k, threads, repeat):
+    """
+    멀티스레드 검색 처리량(queries/sec) 측정. 임베딩은 미리 계산해 두고 DB 검색만 측정
+    """
+    vectors = [rag.get_embedding(path) for path in query_paths] * repeat
+
+    latencies = []
+
+    def one(vector):
+        start = time.perf_counter()
+        rag.search_vector(vector, top_k)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(one, vectors))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"\n📊 [Search 벤치마크] threads={threads}, top_k={top_k}, queries={len(vectors)}")
+    print("-" * 70)
+    print(f"   처리량: {len(vectors) / elapsed:.1f} queries/sec")
+    print(f"   지연시간: p50 {np.percentile(latencies_ms, 50):.2f}ms / p99 {np.percentile(latencies_ms, 99):.2f}ms")
+    print(f"   풀 상태: {rag.pool_stats()}")
+    print("-" * 70)
+
+
+def _sample_vectors(db_info, n):
+    with psycopg.connect(**db_info) as conn:
+        register_vector(conn)
+        rows = conn.execute("SELECT embedding FROM defect_images ORDER BY random() LIMIT %s", (n,)).fetchall()
+    # pgvector 버전에 따라 numpy 배열 또는 Vector 객체로 읽힘
+    return [np.asarray(row[0].to_numpy() if hasattr(row[0], "to_numpy") else row[0], dtype=np.float32)
+            for row in rows]
+
+
+def bench_recall(rag, num_queries, top_k, ef_search_list, probes_list):
+    """
+    ANN 인덱스 검색의 recall@k vs 지연시간 측정 (기준: 인덱스를 끈 정확한 전체 스캔)
+    질의는 DB에 저장된 벡터 중 무작위 샘플을 사용
+    """
+    queries = _sample_vectors(rag.db_info, num_queries)
+
+    def run(**kwargs):
+        latencies, result_ids = [], []
+        for vector in queries:
+            start = time.perf_counter()
+            rows = rag.search_vector(vector, top_k, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            result_ids.append({row[3] for row in rows})
+        return np.array(latencies) * 1000, result_ids
+
+    exact_ms, exact_ids = run(exact=True)
+    settings = [("exact", {})] + \
+               [(f"ef_search={ef}", {"ef_search": ef}) for ef in ef_search_list] + \
+               [(f"probes={p}", {"probes": p}) for p in probes_list]
+
+    print(f"\n📊 [Recall vs Latency] queries={len(queries)}, top_k={top_k}")
+    for name, size, _ in rag.index_info():
+        print(f"   인덱스: {name} ({size})")
+    print("-" * 70)
+    print(f"   {'설정':<20} {'recall@k':>10} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for name, kwargs in settings:
+        if name == "exact":
+            latencies_ms, result_ids = exact_ms, exact_ids
+        else:
+            latencies_ms, result_ids = run(**kwargs)
+        recall = np.mean([len(got & truth) / max(len(truth), 1) for got, truth in zip(result_ids, exact_ids)])
+        print(f"   {name:<20} {recall:>10.4f} {np.percentile(latencies_ms, 50):>10.2f} "
+              f"{np.percentile(latencies_ms, 99):>10.2f}")
+    print("-" * 70)
+
+
+def bench_prototypes(rag, num_queries, top_k, classes_list, cells_list):
+    """
+    프로토타입 2단계 판정 vs 전체 정확한 판정: 판정 일치율과 지연시간 (기준: 인덱스를 끈 전체 스캔 verdict)
+    """
+    queries = _sample_vectors(rag.db_info, num_queries)
+
+    def run(**kwargs):
+        latencies, verdicts = [], []
+        for vector in queries:
+            start = time.perf_counter()
+            votes = rag.store.verdict_many([vector], top_k, **kwargs)[0]
+            latencies.append(time.perf_counter() - start)
+            verdicts.append(votes[0].defect_type if votes else None)
+        return np.array(latencies) * 1000, verdicts
+
+    exact_ms, exact_verdicts = run(exact=True)
+    settings = [("exact", {})] + [(f"classes={classes}, cells={cells}", {"classes": classes, "cells": cells})
+                                  for classes in classes_list for cells in cells_list]
+
+    print(f"\n📊 [프로토타입 2단계 판정] queries={len(queries)}, top_k={top_k}, DB {rag.store.count()}행")
+    for defect_type, clusters, rows, largest in rag.store.prototype_stats():
+        print(f"   {defect_type}: 서브 중심 {clusters}개, {rows}행 (최대 클러스터 {largest}행)")
+    print("-" * 70)
+    print(f"   {'설정':<24} {'판정 일치율':>10} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for name, kwargs in settings:
+        if name == "exact":
+            latencies_ms, verdicts = exact_ms, exact_verdicts
+        else:
+            latencies_ms, verdicts = run(**kwargs)
+        agreement = np.mean([got == truth for got, truth in zip(verdicts, exact_verdicts)])
+        print(f"   {name:<24} {agreement:>10.4f} {np.percentile(latencies_ms, 50):>10.2f} "
+              f"{np.percentile(latencies_ms, 99):>10.2f}")
+    print("-" * 70)
+
+
+def bench_prototype_scale(db_info, sizes, num_classes, cluster_size, classes, cells, num_queries, top_k, dim=1024,
+                          seed=0):
+    """
+    DB 크기를 늘려가며 프로토타입 2단계 판정(cells 기본값 PROTOTYPE_CELLS) vs 전체 정확한 판정의 지연시간
+    운영 테이블은 건드리지 않도록 임시 스키마(defect_bench_scale)에 합성 임베딩(결함 종류마다 모드 8개인 가우시안 혼합)을
+    sizes까지 늘려 적재하고, 크기마다 build_prototypes(cluster_size)로 다시 만든 뒤 측정. 끝나면 스키마 삭제
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_classes, 8, dim)).astype(np.float32)
+
+    def sample(n):
+        labels = rng.integers(num_classes, size=n)
+        vectors = centers[labels, rng.integers(8, size=n)] + rng.standard_normal((n, dim)).astype(np.float32)
+        return labels, vectors
+
+    def rows(start, n):
+        for offset in range(start, start + n, 5000):
+            labels, vectors = sample(min(5000, start + n - offset))
+            for i, (label, vector) in enumerate(zip(labels, vectors)):
+                yield DefectRow(f"synthetic_{offset + i}.png", f"type_{label}", vector, None, None, None,
+                                None, None, None, None)
+
+    schema = "defect_bench_scale"
+    with psycopg.connect(**db_info, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.execute(f"CREATE SCHEMA {schema}")
+    queries = list(sample(num_queries)[1])
+    results = []
+    try:
+        store = PostgresVectorStore(dict(db_info, options=f"-c search_path={schema},public"), pool_size=1, dim=dim)
+        try:
+            total = 0
+            for size in sorted(sizes):
+                total += store.add(rows(total, size - total))
+                store.build_prototypes(cluster_size)
+                latencies = {}
+                verdicts = {}
+                for name, kwargs in [("exact", {"exact": True}), ("prototype", {"classes": classes, "cells": cells})]:
+                    store.verdict_many([queries[0]], top_k, **kwargs)  # 워밍업
+                    timings, picks = [], []
+                    for vector in queries:
+                        start = time.perf_counter()
+                        votes = store.verdict_many([vector], top_k, **kwargs)[0]
+                        timings.append(time.perf_counter() - start)
+                        picks.append(votes[0].defect_type if votes else None)
+                    latencies[name], verdicts[name] = np.array(timings) * 1000, picks
+                agreement = np.mean([got == truth for got, truth in zip(verdicts["prototype"], verdicts["exact"])])
+                results.append((total, latencies["exact"], latencies["prototype"], agreement))
+        finally:
+            store.close()
+    finally:
+        with psycopg.connect(**db_info, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+
+    print(f"\n📊 [프로토타입 판정 지연시간 vs DB 크기] 합성 {dim}차원, 결함 종류 {num_classes}개, "
+          f"cluster_size={cluster_size}, classes={classes}, cells={cells or PROTOTYPE_CELLS}, queries={len(queries)}")
+    print("-" * 80)
+    print(f"   {'DB 행 수':>10} {'전체 p50(ms)':>13} {'전체 p99(ms)':>13} {'2단계 p50(ms)':>14} {'2단계 p99(ms)':>14} "
+          f"{'판정 일치율':>10}")
+    for total, exact_ms, prototype_ms, agreement in results:
+        print(f"   {total:>10} {np.percentile(exact_ms, 50):>13.2f} {np.percentile(exact_ms, 99):>13.2f} "
+              f"{np.percentile(prototype_ms, 50):>14.2f} {np.percentile(prototype_ms, 99):>14.2f} {agreement:>10.4f}")
+    print("-" * 80)
+    print("💡 2단계 판정은 classes * cells * cluster_size 행만 훑으므로 DB가 커져도 지연시간이 거의 일정합니다.")
+    return results
+
+
+def bench_storage(rag, num_queries, top_k, storages, method, rerank_factor):
+    """
+    저장 방식(float32 / halfvec / bit + float32 재정렬)별 인덱스 크기, 검색 지연시간, top-k 일치율 비교
+    기준: float32 정확한 전체 스캔. 저장 방식마다 인덱스를 새로 만들고, 끝나면 원래 ANN 인덱스로 되돌림
+    """
+    queries = _sample_vectors(rag.db_info, num_queries)
+    truth = [{row[3] for row in rows} for rows in rag.store.search_many(queries, top_k, exact=True)]
+    original_indexes = [index_def for _, _, index_def in rag.index_info()]
+    with psycopg.connect(**rag.db_info) as conn:
+        table_size = conn.execute("SELECT pg_size_pretty(pg_total_relation_size('defect_images'))").fetchone()[0]
+
+    results = []
+    try:
+        for storage in storages:
+            store = PostgresVectorStore(rag.db_info, pool_size=1, storage=storage, rerank_factor=rerank_factor)
+            try:
+                store.create_index(method)
+                index_size = ", ".join(size for _, size, _ in store.index_info())
+                store.search(queries[0], top_k)  # 워밍업
+                latencies, agreement = [], []
+                for vector, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    rows = store.search(vector, top_k)
+                    latencies.append(time.perf_counter() - start)
+                    agreement.append(len({row[3] for row in rows} & expected) / max(len(expected), 1))
+                latencies_ms = np.array(latencies) * 1000
+                results.append((storage, index_size, np.mean(agreement),
+                                np.percentile(latencies_ms, 50), np.percentile(latencies_ms, 99)))
+            finally:
+                store.close()
+    finally:
+        rag.drop_index()
+        with psycopg.connect(**rag.db_info, autocommit=True) as conn:
+            for index_def in original_indexes:
+                conn.execute(index_def)
+
+    print(f"\n📊 [저장 방식 비교] queries={len(queries)}, top_k={top_k}, index={method}, "
+          f"재정렬 후보=top_k*{rerank_factor}, 테이블 전체 크기={table_size}")
+    print("-" * 70)
+    print(f"   {'저장 방식':<12} {'인덱스 크기':>12} {'top-k 일치율':>12} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for storage, index_size, agreement, p50, p99 in results:
+        print(f"   {storage:<12} {index_size:>12} {agreement:>12.4f} {p50:>10.2f} {p99:>10.2f}")
+    print("-" * 70)
+    return results
+
+
+def bench_patchcore(rag, normal_folder, query_paths, image_size, coreset_ratios, batch_size, num_workers, repeat):
+    """
+    PatchCore 메모리 뱅크 크기, coreset 생성 시간, 이미지 1장당 채점 지연시간 (coreset 비율별)
+    """
+    normal_paths = list_image_files(normal_folder)
+    results = []
+    for ratio in coreset_ratios:
+        patchcore = PatchCore(rag, image_size=image_size, coreset_ratio=ratio)
+        stats = patchcore.fit(normal_paths, batch_size=batch_size, num_workers=num_workers)
+
+        loader = patchcore._loader(query_paths, 1, 0)
+        images = [img_batch for img_batch, _ in loader]
+        patchcore.score_batch(images[0])  # 워밍업
+        latencies = []
+        for _ in range(repeat):
+            for img_batch in images:
+                start = time.perf_counter()
+                patchcore.score_batch(img_batch)
+                latencies.append(time.perf_counter() - start)
+        latencies_ms = np.array(latencies) * 1000
+        results.append((ratio, stats, np.percentile(latencies_ms, 50), np.percentile(latencies_ms, 99)))
+
+    print(f"\n📊 [PatchCore] 정상 이미지 {len(normal_paths)}장, image_size={image_size}, "
+          f"질의 {len(query_paths)}장 x {repeat}회")
+    print("-" * 86)
+    print(f"   {'coreset 비율':>12} {'뱅크 패치 수':>12} {'뱅크 크기':>12} {'특징 추출(초)':>13} "
+          f"{'coreset(초)':>12} {'p50(ms)':>9} {'p99(ms)':>9}")
+    for ratio, stats, p50, p99 in results:
+        print(f"   {ratio:>12.3f} {stats['bank_patches']:>12} {stats['bank_mb']:>9.1f} MB "
+              f"{stats['extract_seconds']:>13.1f} {stats['coreset_seconds']:>12.1f} {p50:>9.2f} {p99:>9.2f}")
+    print("-" * 86)
+    return results
+
+
+def bench_service(rag, url, query_paths, concurrency, repeat, batch_size):
+    """
+    추론 서비스(service.py) 부하 테스트: 동시 클라이언트 concurrency개가 /embed를 호출할 때의 처리량과 지연시간
+    비교 기준: 같은 이미지를 이 프로세스에서 batch_size장씩 오프라인 배치 임베딩한 처리량
+    (캐시 적중으로 부풀려지지 않도록 서비스는 --no-cache로 띄워서 측정)
+    """
+    requests = list(query_paths) * repeat
+
+    loader = DataLoader(DefectImageDataset(list(query_paths), rag.transform), batch_size=batch_size)
+    batches = [img_batch for img_batch, _ in loader]
+    rag.embed_batch(batches[0])  # 워밍업 (모델 로드)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for img_batch in batches:
+            rag.embed_batch(img_batch)
+    offline_per_sec = len(requests) / (time.perf_counter() - start)
+
+    target = urlsplit(url)
+    local = threading.local()
+
+    def call(path, payload=None):
+        # 스레드마다 keep-alive 연결 1개를 재사용
+        if getattr(local, "conn", None) is None:
+            local.conn = http.client.HTTPConnection(target.hostname, target.port)
+        method = "GET" if payload is None else "POST"
+        body = None if payload is None else json.dumps(payload)
+        local.conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = local.conn.getresponse()
+        data = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(f"{path} {response.status}: {data}")
+        return data
+
+    def one(path):
+        begin = time.perf_counter()
+        call("/embed", {"path": path})
+        return time.perf_counter() - begin
+
+    before = call("/metrics")["batchers"]["embed"]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, requests[:concurrency]))  # 워밍업 (연결 생성)
+        start = time.perf_counter()
+        latencies = list(executor.map(one, requests))
+        service_per_sec = len(requests) / (time.perf_counter() - start)
+    after = call("/metrics")["batchers"]["embed"]
+    mean_batch = (after["items"] - before["items"]) / max(after["batches"] - before["batches"], 1)
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"\n📊 [추론 서비스 부하 테스트] {url}, 동시 요청 {concurrency}개, 요청 {len(requests)}개")
+    print("-" * 70)
+    print(f"   오프라인 배치 (batch={batch_size})   : {offline_per_sec:8.1f} img/s")
+    print(f"   서비스 /embed                 : {service_per_sec:8.1f} img/s "
+          f"({service_per_sec / offline_per_sec:.0%}, 평균 배치 {mean_batch:.1f}개)")
+    print(f"   요청 지연시간 p50 / p99       : {np.percentile(latencies_ms, 50):.1f} / "
+          f"{np.percentile(latencies_ms, 99):.1f} ms")
+    print("-" * 70)
+    return offline_per_sec, service_per_sec
+
+
+def bench_resize(rag, folder_path, batch_size, num_workers, num_queries, top_k):
+    """
+    정사각 리사이즈 vs 비율 유지(aspect) 리사이즈: 임베딩 처리량, 이미지당 토큰 수, kNN 판정 정확도
+    폴더의 이미지를 두 방식으로 각각 임베딩한 뒤, num_queries장을 질의로 나머지를 참조로 써서 결함 종류(폴더)를 맞히는지 측정
+    """
+    paths = list_image_files(folder_path)
+    labels = np.unique([defect_type_of(path) for path in paths], return_inverse=True)[1]
+    order = np.random.default_rng(0).permutation(len(paths))
+    query_rows, reference_rows = order[:num_queries], order[num_queries:]
+    original_mode = rag.resize_mode
+
+    results = []
+    try:
+        for mode in ["square", "aspect"]:
+            rag.resize_mode = mode
+            tokens = []
+            for path in paths:
+                width, height = rag.image_size, rag.image_size
+                if mode == "aspect":
+                    with Image.open(path) as img:
+                        width, height = aspect_size(*img.size, rag.image_size)
+                tokens.append((width // 14) * (height // 14))
+            rag.embed_batch(rag.transform(Image.open(paths[0]).convert('RGB')).unsqueeze(0))  # 워밍업 (모델 로드)
+
+            start = time.perf_counter()
+            vectors = np.stack([vector for _, batch in rag.iter_embeddings(paths, batch_size, num_workers)
+                                for vector in batch])
+            elapsed = time.perf_counter() - start
+            verdicts = knn_verdicts(vectors[query_rows], vectors[reference_rows], labels[reference_rows], top_k)
+            results.append((mode, len(paths) / elapsed, np.mean(tokens), np.mean(verdicts == labels[query_rows])))
+    finally:
+        rag.resize_mode = original_mode
+
+    print(f"\n📊 [리사이즈 방식 비교] 이미지 {len(paths)}장, 질의 {len(query_rows)}장, top_k={top_k}, batch={batch_size}")
+    print("-" * 70)
+    print(f"   {'방식':<10} {'처리량(img/s)':>14} {'이미지당 토큰':>14} {'kNN 판정 정확도':>16}")
+    for mode, per_sec, mean_tokens, accuracy in results:
+        print(f"   {mode:<10} {per_sec:>14.2f} {mean_tokens:>14.1f} {accuracy:>16.4f}")
+    print("-" * 70)
+    return results
+
+
+def bench_runtime(rag, runtimes, grids, batch_size, repeat):
+    """
+    백본 실행 방식(eager / trace / compile / onnx / int8)별 CPU 임베딩 처리량, 그래프 준비 시간, eager 대비 최소 코사인 유사도
+    grids: 입력 해상도 [(H, W), ...] (square 모드는 518x518, aspect 모드에서 자주 나오는 격자를 추가해 비교)
+    입력은 임의 텐서 (이미지 디코딩 없이 모델 실행 시간만 측정)
+    그래프 생성에 실패하거나 eager와 출력이 달라 eager로 대체된 방식은 이유를 출력하고 결과에서 제외
+    """
+    eager = rag.model.model if isinstance(rag.model, BackboneRuntime) else rag.model
+    tag = model_weights_tag(rag.model_name, rag.weights_path)
+    generator = torch.Generator().manual_seed(0)
+    results = []
+    for height, width in grids:
+        x = torch.randn(batch_size, 3, height, width, generator=generator)
+        with torch.no_grad():
+            expected = eager(x)
+        for name in runtimes:
+            try:
+                runner = make_runtime(name, eager, **({"cache_dir": os.path.join(WEIGHTS_DIR, "onnx"), "tag": tag}
+                                                      if name == "onnx" else {}))
+            except ImportError as e:
+                print(f"⚠️ {name} 건너뜀: {e}")
+                continue
+            start = time.perf_counter()
+            with torch.no_grad():
+                actual = runner(x)  # 첫 호출: 그래프 생성(내보내기/컴파일) + 실행
+            prepare = time.perf_counter() - start
+            cosine = torch.nn.functional.cosine_similarity(actual.float(), expected.float(), dim=1).min().item()
+            if isinstance(runner, BackboneRuntime) and (height, width) in runner.fallbacks:
+                # eager로 대체됐으면 eager 처리량을 이 방식의 결과로 보고하지 않음
+                print(f"⚠️ {name} 측정 제외 ({height}x{width}): {runner.fallbacks[(height, width)]}")
+                continue
+
+            start = time.perf_counter()
+            with torch.no_grad():
+                for _ in range(repeat):
+                    runner(x)
+            per_sec = batch_size * repeat / (time.perf_counter() - start)
+            results.append(((height, width), name, prepare, per_sec, cosine))
+
+    print(f"\n📊 [백본 실행 방식 비교] {rag.model_name}, batch={batch_size}, repeat={repeat}, "
+          f"CPU 스레드 {torch.get_num_threads()}개")
+    print("-" * 80)
+    print(f"   {'해상도':<10} {'방식':<18} {'준비(초)':>9} {'처리량(img/s)':>14} {'eager 대비':>10} {'최소 코사인':>11}")
+    baselines = {grid: per_sec for grid, name, _, per_sec, _ in results if name == "eager"}
+    for grid, name, prepare, per_sec, cosine in results:
+        speedup = f"{per_sec / baselines[grid]:.2f}x" if grid in baselines else "-"
+        print(f"   {f'{grid[0]}x{grid[1]}':<10} {name:<18} {prepare:>9.1f} {per_sec:>14.2f} {speedup:>10} "
+              f"{cosine:>11.6f}")
+    print("-" * 80)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Defect RAG 벤치마크")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="ingest 처리 속도 비교")
+    ingest_parser.add_argument("folder", help="벤치마크용 이미지 폴더")
+    ingest_parser.add_argument("--batch-size", type=int, default=32)
+    ingest_parser.add_argument("--num-workers", type=int, default=4)
+    ingest_parser.add_argument("--write-workers", type=int, default=1)
+
+    search_parser = subparsers.add_parser("search", help="멀티스레드 검색 처리량 측정")
+    search_parser.add_argument("queries", nargs="+", help="질의 이미지 경로")
+    search_parser.add_argument("--top-k", type=int, default=5)
+    search_parser.add_argument("--threads", type=int, default=8)
+    search_parser.add_argument("--repeat", type=int, default=100)
+    search_parser.add_argument("--pool-size", type=int, default=8)
+
+    recall_parser = subparsers.add_parser("recall", help="ANN 인덱스 recall vs 지연시간 (정확 검색 대비)")
+    recall_parser.add_argument("--queries", type=int, default=100)
+    recall_parser.add_argument("--top-k", type=int, default=10)
+    recall_parser.add_argument("--ef-search", type=int, nargs="*", default=[10, 20, 40, 80, 160])
+    recall_parser.add_argument("--probes", type=int, nargs="*", default=[])
+
+    storage_parser = subparsers.add_parser("storage", help="float32 / halfvec / bit 저장 방식별 크기, 지연시간, 일치율")
+    storage_parser.add_argument("--queries", type=int, default=100)
+    storage_parser.add_argument("--top-k", type=int, default=10)
+    storage_parser.add_argument("--storages", nargs="*", default=["float32", "halfvec", "bit"],
+                                choices=["float32", "halfvec", "bit"])
+    storage_parser.add_argument("--method", default="hnsw", choices=["hnsw", "ivfflat"])
+    storage_parser.add_argument("--rerank-factor", type=int, default=4)
+
+    prototype_parser = subparsers.add_parser("prototypes", help="프로토타입 2단계 판정 일치율 vs 지연시간 (전체 판정 대비)")
+    prototype_parser.add_argument("--queries", type=int, default=100)
+    prototype_parser.add_argument("--top-k", type=int, default=50)
+    prototype_parser.add_argument("--classes", type=int, nargs="+", default=[1, 2, 3])
+    prototype_parser.add_argument("--cells", type=int, nargs="+", default=[2, 4, 8])
+
+    scale_parser = subparsers.add_parser("prototype-scale",
+                                         help="합성 DB를 키워가며 프로토타입 판정 vs 전체 판정 지연시간 (임시 스키마 사용)")
+    scale_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 40000, 160000])
+    scale_parser.add_argument("--num-classes", type=int, default=10)
+    scale_parser.add_argument("--cluster-size", type=int, default=1000)
+    scale_parser.add_argument("--classes", type=int, default=2)
+    scale_parser.add_argument("--cells", type=int, default=None, help="결함 종류마다 훑을 클러스터 수 (기본: PROTOTYPE_CELLS)")
+    scale_parser.add_argument("--queries", type=int, default=50)
+    scale_parser.add_argument("--top-k", type=int, default=50)
+    scale_parser.add_argument("--dim", type=int, default=1024)
+
+    service_parser = subparsers.add_parser("service", help="추론 서비스 동시 요청 처리량 vs 오프라인 배치 처리량")
+    service_parser.add_argument("queries", nargs="+", help="질의 이미지 경로")
+    service_parser.add_argument("--url", default="http://127.0.0.1:8080")
+    service_parser.add_argument("--concurrency", type=int, default=32)
+    service_parser.add_argument("--repeat", type=int, default=5)
+    service_parser.add_argument("--batch-size", type=int, default=32)
+
+    resize_parser = subparsers.add_parser("resize", help="정사각 vs 비율 유지 리사이즈의 처리량과 판정 정확도")
+    resize_parser.add_argument("folder", help="결함 종류별 하위 폴더가 있는 이미지 폴더")
+    resize_parser.add_argument("--batch-size", type=int, default=32)
+    resize_parser.add_argument("--num-workers", type=int, default=4)
+    resize_parser.add_argument("--queries", type=int, default=200)
+    resize_parser.add_argument("--top-k", type=int, default=10)
+
+    runtime_parser = subparsers.add_parser("runtime", help="백본 실행 방식별 CPU 임베딩 처리량 (eager/trace/compile/onnx/int8)")
+    runtime_parser.add_argument("--runtimes", nargs="+", choices=RUNTIMES, default=list(RUNTIMES))
+    runtime_parser.add_argument("--grids", nargs="+", default=["518x518"], help="입력 해상도 HxW (14의 배수)")
+    runtime_parser.add_argument("--batch-size", type=int, default=8)
+    runtime_parser.add_argument("--repeat", type=int, default=5)
+    runtime_parser.add_argument("--threads", type=int, default=None, help="torch/onnxruntime CPU 스레드 수")
+
+    patchcore_parser = subparsers.add_parser("patchcore", help="PatchCore 메모리 뱅크 크기, coreset 생성 시간, 채점 지연시간")
+    patchcore_parser.add_argument("normal_folder", help="정상(결함 없는) 이미지 폴더")
+    patchcore_parser.add_argument("queries", nargs="+", help="채점할 질의 이미지 경로")
+    patchcore_parser.add_argument("--image-size", type=int, default=224)
+    patchcore_parser.add_argument("--coreset-ratios", type=float, nargs="+", default=[0.01, 0.1, 0.25])
+    patchcore_parser.add_argument("--batch-size", type=int, default=8)
+    patchcore_parser.add_argument("--num-workers", type=int, default=4)
+    patchcore_parser.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+
+    rag = DefectRAG_Postgres(DB_CONFIG, pool_size=getattr(args, "pool_size", 4))
+    if args.command == "ingest":
+        bench_ingest(rag, args.folder, args.batch_size, args.num_workers, args.write_workers)
+    elif args.command == "search":
+        bench_search(rag, args.queries, args.top_k, args.threads, args.repeat)
+    elif args.command == "recall":
+        bench_recall(rag, args.queries, args.top_k, args.ef_search, args.probes)
+    elif args.command == "storage":
+        bench_storage(rag, args.queries, args.top_k, args.storages, args.method, args.rerank_factor)
+    elif args.command == "prototypes":
+        bench_prototypes(rag, args.queries, args.top_k, args.classes, args.cells)
+    elif args.command == "prototype-scale":
+        bench_prototype_scale(rag.db_info, args.sizes, args.num_classes, args.cluster_size, args.classes, args.cells,
+                              args.queries, args.top_k, args.dim)
+    elif args.command == "service":
+        bench_service(rag, args.url, args.queries, args.concurrency, args.repeat, args.batch_size)
+    elif args.command == "resize":
+        bench_resize(rag, args.folder, args.batch_size, args.num_workers, args.queries, args.top_k)
+    elif args.command == "runtime":
+        if args.threads:
+            torch.set_num_threads(args.threads)
+        bench_runtime(rag, args.runtimes, [tuple(int(size) for size in grid.split("x")) for grid in args.grids],
+                      args.batch_size, args.repeat)
+    elif args.command == "patchcore":
+        bench_patchcore(rag, args.normal_folder, args.queries, args.image_size, args.coreset_ratios,
+                        args.batch_size, args.num_workers, args.repeat)
@@ -1,4 +1,7 @@
+import os
+
 from rag_core import DefectRAG_Postgres
+from embedding_cache import EmbeddingCache
 
 # ★ Docker 또는 로컬 DB 정보에 맞게 수정하세요 ★
 DB_CONFIG = {
@@ -9,9 +12,12 @@ DB_CONFIG = {
     "password": "3510" # 설치할 때 설정한 비번
 }
 
+# 임베딩 캐시 파일 (search.py와 같은 파일을 사용)
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3")
+
 if __name__ == "__main__":
     # 1. PostgreSQL 연결
-    rag = DefectRAG_Postgres(DB_CONFIG)
+    rag = DefectRAG_Postgres(DB_CONFIG, embedding_cache=EmbeddingCache(CACHE_PATH))
 
     # 2. 데이터 폴더 경로
     train_root = r"C:\Users\hjchung\Desktop\RAG Train"
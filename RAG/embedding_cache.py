@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    디스크 임베딩 캐시 (SQLite 파일 1개)
+    키: (이미지 파일 내용 해시, model_version)  -> model_version에 모델 이름과 전처리 설정이 들어 있음
+    전체 크기가 max_bytes를 넘으면 가장 오래 안 쓴(LRU) 항목부터 삭제
+
+    ingest와 search가 같은 캐시를 쓰므로, 이미 본 이미지는 다시 질의하거나 재적재해도 모델을 돌리지 않음
+    """
+
+    def __init__(self, path, max_bytes=2 * 1024 ** 3):
+        """
+        path: 캐시 파일 경로 (예: "embedding_cache.sqlite3")
+        max_bytes: 캐시에 보관할 임베딩 총 바이트 수 상한
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                content_hash TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                dtype TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (content_hash, model_version)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access_idx ON embeddings (last_access)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get(self, content_hash, model_version):
+        return self.get_many([content_hash], model_version).get(content_hash)
+
+    def get_many(self, content_hashes, model_version):
+        """
+        -> {content_hash: 임베딩(numpy)}  (캐시에 있는 것만)
+        """
+        found = {}
+        content_hashes = list(dict.fromkeys(content_hashes))
+        with self._lock:
+            # SQLite 바인딩 변수 개수 제한(기본 999) 때문에 나눠서 조회
+            for start in range(0, len(content_hashes), 500):
+                batch = content_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector, dtype FROM embeddings "
+                    f"WHERE model_version = ? AND content_hash IN ({placeholders})",
+                    [model_version, *batch],
+                ).fetchall()
+                for content_hash, vector, dtype in rows:
+                    found[content_hash] = np.frombuffer(vector, dtype=dtype).copy()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE content_hash = ? AND model_version = ?",
+                    [(now, content_hash, model_version) for content_hash in found],
+                )
+            self.hits += len(found)
+            self.misses += len(content_hashes) - len(found)
+        return found
+
+    def put(self, content_hash, model_version, vector):
+        self.put_many([(content_hash, vector)], model_version)
+
+    def put_many(self, items, model_version):
+        """
+        items: [(content_hash, 임베딩), ...]
+        """
+        now = time.time()
+        rows = []
+        for content_hash, vector in items:
+            vector = np.ascontiguousarray(vector)
+            rows.append((content_hash, model_version, vector.tobytes(), vector.dtype.str, vector.nbytes, now))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row in rows:
+                    old = self._conn.execute(
+                        "SELECT size FROM embeddings WHERE content_hash = ? AND model_version = ?", row[:2]
+                    ).fetchone()
+                    self._conn.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)", row)
+                    self._total_bytes += row[4] - (old[0] if old else 0)
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+                raise
+
+    def _evict(self):
+        # 오래 안 쓴 순서로 지우되, 상한의 90%까지 내려서 매번 조금씩 지우는 일을 피함
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT rowid, size FROM embeddings ORDER BY last_access LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            victims = []
+            for rowid, size in rows:
+                if self._total_bytes <= target:
+                    break
+                victims.append((rowid,))
+                self._total_bytes -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", victims)
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
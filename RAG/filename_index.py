@@ -0,0 +1,100 @@
+import os
+
+
+class FilenameIndex:
+    """
+    폴더 안의 파일 이름 색인 (챗봇 질문에서 파일 이름 찾기용)
+        - 파일 이름 전체 / 확장자 뗀 이름(stem): 해시 맵으로 바로 조회
+        - 부분 문자열: stem의 n-gram -> 파일 이름 집합 (후보를 n-gram 교집합으로 좁힌 뒤 실제 포함 여부 확인)
+    폴더 수정 시각이 바뀌었을 때만 목록을 다시 읽고, 추가/삭제된 파일만 색인에 반영
+    """
+
+    def __init__(self, folder_path, ngram=3, min_substring=5):
+        """
+        folder_path: 색인할 폴더 (하위 폴더는 포함하지 않음, os.listdir와 동일)
+        ngram: 부분 문자열 색인 단위 길이
+        min_substring: 부분 문자열로 찾을 최소 단어 길이 (짧은 단어는 오탐지가 많아 제외)
+        """
+        if min_substring < ngram:
+            raise ValueError(f"min_substring({min_substring})은 ngram({ngram}) 이상이어야 합니다.")
+        self.folder_path = folder_path
+        self.ngram = ngram
+        self.min_substring = min_substring
+
+        self._names = set()
+        self._by_stem = {}  # stem -> {파일 이름}
+        self._by_gram = {}  # n-gram -> {파일 이름}
+        self._mtime_ns = None
+        self.refresh()
+
+    def __len__(self):
+        return len(self._names)
+
+    def _grams(self, text):
+        return {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+
+    def _add(self, name):
+        stem = os.path.splitext(name)[0]
+        self._names.add(name)
+        self._by_stem.setdefault(stem, set()).add(name)
+        for gram in self._grams(stem):
+            self._by_gram.setdefault(gram, set()).add(name)
+
+    def _remove(self, name):
+        stem = os.path.splitext(name)[0]
+        self._names.discard(name)
+        for index, key in [(self._by_stem, stem)] + [(self._by_gram, gram) for gram in self._grams(stem)]:
+            names = index.get(key)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del index[key]
+
+    def refresh(self, force=False):
+        """
+        폴더가 바뀌었으면(수정 시각 변경) 추가/삭제된 파일만 반영. 반영했으면 True
+        """
+        # 목록을 읽기 전에 시각을 먼저 기록: 읽는 도중 바뀐 내용은 다음 refresh에서 다시 반영됨
+        mtime_ns = os.stat(self.folder_path).st_mtime_ns
+        if not force and mtime_ns == self._mtime_ns:
+            return False
+
+        current = set(os.listdir(self.folder_path))
+        for name in self._names - current:
+            self._remove(name)
+        for name in current - self._names:
+            self._add(name)
+        self._mtime_ns = mtime_ns
+        return True
+
+    def _substring_match(self, word):
+        postings = sorted((self._by_gram.get(gram, set()) for gram in self._grams(word)), key=len)
+        if not postings or not postings[0]:
+            return None
+        candidates = postings[0].intersection(*postings[1:])
+        matches = [name for name in candidates if word in os.path.splitext(name)[0]]
+        # 여러 개면 가장 짧은 이름 (단어와 가장 가까운 파일)
+        return min(matches, key=lambda name: (len(name), name)) if matches else None
+
+    def resolve(self, words):
+        """
+        words: 사용자 입력 단어 목록 -> 가리키는 파일 이름 (없으면 None)
+        우선순위: (1) 파일 이름 전체 일치 (2) 확장자 뗀 이름 일치 (3) 확장자 뗀 이름에 단어가 포함
+        """
+        self.refresh()
+
+        for word in words:
+            if word in self._names:
+                return word
+
+        for word in words:
+            names = self._by_stem.get(word)
+            if names:
+                return min(names)
+
+        for word in words:
+            if len(word) >= self.min_substring:
+                match = self._substring_match(word)
+                if match:
+                    return match
+        return None
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """
+    폴더 ingest용 파일 상태 캐시: 상대 경로 -> [크기, 수정 시각(ns), sha256]
+    크기와 수정 시각이 그대로인 파일은 다시 해시하지 않으므로, 변경 없는 폴더의 재실행이 수 초 안에 끝남
+    (어떤 이미지가 저장소에 이미 있는지는 저장소의 content_hash로 판단하고, 이 파일은 해시 캐시 역할만 함)
+    """
+
+    FILE_NAME = ".rag_manifest.json"
+
+    def __init__(self, path=None):
+        """
+        path: 매니페스트 파일 경로. None이면 메모리에서만 사용 (저장하지 않음)
+        """
+        self.path = path
+        self.files = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    def hash_files(self, root, files, num_workers=8):
+        """
+        files의 sha256 -> {파일 경로: 해시}. 캐시에 없거나 바뀐 파일만 num_workers 스레드로 해시
+        """
+        hashes, to_hash = {}, []
+        seen = set()
+        for path in files:
+            key = os.path.relpath(path, root)
+            seen.add(key)
+            stat = os.stat(path)
+            cached = self.files.get(key)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                hashes[path] = cached[2]
+            else:
+                to_hash.append((path, key, stat))
+
+        if to_hash:
+            print(f"🔑 {len(to_hash)}개 파일 해시 계산 중... (캐시 재사용 {len(hashes)}개)")
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                digests = executor.map(file_sha256, [path for path, _, _ in to_hash])
+                for (path, key, stat), digest in zip(to_hash, digests):
+                    hashes[path] = digest
+                    self.files[key] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        # 폴더에서 사라진 파일은 캐시에서도 제거
+        for key in set(self.files) - seen:
+            del self.files[key]
+        return hashes
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
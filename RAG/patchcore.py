@@ -0,0 +1,201 @@
+import math
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torchvision.transforms as T
+from torch.utils.data import DataLoader
+
+from rag_core import IMAGENET_MEAN, IMAGENET_STD, DefectImageDataset, list_image_files
+
+
+class PatchCore:
+    """
+    PatchCore 방식 패치 단위 이상 탐지 (결함 위치 히트맵)
+        1. 정상 이미지의 DINOv2 패치 토큰(forward_features의 x_norm_patchtokens)을 모아 메모리 뱅크 생성
+        2. greedy coreset(k-center)으로 뱅크를 coreset_ratio 비율로 축소
+        3. 질의 이미지의 패치마다 뱅크 최근접 거리 = 이상 점수 -> (h, w) 히트맵, 이미지 점수 = 최대 패치 점수
+    모델은 DefectRAG의 것을 그대로 사용 (첫 사용 때 로드)
+    """
+
+    def __init__(self, rag, image_size=224, coreset_ratio=0.1, projection_dim=128, patch_pool=3,
+                 block_size=16384, blur_sigma=4.0):
+        """
+        rag: DefectRAG (모델/디바이스 공유)
+        image_size: 입력 크기 (14의 배수. 224면 16x16 패치, 518이면 37x37 패치)
+        coreset_ratio: 메모리 뱅크에 남길 패치 비율
+        projection_dim: coreset 선택 시 거리 계산용 랜덤 사영 차원 (선택 속도용, 뱅크에는 원래 차원을 저장)
+        patch_pool: 이웃 패치 평균 크기 (3이면 3x3, 1이면 사용 안 함)
+        block_size: 최근접 거리 계산 시 한 번에 비교할 뱅크 행 수 (메모리 사용량 조절)
+        blur_sigma: 히트맵 가우시안 블러 sigma (픽셀, 0이면 사용 안 함)
+        """
+        if image_size % 14 != 0:
+            raise ValueError(f"image_size({image_size})는 패치 크기 14의 배수여야 합니다.")
+        self.rag = rag
+        self.image_size = image_size
+        self.coreset_ratio = coreset_ratio
+        self.projection_dim = projection_dim
+        self.patch_pool = patch_pool
+        self.block_size = block_size
+        self.blur_sigma = blur_sigma
+        self.transform = T.Compose([
+            T.Resize((image_size, image_size)),
+            T.ToTensor(),
+            T.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD),
+        ])
+        self.memory_bank = None  # (M, D) torch 텐서 (rag.device)
+
+    def _loader(self, image_paths, batch_size, num_workers):
+        return DataLoader(
+            DefectImageDataset(image_paths, self.transform),
+            batch_size=batch_size,
+            num_workers=num_workers,
+            pin_memory=self.rag.device.type == "cuda",
+            prefetch_factor=2 if num_workers > 0 else None,
+        )
+
+    def features(self, img_batch):
+        """
+        (B, 3, S, S) -> (B, h, w, D) 패치 특징 (patch_pool x patch_pool 이웃 평균 적용)
+        """
+        tokens = self.rag.embed_patch_batch(img_batch)  # (B, h, w, D)
+        if self.patch_pool > 1:
+            grid = tokens.permute(0, 3, 1, 2)
+            grid = F.avg_pool2d(grid, self.patch_pool, stride=1, padding=self.patch_pool // 2,
+                                count_include_pad=False)
+            tokens = grid.permute(0, 2, 3, 1)
+        return tokens.float()
+
+    def fit(self, image_paths, batch_size=8, num_workers=4, seed=0):
+        """
+        image_paths: 정상(결함 없는) 이미지 경로 목록 또는 폴더
+        반환값: {'images', 'patches', 'bank_patches', 'raw_mb', 'bank_mb', 'extract_seconds', 'coreset_seconds'}
+        """
+        if isinstance(image_paths, str):
+            image_paths = list_image_files(image_paths)
+        print(f"📂 정상 이미지 {len(image_paths)}개에서 패치 메모리 뱅크를 만듭니다...")
+
+        start = time.perf_counter()
+        chunks = []
+        for img_batch, _ in self._loader(image_paths, batch_size, num_workers):
+            features = self.features(img_batch)
+            chunks.append(features.reshape(-1, features.shape[-1]))
+        patches = torch.cat(chunks)
+        extract_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        n_select = max(1, int(math.ceil(len(patches) * self.coreset_ratio)))
+        indices = greedy_coreset(patches, n_select, self.projection_dim, seed)
+        self.memory_bank = patches[indices].contiguous()
+        coreset_seconds = time.perf_counter() - start
+
+        stats = {
+            'images': len(image_paths),
+            'patches': len(patches),
+            'bank_patches': len(self.memory_bank),
+            'raw_mb': patches.numel() * 4 / 1024 ** 2,
+            'bank_mb': self.memory_bank.numel() * 4 / 1024 ** 2,
+            'extract_seconds': extract_seconds,
+            'coreset_seconds': coreset_seconds,
+        }
+        print(f"✅ 메모리 뱅크 완료: 패치 {stats['patches']}개 ({stats['raw_mb']:.1f}MB) -> "
+              f"{stats['bank_patches']}개 ({stats['bank_mb']:.1f}MB), coreset {coreset_seconds:.1f}초")
+        return stats
+
+    def nearest_distance(self, patches):
+        """
+        (N, D) 패치 -> 메모리 뱅크 최근접 L2 거리 (N,)
+        ||q - b||^2 = ||q||^2 + ||b||^2 - 2 q·b 를 뱅크 block_size 행씩 matmul로 계산하며 최솟값만 유지
+        """
+        if self.memory_bank is None:
+            raise RuntimeError("메모리 뱅크가 없습니다. fit() 또는 load()를 먼저 실행하세요.")
+        query_sq = (patches * patches).sum(dim=1, keepdim=True)
+        best = torch.full((len(patches),), float("inf"), device=patches.device)
+        for start in range(0, len(self.memory_bank), self.block_size):
+            block = self.memory_bank[start:start + self.block_size]
+            dist_sq = query_sq + (block * block).sum(dim=1) - 2 * patches @ block.T
+            best = torch.minimum(best, dist_sq.min(dim=1).values)
+        return best.clamp_min(0).sqrt()
+
+    def score_batch(self, img_batch):
+        """
+        (B, 3, S, S) -> (이미지 점수 (B,), 히트맵 (B, S, S)) numpy
+        """
+        features = self.features(img_batch)
+        batch, h, w, dim = features.shape
+        patch_scores = self.nearest_distance(features.reshape(-1, dim)).reshape(batch, 1, h, w)
+        heatmaps = F.interpolate(patch_scores, size=(self.image_size, self.image_size), mode="bilinear",
+                                 align_corners=False)
+        if self.blur_sigma > 0:
+            heatmaps = gaussian_blur(heatmaps, self.blur_sigma)
+        image_scores = patch_scores.flatten(1).max(dim=1).values
+        return image_scores.cpu().numpy(), heatmaps[:, 0].cpu().numpy()
+
+    def score(self, image_paths, batch_size=8, num_workers=0):
+        """
+        image_paths: 질의 이미지 경로 목록 -> [(경로, 이미지 점수, (S, S) 히트맵), ...]
+        히트맵은 image_size 해상도 (원본 크기로 보려면 리사이즈해서 겹쳐 그리면 됨)
+        """
+        results = []
+        for img_batch, indices in self._loader(image_paths, batch_size, num_workers):
+            scores, heatmaps = self.score_batch(img_batch)
+            for index, score, heatmap in zip(indices.tolist(), scores.tolist(), heatmaps):
+                results.append((image_paths[index], score, heatmap))
+        return results
+
+    def save(self, path):
+        np.savez(
+            path,
+            memory_bank=self.memory_bank.cpu().numpy(),
+            image_size=self.image_size,
+            patch_pool=self.patch_pool,
+            model_version=self.rag.model_version,
+        )
+
+    def load(self, path):
+        data = np.load(path)
+        if str(data["model_version"]) != self.rag.model_version:
+            raise ValueError(f"다른 모델로 만든 메모리 뱅크입니다: {data['model_version']} (현재 {self.rag.model_version})")
+        self.image_size = int(data["image_size"])
+        self.patch_pool = int(data["patch_pool"])
+        self.transform.transforms[0] = T.Resize((self.image_size, self.image_size))
+        self.memory_bank = torch.from_numpy(data["memory_bank"]).to(self.rag.device)
+        return self
+
+
+def greedy_coreset(features, n_select, projection_dim=128, seed=0):
+    """
+    greedy k-center coreset: 이미 고른 점들과의 최소 거리가 가장 먼 점을 하나씩 추가 -> 선택한 행 번호 (n_select,)
+    거리는 랜덤 사영(projection_dim)한 특징으로 계산 (Johnson-Lindenstrauss, 선택 결과만 쓰므로 근사로 충분)
+    """
+    if n_select >= len(features):
+        return torch.arange(len(features), device=features.device)
+
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+    if projection_dim and projection_dim < features.shape[1]:
+        projection = torch.randn(features.shape[1], projection_dim, generator=generator) / math.sqrt(projection_dim)
+        reduced = features @ projection.to(features.device)
+    else:
+        reduced = features
+
+    selected = torch.empty(n_select, dtype=torch.long, device=features.device)
+    selected[0] = int(torch.randint(len(features), (1,), generator=generator))
+    min_dist = ((reduced - reduced[selected[0]]) ** 2).sum(dim=1)
+    for i in range(1, n_select):
+        selected[i] = torch.argmax(min_dist)
+        min_dist = torch.minimum(min_dist, ((reduced - reduced[selected[i]]) ** 2).sum(dim=1))
+    return selected
+
+
+def gaussian_blur(heatmaps, sigma):
+    """
+    (B, 1, H, W) 히트맵에 분리형 가우시안 블러
+    """
+    radius = int(math.ceil(3 * sigma))
+    kernel = torch.exp(-(torch.arange(-radius, radius + 1, device=heatmaps.device, dtype=heatmaps.dtype) ** 2)
+                       / (2 * sigma ** 2))
+    kernel = kernel / kernel.sum()
+    heatmaps = F.pad(heatmaps, (radius, radius, radius, radius), mode="reflect")
+    heatmaps = F.conv2d(heatmaps, kernel.view(1, 1, 1, -1))
+    return F.conv2d(heatmaps, kernel.view(1, 1, -1, 1))
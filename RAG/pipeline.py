@@ -0,0 +1,223 @@
+import queue
+import threading
+import time
+
+_END = object()  # 입력이 끝났다는 표시 (단계 사이 큐로 전달)
+_POLL_SECONDS = 0.1  # 큐에서 막혀 있을 때 중단 신호를 확인하는 간격
+
+
+class PipelineStopped(Exception):
+    """
+    다른 단계의 에러/중단으로 파이프라인이 멈췄을 때 작업자 내부에서만 쓰는 신호
+    """
+
+
+class Stage:
+    """
+    파이프라인의 한 단계: workers개 스레드가 입력 큐에서 항목을 꺼내 fn을 실행하고 결과를 다음 큐에 넣음
+        stream=False: fn(항목) -> 결과 1개 (None이면 다음 단계로 보내지 않음)
+        stream=True : fn(입력 이터레이터) -> 결과 이터러블 또는 None (작업자마다 1번 호출, 예: DB COPY 스트리밍)
+    queue_size: 이 단계 입력 큐의 최대 길이. 큐가 차면 앞 단계가 기다림 (backpressure)
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=4, stream=False):
+        if workers < 1:
+            raise ValueError(f"{name}: workers는 1 이상이어야 합니다.")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+        self.stream = stream
+
+        self._lock = threading.Lock()
+        self.items_in = 0
+        self.items_out = 0
+        self.wait_in = 0.0   # 입력을 기다린 시간 (앞 단계가 느림)
+        self.wait_out = 0.0  # 다음 큐가 차서 기다린 시간 (뒤 단계가 느림)
+        self.wall = 0.0      # 작업자 스레드 실행 시간 합
+
+    def _add(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def stats(self, elapsed):
+        busy = max(self.wall - self.wait_in - self.wait_out, 0.0)
+        capacity = elapsed * self.workers
+        return {
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "busy_seconds": busy,
+            "starved_seconds": self.wait_in,
+            "blocked_seconds": self.wait_out,
+            "utilization": busy / capacity if capacity > 0 else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    source -> Stage 1 -> Stage 2 -> ... 를 단계마다 별도 스레드로 동시에 실행 (producer/consumer)
+    - 단계 사이는 bounded queue: 느린 단계가 있으면 앞 단계가 멈춰서 메모리가 무한히 늘지 않음
+    - 어느 단계든 에러가 나면 모든 단계를 멈추고, run()이 그 에러를 그대로 다시 던짐
+    - Ctrl+C 등으로 run()이 중단돼도 모든 스레드를 멈추고 join한 뒤 종료
+    - stats(): 단계별 utilization(실제 작업 시간 / (경과 시간 * workers)) -> 가장 높은 단계가 병목
+    """
+
+    def __init__(self, source, stages, name="pipeline"):
+        """
+        source: 첫 단계에 넣을 항목 이터러블 (별도 스레드에서 순회)
+        stages: Stage 목록 (마지막 단계의 결과는 버림)
+        """
+        self.source = source
+        self.stages = stages
+        self.name = name
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self.source_wait = 0.0
+        self.source_items = 0
+        self.elapsed = 0.0
+
+        self._stop = threading.Event()
+        self._errors = []
+        self._remaining = [stage.workers for stage in stages]
+        self._remaining_lock = threading.Lock()
+
+    # =================================================================
+    # 큐 입출력: 중단 신호를 주기적으로 확인하며 대기
+    # =================================================================
+    def _get(self, index):
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                return self.queues[index].get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                pass
+
+    def _put(self, index, item):
+        if index == len(self.queues):
+            return  # 마지막 단계의 결과
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                self.queues[index].put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    def _fail(self, error):
+        if not isinstance(error, PipelineStopped):
+            self._errors.append(error)
+        self._stop.set()
+
+    # =================================================================
+    # 스레드 본체
+    # =================================================================
+    def _run_source(self):
+        try:
+            for item in self.source:
+                start = time.perf_counter()
+                self._put(0, item)
+                self.source_wait += time.perf_counter() - start
+                self.source_items += 1
+            self._put(0, _END)
+        except BaseException as e:
+            self._fail(e)
+
+    def _inputs(self, index, stage):
+        # 입력 큐 -> 이터레이터. _END를 받으면 같은 단계의 다른 작업자도 끝나도록 다시 넣고 종료
+        while True:
+            start = time.perf_counter()
+            item = self._get(index)
+            stage._add(wait_in=time.perf_counter() - start)
+            if item is _END:
+                self.queues[index].put(_END)
+                return
+            stage._add(items_in=1)
+            yield item
+
+    def _emit(self, index, stage, result):
+        start = time.perf_counter()
+        self._put(index + 1, result)
+        stage._add(wait_out=time.perf_counter() - start, items_out=1)
+
+    def _run_worker(self, index, stage):
+        start = time.perf_counter()
+        try:
+            if stage.stream:
+                for result in stage.fn(self._inputs(index, stage)) or ():
+                    self._emit(index, stage, result)
+            else:
+                for item in self._inputs(index, stage):
+                    result = stage.fn(item)
+                    if result is not None:
+                        self._emit(index, stage, result)
+            if self._stop.is_set():
+                return
+            # 이 단계의 마지막 작업자가 끝나면 다음 단계에 끝을 알림
+            with self._remaining_lock:
+                self._remaining[index] -= 1
+                last = self._remaining[index] == 0
+            if last:
+                self._put(index + 1, _END)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            stage._add(wall=time.perf_counter() - start)
+
+    def run(self):
+        """
+        모든 단계가 끝날 때까지 실행 -> stats(). 에러가 난 단계가 있으면 첫 번째 에러를 다시 던짐
+        """
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._run_source, name=f"{self.name}-source", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            threads.extend(
+                threading.Thread(target=self._run_worker, args=(index, stage), name=f"{self.name}-{stage.name}-{i}",
+                                 daemon=True)
+                for i in range(stage.workers)
+            )
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=_POLL_SECONDS)  # 메인 스레드가 Ctrl+C를 받을 수 있도록 나눠서 대기
+        except BaseException as e:
+            self._fail(e)
+            for thread in threads:
+                thread.join()
+            raise
+        finally:
+            self.elapsed = time.perf_counter() - start
+
+        if self._errors:
+            raise self._errors[0]
+        return self.stats()
+
+    def stats(self):
+        """
+        -> {단계 이름: {"workers", "items_in", "items_out", "busy_seconds", "starved_seconds", "blocked_seconds",
+                         "utilization"}}  (source는 blocked_seconds만 의미 있음)
+        """
+        stats = {"source": {"workers": 1, "items_in": 0, "items_out": self.source_items, "busy_seconds": 0.0,
+                            "starved_seconds": 0.0, "blocked_seconds": self.source_wait, "utilization": 0.0}}
+        for stage in self.stages:
+            stats[stage.name] = stage.stats(self.elapsed)
+        return stats
+
+    def print_stats(self):
+        stats = self.stats()
+        bottleneck = max(self.stages, key=lambda stage: stats[stage.name]["utilization"]).name
+        print(f"\n📊 [{self.name} 단계별 사용률] 경과 {self.elapsed:.1f}초")
+        print("-" * 80)
+        print(f"   {'단계':<10} {'작업자':>6} {'처리':>8} {'작업(초)':>10} {'입력 대기(초)':>13} {'출력 대기(초)':>13} {'사용률':>8}")
+        for name, stage in stats.items():
+            if name == "source":
+                continue
+            mark = "  ◀ 병목" if name == bottleneck else ""
+            print(f"   {name:<10} {stage['workers']:>6} {stage['items_in']:>8} {stage['busy_seconds']:>10.1f} "
+                  f"{stage['starved_seconds']:>13.1f} {stage['blocked_seconds']:>13.1f} "
+                  f"{stage['utilization']:>7.0%}{mark}")
+        print("-" * 80)
@@ -0,0 +1,193 @@
+import argparse
+import hashlib
+import time
+
+import numpy as np
+
+
+class EmbeddingProjection:
+    """
+    임베딩 차원 축소용 PCA(선택: whitening) 사영
+        y = (x - mean) @ components     components: (원래 차원, dim)
+    whitening이면 각 주성분을 표준편차로 나눠서 모든 축의 분산을 1로 맞춤
+    version: 사영 파라미터로 만든 태그 (예: "pca128w_1a2b3c4d"). 축소 테이블 이름에도 사용
+    """
+
+    def __init__(self, mean, components, whiten=False, explained_variance=None, num_samples=None):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.whiten = whiten
+        self.explained_variance = explained_variance
+        self.num_samples = num_samples
+
+        digest = hashlib.sha1(self.mean.tobytes() + self.components.tobytes()).hexdigest()[:8]
+        self.version = f"pca{self.dim}{'w' if whiten else ''}_{digest}"
+
+    @property
+    def dim(self):
+        return self.components.shape[1]
+
+    @property
+    def input_dim(self):
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, chunks, dim, whiten=False, eps=1e-6):
+        """
+        chunks: (N_i, 원래 차원) 임베딩 행렬 이터러블 (전체를 메모리에 올리지 않고 공분산을 누적)
+        dim: 남길 주성분 수
+        """
+        count, total, gram = 0, None, None
+        for chunk in chunks:
+            chunk = np.asarray(chunk, dtype=np.float64)
+            if total is None:
+                total = np.zeros(chunk.shape[1])
+                gram = np.zeros((chunk.shape[1], chunk.shape[1]))
+            count += len(chunk)
+            total += chunk.sum(axis=0)
+            gram += chunk.T @ chunk
+        if count < 2:
+            raise ValueError("PCA를 계산하려면 임베딩이 2개 이상 필요합니다.")
+        if dim > len(total):
+            raise ValueError(f"dim({dim})은 원래 차원({len(total)}) 이하여야 합니다.")
+
+        mean = total / count
+        covariance = (gram - count * np.outer(mean, mean)) / (count - 1)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:dim]
+        eigenvalues = np.maximum(eigenvalues[order], 0.0)
+        components = eigenvectors[:, order]
+        if whiten:
+            components = components / np.sqrt(eigenvalues + eps)
+
+        explained = float(eigenvalues.sum() / max(np.trace(covariance), 1e-12))
+        return cls(mean, components, whiten=whiten, explained_variance=explained, num_samples=count)
+
+    def apply(self, vectors):
+        """
+        (N, 원래 차원) 또는 (원래 차원,) -> (N, dim) 또는 (dim,) float32
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return (vectors - self.mean) @ self.components
+
+
+def knn_verdicts(queries, reference, labels, top_k, block_size=4096):
+    """
+    코사인 kNN 판정 (search()와 같은 규칙: 결함 종류별 유사도 합이 가장 큰 것)
+    queries: (M, d), reference: (N, d), labels: (N,) 정수 라벨 -> (M,) 판정 라벨
+    """
+    queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    num_classes = int(labels.max()) + 1
+    verdicts = np.empty(len(queries), dtype=np.int64)
+    for start in range(0, len(queries), block_size):
+        sims = queries[start:start + block_size] @ reference.T
+        top = np.argpartition(-sims, top_k - 1, axis=1)[:, :top_k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        scores = np.zeros((len(sims), num_classes))
+        np.add.at(scores, (np.arange(len(sims))[:, None], labels[top]), top_sims)
+        verdicts[start:start + block_size] = scores.argmax(axis=1)
+    return verdicts
+
+
+def accuracy_report(vectors, defect_types, dims, num_queries=500, top_k=10, whiten=False, seed=0):
+    """
+    차원별 kNN 판정 정확도 리포트 (원래 차원 포함)
+    저장된 임베딩을 질의(num_queries개)와 참조로 나눈 뒤, 참조로만 PCA를 학습해서 질의의 결함 종류를 맞히는지 측정
+    -> [(차원, 정확도, 원래 차원 판정과의 일치율, 벡터당 바이트, 스캔 시간 비율, 설명 분산 비율), ...]
+    """
+    class_names, labels = np.unique(np.asarray(defect_types), return_inverse=True)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    query_rows, reference_rows = order[:num_queries], order[num_queries:]
+    queries, reference = vectors[query_rows], vectors[reference_rows]
+    query_labels, reference_labels = labels[query_rows], labels[reference_rows]
+
+    def evaluate(query_matrix, reference_matrix):
+        start = time.perf_counter()
+        verdicts = knn_verdicts(query_matrix, reference_matrix, reference_labels, top_k)
+        return verdicts, time.perf_counter() - start
+
+    base_verdicts, base_seconds = evaluate(queries, reference)
+    rows = [(vectors.shape[1], float(np.mean(base_verdicts == query_labels)), 1.0, vectors.shape[1] * 4, 1.0, 1.0)]
+    for dim in sorted(dims):
+        projection = EmbeddingProjection.fit([reference], dim, whiten=whiten)
+        verdicts, seconds = evaluate(projection.apply(queries), projection.apply(reference))
+        rows.append((dim, float(np.mean(verdicts == query_labels)), float(np.mean(verdicts == base_verdicts)),
+                     dim * 4, seconds / base_seconds, projection.explained_variance))
+    return rows
+
+
+if __name__ == "__main__":
+    from vector_store import PostgresVectorStore
+
+    # ★ build_db.py와 동일한 DB 접속 정보 ★
+    DB_CONFIG = {
+        "host": "localhost",
+        "port": "5432",
+        "dbname": "postgres",
+        "user": "postgres",
+        "password": "3510"
+    }
+
+    parser = argparse.ArgumentParser(description="defect_images 임베딩 PCA/whitening 차원 축소")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fit_parser = subparsers.add_parser("fit", help="PCA를 학습해 버전 태그로 저장하고 축소 테이블을 채움")
+    fit_parser.add_argument("--dim", type=int, required=True)
+    fit_parser.add_argument("--whiten", action="store_true")
+    fit_parser.add_argument("--model-version", default=None, help="이 model_version의 임베딩으로만 학습")
+    fit_parser.add_argument("--index", choices=["hnsw", "ivfflat"], default=None, help="축소 테이블에 ANN 인덱스 생성")
+
+    report_parser = subparsers.add_parser("report", help="차원별 kNN 판정 정확도")
+    report_parser.add_argument("--dims", type=int, nargs="+", default=[64, 128, 256, 512])
+    report_parser.add_argument("--queries", type=int, default=500)
+    report_parser.add_argument("--top-k", type=int, default=10)
+    report_parser.add_argument("--whiten", action="store_true")
+    report_parser.add_argument("--model-version", default=None)
+
+    subparsers.add_parser("list", help="저장된 사영 목록")
+    drop_parser = subparsers.add_parser("drop", help="사영과 축소 테이블 삭제")
+    drop_parser.add_argument("version")
+
+    args = parser.parse_args()
+    store = PostgresVectorStore(DB_CONFIG, pool_size=1)
+    try:
+        if args.command == "fit":
+            projection = EmbeddingProjection.fit(
+                (matrix for _, _, matrix in store.iter_embeddings(model_version=args.model_version)),
+                args.dim, whiten=args.whiten,
+            )
+            print(f"✅ PCA 학습 완료: {projection.version} ({projection.num_samples}개, "
+                  f"설명 분산 {projection.explained_variance:.3f})")
+            store.register_projection(projection)
+            if args.index:
+                projected_store = PostgresVectorStore(DB_CONFIG, pool_size=1, projection=projection.version)
+                try:
+                    projected_store.create_index(args.index)
+                finally:
+                    projected_store.close()
+        elif args.command == "report":
+            ids, defect_types, chunks = [], [], []
+            for chunk_ids, chunk_types, matrix in store.iter_embeddings(model_version=args.model_version):
+                ids.extend(chunk_ids)
+                defect_types.extend(chunk_types)
+                chunks.append(matrix)
+            vectors = np.concatenate(chunks)
+            rows = accuracy_report(vectors, defect_types, args.dims, args.queries, args.top_k, args.whiten)
+
+            print(f"\n📊 [차원별 kNN 판정 정확도] 임베딩 {len(vectors)}개, 질의 {min(args.queries, len(vectors))}개, "
+                  f"top_k={args.top_k}, whiten={args.whiten}")
+            print("-" * 80)
+            print(f"   {'차원':>6} {'정확도':>8} {'원본 판정 일치':>12} {'벡터 크기':>10} {'스캔 시간':>10} {'설명 분산':>10}")
+            for dim, accuracy, agreement, size, scan, explained in rows:
+                print(f"   {dim:>6} {accuracy:>8.4f} {agreement:>12.4f} {size:>8} B {scan:>9.2f}x {explained:>10.3f}")
+            print("-" * 80)
+        elif args.command == "list":
+            for projection in store.projections.values():
+                print(f"   {projection.version}: dim={projection.dim}, whiten={projection.whiten}, "
+                      f"학습 {projection.num_samples}개, 설명 분산 {projection.explained_variance:.3f}")
+        elif args.command == "drop":
+            store.drop_projection(args.version)
+    finally:
+        store.close()
@@ -0,0 +1,85 @@
+import argparse
+import math
+
+import numpy as np
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def spherical_kmeans(vectors, k, iterations=20, seed=0):
+    """
+    코사인 k-means (정규화한 벡터를 가장 비슷한 중심에 배정, 중심 = 배정된 벡터의 평균)
+    vectors: (N, d) 정규화된 벡터 -> (중심 (k, d), 배정 (N,))
+    빈 클러스터가 생기면 현재 중심과 가장 덜 비슷한 벡터로 다시 채움
+    """
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    assignment = None
+    for _ in range(iterations):
+        sims = vectors @ normalize(centroids).T
+        new_assignment = sims.argmax(axis=1)
+        if assignment is not None and np.array_equal(new_assignment, assignment):
+            break
+        assignment = new_assignment
+        counts = np.bincount(assignment, minlength=k)
+        centroids = np.zeros_like(centroids)
+        np.add.at(centroids, assignment, vectors)
+        for empty in np.flatnonzero(counts == 0):
+            farthest = int(sims.max(axis=1).argmin())
+            centroids[empty] = vectors[farthest]
+            counts[empty] = 1
+            sims[farthest] = np.inf
+        centroids /= counts[:, None]
+    return centroids, assignment
+
+
+def clusters_for(count, cluster_size):
+    """
+    결함 종류 1개의 행 수 -> 서브 중심 개수 (클러스터 1개당 평균 cluster_size행)
+    """
+    return max(1, math.ceil(count / cluster_size))
+
+
+if __name__ == "__main__":
+    from vector_store import PostgresVectorStore
+
+    # ★ build_db.py와 동일한 DB 접속 정보 ★
+    DB_CONFIG = {
+        "host": "localhost",
+        "port": "5432",
+        "dbname": "postgres",
+        "user": "postgres",
+        "password": "3510"
+    }
+
+    parser = argparse.ArgumentParser(description="결함 종류별 프로토타입(서브 중심) 관리")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="결함 종류별 k-means로 프로토타입을 새로 만듦")
+    build_parser.add_argument("--cluster-size", type=int, default=1000, help="서브 중심 1개가 대표할 평균 행 수")
+    build_parser.add_argument("--iterations", type=int, default=20)
+    build_parser.add_argument("--model-version", default=None)
+
+    subparsers.add_parser("stats", help="결함 종류별 프로토타입 수와 클러스터 크기")
+    subparsers.add_parser("drop", help="프로토타입 삭제 (적재 시 갱신도 중단)")
+
+    args = parser.parse_args()
+    store = PostgresVectorStore(DB_CONFIG, pool_size=1)
+    try:
+        if args.command == "build":
+            store.build_prototypes(args.cluster_size, args.iterations, model_version=args.model_version)
+        elif args.command == "stats":
+            print("\n📊 [프로토타입] 결함 종류별 서브 중심 수와 클러스터 크기")
+            print("-" * 60)
+            print(f"   {'결함 종류':<16} {'서브 중심':>8} {'행 수':>10} {'최대 클러스터':>12}")
+            for defect_type, clusters, rows, largest in store.prototype_stats():
+                print(f"   {defect_type:<16} {clusters:>8} {rows:>10} {largest:>12}")
+            print("-" * 60)
+        elif args.command == "drop":
+            store.drop_prototypes()
+    finally:
+        store.close()
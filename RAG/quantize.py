@@ -0,0 +1,209 @@
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torchvision.transforms as T
+from PIL import Image
+
+from projection import knn_verdicts
+from rag_core import (IMAGENET_MEAN, IMAGENET_STD, defect_type_of, int8_skip_path, list_image_files,
+                      load_dinov2_backbone, load_int8_skip, model_weights_tag)
+from runtime import quantizable_linears, quantize_int8
+
+
+# =================================================================
+# 동적 int8 양자화 (DefectRAG(runtime="int8")) 보정 / 정확도 리포트
+#   - 보정 없이: Attention qkv/proj, Mlp/SwiGLUFFN의 Linear를 전부 int8 (바로 사용 가능)
+#   - 보정(calibrate): 폴더의 이미지 일부로 블록별 민감도(그 블록만 양자화했을 때 fp32 대비 코사인 하락)를 재고,
+#     최소 코사인 목표를 넘을 때까지 가장 민감한 블록부터 fp32로 남김 -> weights/{model_name}_int8_skip.json
+#     (파일을 지우면 다시 보정 없이 전부 양자화)
+#   - 리포트(report): fp32 / int8(보정 없이) / int8(보정)의 임베딩 코사인 일치, kNN 판정 일치율, 정확도, 처리량
+# 입력은 square 전처리(518x518). DB 없이 폴더 이미지만 사용
+# =================================================================
+
+def load_batches(paths, batch_size, image_size=518):
+    """
+    이미지 경로 목록 -> 전처리된 (B, 3, H, W) 텐서 목록 (처리량 측정에서 디코딩 시간을 빼기 위해 미리 디코딩)
+    """
+    transform = T.Compose([
+        T.Resize((image_size, image_size)),
+        T.ToTensor(),
+        T.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+    return [
+        torch.stack([transform(Image.open(path).convert('RGB')) for path in paths[start:start + batch_size]])
+        for start in range(0, len(paths), batch_size)
+    ]
+
+
+def embed(model, batches):
+    """
+    -> ((N, d) numpy 임베딩, 초당 이미지 수). 첫 배치로 워밍업한 뒤 측정
+    """
+    with torch.no_grad():
+        model(batches[0])
+        start = time.perf_counter()
+        embeddings = np.concatenate([model(img_batch).float().numpy() for img_batch in batches])
+    return embeddings, len(embeddings) / (time.perf_counter() - start)
+
+
+def cosines(actual, expected):
+    # 행별 코사인 유사도 -> (N,)
+    actual = actual / np.maximum(np.linalg.norm(actual, axis=1, keepdims=True), 1e-12)
+    expected = expected / np.maximum(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12)
+    return np.sum(actual * expected, axis=1)
+
+
+def calibrate_skip(model, batches, min_cosine=0.995, max_skip=None):
+    """
+    fp32로 남길 블록 고르기 -> (skip 블록 목록, 그때의 최소 코사인, {블록: 민감도})
+    보정 없이 전부 양자화해도 최소 코사인이 min_cosine 이상이면 빈 목록
+    max_skip: fp32로 남길 최대 블록 수 (None이면 전체 블록의 1/4. 많이 남길수록 속도 이득이 줄어듦)
+    """
+    reference, _ = embed(model, batches)
+    blocks = list(dict.fromkeys(name.rsplit(".", 2)[0] for name in quantizable_linears(model)))
+    max_skip = len(blocks) // 4 if max_skip is None else max_skip
+
+    def agreement(skip):
+        return cosines(embed(quantize_int8(model, skip), batches)[0], reference)
+
+    cosine = float(agreement([]).min())
+    print(f"   보정 없이 전부 양자화: 최소 코사인 {cosine:.6f}")
+    if cosine >= min_cosine:
+        return [], cosine, {}
+
+    # 블록별 민감도: 그 블록 하나만 양자화했을 때의 평균 코사인 하락
+    sensitivity = {}
+    for block in blocks:
+        sensitivity[block] = 1.0 - float(agreement([other for other in blocks if other != block]).mean())
+        print(f"   {block:<12} 민감도 {sensitivity[block]:.6f}")
+
+    skip = []
+    for block in sorted(blocks, key=sensitivity.get, reverse=True):
+        if cosine >= min_cosine or len(skip) >= max_skip:
+            break
+        skip.append(block)
+        cosine = float(agreement(skip).min())
+        print(f"   🔧 {block} fp32 유지 -> 최소 코사인 {cosine:.6f}")
+    if cosine < min_cosine:
+        print(f"⚠️ fp32 블록 {len(skip)}개로도 목표 코사인({min_cosine})에 못 미칩니다 (최소 코사인 {cosine:.6f})")
+    return skip, cosine, sensitivity
+
+
+def query_count(num_images, num_queries, top_k):
+    """
+    정확도 리포트의 질의 수: 질의를 뺀 나머지(참조)가 top_k개 이상 남도록 num_queries를 줄임
+    """
+    if num_images <= top_k:
+        raise ValueError(f"이미지 수({num_images})가 top_k({top_k})보다 많아야 합니다 (질의 + 참조 top_k개).")
+    return min(num_queries, num_images - top_k)
+
+
+def accuracy_report(model, batches, defect_types, variants, num_queries=200, top_k=10, seed=0):
+    """
+    fp32 대비 int8 정확도/처리량 리포트
+    variants: [(이름, 양자화 모델), ...]
+    이미지를 질의(num_queries개)와 참조로 나누고, 참조는 fp32 임베딩 (fp32로 만든 DB를 int8 질의로 검색하는 상황)
+    -> [(이름, 평균 코사인, 최소 코사인, fp32 판정 일치율, 정확도, 처리량(img/s)), ...] (첫 행은 fp32)
+    """
+    class_names, labels = np.unique(np.asarray(defect_types), return_inverse=True)
+    order = np.random.default_rng(seed).permutation(len(labels))
+    num_queries = query_count(len(labels), num_queries, top_k)
+    query_rows, reference_rows = order[:num_queries], order[num_queries:]
+
+    reference, reference_rate = embed(model, batches)
+    base_verdicts = knn_verdicts(reference[query_rows], reference[reference_rows], labels[reference_rows], top_k)
+    rows = [("fp32", 1.0, 1.0, 1.0, float(np.mean(base_verdicts == labels[query_rows])), reference_rate)]
+    for name, quantized in variants:
+        embeddings, rate = embed(quantized, batches)
+        agreement = cosines(embeddings, reference)
+        verdicts = knn_verdicts(embeddings[query_rows], reference[reference_rows], labels[reference_rows], top_k)
+        rows.append((name, float(agreement.mean()), float(agreement.min()), float(np.mean(verdicts == base_verdicts)),
+                     float(np.mean(verdicts == labels[query_rows])), rate))
+    return rows
+
+
+if __name__ == "__main__":
+    # 하위 명령 공통 옵션
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--model-name", default="dinov2_vitl14")
+    common.add_argument("--weights", default=None, help="가중치 파일 (기본: weights/{model_name}_pretrain.pth)")
+    common.add_argument("--batch-size", type=int, default=8)
+    common.add_argument("--threads", type=int, default=None, help="torch CPU 스레드 수")
+    common.add_argument("--seed", type=int, default=0)
+
+    parser = argparse.ArgumentParser(description="DINOv2 백본 동적 int8 양자화 보정 / 정확도 리포트 (CPU)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    calibrate_parser = subparsers.add_parser("calibrate", help="민감한 블록을 골라 fp32로 남김 (int8 보정 파일 저장)",
+                                             parents=[common])
+    calibrate_parser.add_argument("folder", help="보정용 이미지 폴더 (실제 검사 이미지)")
+    calibrate_parser.add_argument("--images", type=int, default=32, help="보정에 쓸 이미지 수")
+    calibrate_parser.add_argument("--min-cosine", type=float, default=0.995, help="fp32 대비 목표 최소 코사인")
+    calibrate_parser.add_argument("--max-skip", type=int, default=None, help="fp32로 남길 최대 블록 수")
+
+    report_parser = subparsers.add_parser("report", help="fp32 대비 임베딩 코사인 / kNN 판정 일치율 / 처리량",
+                                          parents=[common])
+    report_parser.add_argument("folder", help="결함 종류별 폴더로 정리된 이미지 폴더")
+    report_parser.add_argument("--images", type=int, default=1000, help="사용할 최대 이미지 수")
+    report_parser.add_argument("--queries", type=int, default=200)
+    report_parser.add_argument("--top-k", type=int, default=10)
+
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    paths = sorted(list_image_files(args.folder))
+    if not paths:
+        raise SystemExit(f"⚠️ 이미지가 없습니다: {args.folder}")
+    paths = [paths[i] for i in sorted(np.random.default_rng(args.seed).permutation(len(paths))[:args.images])]
+    if args.command == "report":
+        try:
+            num_queries = query_count(len(paths), args.queries, args.top_k)
+        except ValueError as e:
+            raise SystemExit(f"⚠️ {e}")
+    print(f"📂 이미지 {len(paths)}장 디코딩 중...")
+    batches = load_batches(paths, args.batch_size)
+    model = load_dinov2_backbone(args.model_name, args.weights).eval()
+
+    if args.command == "calibrate":
+        print(f"\n🔍 [int8 보정] {args.model_name}, 이미지 {len(paths)}장, 목표 최소 코사인 {args.min_cosine}")
+        skip, cosine, sensitivity = calibrate_skip(model, batches, args.min_cosine, args.max_skip)
+        calibration = {
+            "model_name": args.model_name,
+            "weights": model_weights_tag(args.model_name, args.weights),
+            "skip": skip,
+            "min_cosine": cosine,
+            "target_cosine": args.min_cosine,
+            "images": len(paths),
+            "sensitivity": sensitivity,
+            "calibrated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        path = int8_skip_path(args.model_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(calibration, f, ensure_ascii=False, indent=2)
+        print(f"✅ int8 보정 완료: fp32 유지 블록 {skip or '없음'} (최소 코사인 {cosine:.6f}) -> {path}")
+    elif args.command == "report":
+        variants = [("int8 (보정 없음)", quantize_int8(model))]
+        skip = load_int8_skip(args.model_name, model_weights_tag(args.model_name, args.weights))
+        if skip:
+            variants.append((f"int8 (보정, fp32 {len(skip)}블록)", quantize_int8(model, skip)))
+        rows = accuracy_report(model, batches, [defect_type_of(p) for p in paths], variants,
+                               num_queries, args.top_k, args.seed)
+
+        print(f"\n📊 [int8 양자화 정확도] {args.model_name}, 이미지 {len(paths)}장, "
+              f"질의 {num_queries}개, top_k={args.top_k}, "
+              f"CPU 스레드 {torch.get_num_threads()}개")
+        print("-" * 80)
+        print(f"   {'방식':<22} {'평균 코사인':>10} {'최소 코사인':>10} {'fp32 판정 일치':>12} {'정확도':>8} "
+              f"{'처리량(img/s)':>13} {'fp32 대비':>9}")
+        for name, mean_cosine, min_cosine, agreement, accuracy, rate in rows:
+            print(f"   {name:<22} {mean_cosine:>10.6f} {min_cosine:>10.6f} {agreement:>12.4f} {accuracy:>8.4f} "
+                  f"{rate:>13.2f} {rate / rows[0][5]:>8.2f}x")
+        print("-" * 80)
+        if not skip:
+            print("💡 판정 일치율이 낮으면 quantize.py calibrate로 민감한 블록을 fp32로 남길 수 있습니다.")
@@ -3,107 +3,847 @@ import torchvision.transforms as T
 from PIL import Image
 import numpy as np
 import os
+import sys
+import io
 import glob
-import psycopg  # psycopg 3 버전
-from pgvector.psycopg import register_vector
+import datetime
+import hashlib
+import itertools
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from torch.utils.data import Dataset, IterableDataset, DataLoader, get_worker_info
 
+from ingest_manifest import IngestManifest, file_sha256
+from pipeline import Pipeline, Stage
+from result_cache import ResultCache
+from runtime import RUNTIMES, make_runtime, weights_tag
+from vector_store import METADATA_FIELDS, DefectRow, TileRow, LocalVectorStore, PostgresVectorStore, as_date, chunked
 
-class DefectRAG_Postgres:
-    def __init__(self, db_info):
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# 저장소 루트 (dinov2 패키지 위치)와 로컬 가중치 폴더
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEIGHTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights")
+
+
+def weights_source(model_name, weights_path=None):
+    """
+    -> (가중치 파일 경로, 다운로드 URL 또는 None)
+    로컬 파일(weights_path, 기본 weights/{model_name}_pretrain.pth)이 없으면 공식 URL과 torch hub 캐시의 저장 경로
+    """
+    weights_path = weights_path or os.path.join(WEIGHTS_DIR, f"{model_name}_pretrain.pth")
+    if os.path.exists(weights_path):
+        return weights_path, None
+    # 예: dinov2_vitl14_reg -> dinov2_vitl14/dinov2_vitl14_reg4_pretrain.pth
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from dinov2.hub.utils import _DINOV2_BASE_URL
+
+    base_name = model_name[:-len("_reg")] if model_name.endswith("_reg") else model_name
+    full_name = base_name + "_reg4" if model_name.endswith("_reg") else base_name
+    url = f"{_DINOV2_BASE_URL}/{base_name}/{full_name}_pretrain.pth"
+    return os.path.join(torch.hub.get_dir(), "checkpoints", os.path.basename(url)), url
+
+
+def model_weights_tag(model_name, weights_path=None):
+    # 모델이 쓰는 가중치 파일의 식별자 (runtime.weights_tag). 모델을 로드한 뒤(파일이 있을 때) 호출
+    return weights_tag(weights_source(model_name, weights_path)[0])
+
+
+def load_dinov2_backbone(model_name, weights_path=None, device="cpu"):
+    """
+    torch.hub(GitHub 접속) 대신 저장소 안의 dinov2.hub.backbones로 모델을 만들고 가중치를 로드
+    weights_path: 로컬 가중치 파일(.pth). None이면 weights/{model_name}_pretrain.pth
+                  파일이 없으면 공식 URL에서 1번 내려받아 torch hub 캐시에 저장 (이후에는 오프라인으로 동작)
+    모델을 meta 디바이스에 만든 뒤 빈 메모리만 할당(to_empty)하고 가중치를 채우므로 랜덤 초기화 비용이 없음
+    """
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from dinov2.hub import backbones
+
+    path, url = weights_source(model_name, weights_path)
+    if url is None:
+        state_dict = torch.load(path, map_location="cpu")
+    else:
+        print(f"⚠️ 로컬 가중치가 없어 다운로드 캐시를 사용합니다: {weights_path or model_name} -> {url}")
+        state_dict = torch.hub.load_state_dict_from_url(url, map_location="cpu")
+
+    with torch.device("meta"):
+        model = getattr(backbones, model_name)(pretrained=False)
+    model.to_empty(device=device)
+    model.load_state_dict(state_dict, strict=True)
+    return model
+
+
+def int8_skip_path(model_name):
+    # quantize.py calibrate가 고른 fp32 유지 블록 목록 (runtime="int8"이 있으면 사용)
+    return os.path.join(WEIGHTS_DIR, f"{model_name}_int8_skip.json")
+
+
+def load_int8_skip(model_name, tag):
+    """
+    runtime="int8"에서 fp32로 남길 블록 -> [블록 이름, ...]
+    tag: 현재 가중치 파일의 식별자 (model_weights_tag)
+    보정 파일이 없거나 다른 가중치로 보정한 파일이면 빈 목록 (보정 없이 전부 양자화)
+    """
+    path = int8_skip_path(model_name)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        calibration = json.load(f)
+    if calibration["weights"] != tag:
+        print(f"⚠️ int8 보정 파일이 현재 가중치와 맞지 않아 무시합니다: {path} (quantize.py calibrate로 다시 보정)")
+        return []
+    return calibration["skip"]
+
+
+# 백본별 임베딩(CLS 토큰) 차원. _reg(레지스터 토큰) 변형도 차원은 같음
+BACKBONE_DIMS = {"vits14": 384, "vitb14": 768, "vitl14": 1024, "vitg14": 1536}
+
+
+def backbone_dim(model_name):
+    """
+    예: dinov2_vitb14_reg -> 768
+    """
+    for name, dim in BACKBONE_DIMS.items():
+        if f"_{name}" in model_name:
+            return dim
+    raise ValueError(f"알 수 없는 DINOv2 모델입니다: {model_name} ({', '.join(BACKBONE_DIMS)})")
+
+
+def list_image_files(folder_path):
+    return [path for pattern in ("*.jpg", "*.png")
+            for path in glob.glob(os.path.join(folder_path, "**", pattern), recursive=True)]
+
+
+def defect_type_of(filepath):
+    # 상위 폴더 이름 = 결함 종류
+    return os.path.basename(os.path.dirname(filepath))
+
+
+def folder_metadata(levels=("line", "layer"), mtime_date=False):
+    """
+    폴더 구조에서 메타데이터를 읽는 metadata_fn을 만듦: .../<line>/<layer>/<결함 종류>/파일
+    levels: 결함 종류 폴더 바로 위 폴더들의 이름 (위에서부터 순서대로)
+    mtime_date=True: 파일 수정 날짜를 capture_date로 사용
+    """
+    def metadata(filepath):
+        parents = os.path.dirname(os.path.dirname(os.path.abspath(filepath))).split(os.sep)
+        values = dict(zip(levels, parents[len(parents) - len(levels):]))
+        if mtime_date:
+            values["capture_date"] = datetime.date.fromtimestamp(os.path.getmtime(filepath))
+        return values
+
+    return metadata
+
+
+def file_metadata(filepath, folder_path, metadata_fn=None):
+    """
+    ingest 행의 메타데이터 -> (line, layer, capture_date, source_folder)
+    source_folder는 ingest한 폴더의 절대 경로, 나머지는 metadata_fn(filepath) -> {"line", "layer", "capture_date"}
+    """
+    values = dict(metadata_fn(filepath)) if metadata_fn is not None else {}
+    unknown = set(values) - set(METADATA_FIELDS)
+    if unknown:
+        raise ValueError(f"지원하지 않는 메타데이터입니다: {sorted(unknown)} ({', '.join(METADATA_FIELDS)})")
+    values["capture_date"] = as_date(values.get("capture_date"))
+    values.setdefault("source_folder", os.path.abspath(folder_path))
+    return tuple(values.get(name) for name in METADATA_FIELDS)
+
+
+def aspect_size(width, height, max_side, patch_size=14):
+    """
+    비율 유지 리사이즈 크기: 긴 변을 max_side에 맞추고 두 변을 patch_size 배수로 반올림 -> (width, height)
+    (예: 300x60 스크래치 크롭, max_side=518 -> 518x98 = 토큰 37x7개. 정사각 리사이즈는 37x37개)
+    """
+    scale = max_side / max(width, height)
+    return (max(patch_size, round(width * scale / patch_size) * patch_size),
+            max(patch_size, round(height * scale / patch_size) * patch_size))
+
+
+class AspectResize:
+    """
+    aspect_size()로 비율을 유지하며 리사이즈하는 PIL 변환 (T.Resize와 같은 bilinear)
+    """
+
+    def __init__(self, max_side, patch_size=14):
+        self.max_side = max_side
+        self.patch_size = patch_size
+
+    def __call__(self, img):
+        return img.resize(aspect_size(*img.size, self.max_side, self.patch_size), Image.BILINEAR)
+
+
+class DefectImageDataset(Dataset):
+    """
+    이미지 디코딩 + 전처리를 DataLoader 워커에서 수행하기 위한 Dataset
+    반환값: (전처리된 텐서, 파일 인덱스)
+    """
+
+    def __init__(self, files, transform):
+        self.files = files
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, index):
+        img = Image.open(self.files[index]).convert('RGB')
+        return self.transform(img), index
+
+
+def tile_boxes(width, height, tile_size, overlap):
+    """
+    (width, height) 이미지를 tile_size 정사각 타일로 겹치게 자른 좌표 -> [(x, y, w, h), ...]
+    overlap: 이웃 타일이 겹치는 비율 (0.25면 stride = tile_size * 0.75). 마지막 타일은 가장자리에 맞춤
+    tile_size보다 작은 변은 타일 1개로 전체를 덮음
+    """
+    stride = max(int(tile_size * (1 - overlap)), 1)
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        return list(range(0, length - tile_size, stride)) + [length - tile_size]
+
+    return [(x, y, min(tile_size, width), min(tile_size, height)) for y in starts(height) for x in starts(width)]
+
+
+class TiledImageDataset(IterableDataset):
+    """
+    타일 모드용 Dataset: 워커마다 이미지 일부를 맡아 이미지 1장당 1번만 디코딩하고 타일을 하나씩 내보냄
+    (리사이즈 없이 원본 픽셀에서 자르므로 큰 이미지도 픽셀 수에 비례하는 비용)
+    반환값: (전처리된 타일 텐서, 파일 인덱스, [x, y, w, h] 텐서)
+    """
+
+    def __init__(self, files, tile_size, overlap, image_size):
+        self.files = files
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.image_size = image_size
+        self.mean = torch.tensor(IMAGENET_MEAN).view(3, 1, 1)
+        self.std = torch.tensor(IMAGENET_STD).view(3, 1, 1)
+
+    def __iter__(self):
+        worker = get_worker_info()
+        indices = range(len(self.files))
+        if worker is not None:
+            indices = indices[worker.id::worker.num_workers]
+
+        for index in indices:
+            pixels = np.array(Image.open(self.files[index]).convert('RGB'))  # 디코딩 1번 (타일은 이 배열의 view)
+            height, width = pixels.shape[:2]
+            for x, y, w, h in tile_boxes(width, height, self.tile_size, self.overlap):
+                tile = torch.from_numpy(pixels[y:y + h, x:x + w]).permute(2, 0, 1).float() / 255
+                if (h, w) != (self.image_size, self.image_size):
+                    # 이미지가 타일보다 작거나 tile_size가 모델 입력 크기와 다를 때만 리사이즈
+                    tile = torch.nn.functional.interpolate(
+                        tile.unsqueeze(0), size=(self.image_size, self.image_size), mode="bilinear",
+                        antialias=True, align_corners=False,
+                    )[0]
+                yield (tile - self.mean) / self.std, index, torch.tensor([x, y, w, h])
+
+
+class DefectRAG:
+    def __init__(self, store, embedding_cache=None, weights_path=None, resize_mode="square",
+                 model_name="dinov2_vitl14", runtime="eager"):
         """
-        db_info: DB 접속 정보 딕셔너리
+        store: 임베딩 저장소 백엔드 (vector_store.VectorStore 구현체)
+        embedding_cache: embedding_cache.EmbeddingCache (선택). ingest/search가 함께 사용
+        weights_path: DINOv2 가중치 파일 경로 (None이면 weights/{model_name}_pretrain.pth)
+        resize_mode: "square"(518x518로 강제 리사이즈, 기존 방식) 또는 "aspect"(비율 유지, 긴 변 518, 14의 배수)
+                     aspect는 가늘고 긴 크롭의 토큰 수가 줄어듦. 배치는 토큰 격자 크기가 같은 이미지끼리 묶음
+        model_name: DINOv2 백본 (예: dinov2_vitl14, dinov2_vitb14_reg). 바꾸면 model_version이 달라지므로
+                    저장된 임베딩은 reindex.py로 재임베딩 후 전환해야 함
+        runtime: 백본 실행 방식 ("eager", "trace", "compile", "onnx", "int8"). 설명은 runtime.py 참고
+                 임베딩 값은 같으므로(eager 대비 코사인 확인) model_version은 바뀌지 않음
+                 int8은 fp32로 만든 DB를 그대로 검색하는 검색 전용 방식 (판정 일치율은 quantize.py report로 확인)
+                 근사값이 fp32 행/캐시와 섞이지 않도록 적재는 거부하고, 임베딩 캐시는 별도 키(cache_version)에 저장
+        모델은 첫 임베딩 때 로드하므로, DB 점검/관리만 하는 스크립트는 모델 로드 비용이 없음
         """
+        # 하위 클래스는 저장소 연결 전에 시작 시각을 기록해 두므로, 연결 시간까지 포함해 보고
+        start = getattr(self, "_init_start", None) or time.perf_counter()
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"🏭 [PostgreSQL RAG] 시스템 초기화 (Device: {self.device})")
+        print(f"🏭 [{store.name} RAG] 시스템 초기화 (Device: {self.device})")
 
-        self.db_info = db_info
+        self.store = store
+        self.embedding_cache = embedding_cache
+
+        # AI 모델 설정 (기본 DINOv2 Large). 실제 로드는 self.model 첫 접근 시
+        if runtime not in RUNTIMES:
+            raise ValueError(f"지원하지 않는 runtime입니다: {runtime} ({', '.join(RUNTIMES)})")
+        if runtime == "int8" and self.device.type == "cuda":
+            print("⚠️ runtime='int8'(동적 양자화)는 CPU 전용입니다. GPU에서는 eager로 실행합니다.")
+            runtime = "eager"
+        self.model_name = model_name
+        self.embedding_dim = backbone_dim(model_name)
+        self.runtime = runtime
+        self.image_size = 518
+        self.weights_path = weights_path
+        self._model = None
+        self._model_lock = threading.Lock()
+
+        self.resize_mode = resize_mode
 
-        # DB 연결 및 테이블 생성
-        with psycopg.connect(**self.db_info, autocommit=True) as conn:
-            conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
-            register_vector(conn)
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS defect_images (
-                    id SERIAL PRIMARY KEY,
-                    filename TEXT,
-                    defect_type TEXT,
-                    embedding vector(1024)
-                )
-            """)
-            print("✅ DB 연결 및 테이블 확인 완료")
-
-        # AI 모델 로드 (DINOv2 Large)
-        self.model = torch.hub.load('facebookresearch/dinov2', 'dinov2_vitl14')
-        self.model.to(self.device)
-        self.model.eval()
+        # 저장소가 다른 모델 버전으로 전환됐거나 차원이 다르면 검색 결과가 의미 없으므로 경고
+        active_version = getattr(store, "active_version", None)
+        store_dim = getattr(store, "dim", None)
+        if store_dim is not None and store_dim != self.embedding_dim:
+            print(f"⚠️ 저장소 임베딩 차원({store_dim})과 모델 차원({self.embedding_dim}, {self.model_name})이 다릅니다.")
+        elif active_version is not None and active_version != self.model_version:
+            print(f"⚠️ 저장소의 활성 모델 버전({active_version})과 현재 모델 버전({self.model_version})이 다릅니다.")
 
+        self.startup_seconds = time.perf_counter() - start
+        self.model_load_seconds = None
+        print(f"✅ 시스템 초기화 완료 ({self.startup_seconds:.2f}초, 모델은 첫 임베딩 때 로드)")
+
+    @property
+    def resize_mode(self):
+        return self._resize_mode
+
+    @resize_mode.setter
+    def resize_mode(self, mode):
+        if mode not in ("square", "aspect"):
+            raise ValueError(f"지원하지 않는 resize_mode입니다: {mode} (square, aspect)")
+        self._resize_mode = mode
+        resize = T.Resize((self.image_size, self.image_size)) if mode == "square" else AspectResize(self.image_size)
         self.transform = T.Compose([
-            T.Resize((518, 518)),
+            resize,
             T.ToTensor(),
-            T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+            T.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
         ])
+        # 임베딩을 만든 모델 + 전처리 식별자. 증분 ingest에서 "이미 있는 이미지" 판단 키의 일부
+        # (square는 기존 값을 유지해 이미 저장된 행/캐시를 그대로 사용)
+        if mode == "square":
+            self.model_version = f"{self.model_name}/resize{self.image_size}"
+        else:
+            self.model_version = f"{self.model_name}/aspect{self.image_size}"
+
+    @property
+    def cache_version(self):
+        # 임베딩 캐시 키의 모델 버전. int8은 fp32 근사값이라 따로 저장 (fp32 프로세스와 같은 캐시 파일을 써도 섞이지 않음)
+        return f"{self.model_version}+int8" if self.runtime == "int8" else self.model_version
+
+    def _check_writable(self):
+        # int8 임베딩은 model_version이 fp32와 같아서 저장소에 들어가면 fp32 행과 구분할 수 없음
+        if self.runtime == "int8":
+            raise ValueError("runtime='int8'은 검색 전용입니다. 적재/재임베딩은 fp32 runtime(eager 등)으로 실행하세요.")
+
+    def _batch_plan(self, paths, batch_size, num_workers=4):
+        """
+        paths를 batch_size개 이하 배치로 나눈 인덱스 목록 -> [[i, ...], ...]
+        aspect 모드: 헤더만 읽어 이미지 크기를 구하고, 토큰 격자 크기가 같은 이미지끼리 묶어서 배치 (stack 가능하도록)
+        """
+        if self.resize_mode == "square":
+            return list(chunked(range(len(paths)), batch_size))
+
+        def grid(path):
+            with Image.open(path) as img:  # 픽셀은 디코딩하지 않음
+                return aspect_size(*img.size, self.image_size)
+
+        with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+            grids = list(executor.map(grid, paths))
+        buckets = {}
+        for index, size in enumerate(grids):
+            buckets.setdefault(size, []).append(index)
+        return [batch for size in sorted(buckets) for batch in chunked(buckets[size], batch_size)]
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    model = load_dinov2_backbone(self.model_name, self.weights_path, device=self.device)
+                    model.eval()
+                    # onnx: 내보낸 파일을 weights/onnx에 보관해서 다음 실행부터는 내보내기 없이 바로 사용
+                    # int8: quantize.py calibrate로 보정했으면 민감한 블록은 fp32로 남김
+                    options = {}
+                    if self.runtime == "onnx":
+                        options["cache_dir"] = os.path.join(WEIGHTS_DIR, "onnx")
+                        options["tag"] = model_weights_tag(self.model_name, self.weights_path)
+                    elif self.runtime == "int8":
+                        options["skip"] = load_int8_skip(self.model_name,
+                                                         model_weights_tag(self.model_name, self.weights_path))
+                    model = make_runtime(self.runtime, model, **options)
+                    self.model_load_seconds = time.perf_counter() - start
+                    print(f"🧠 모델 로드 완료 ({self.model_name}, runtime={self.runtime}, "
+                          f"{self.model_load_seconds:.1f}초)")
+                    self._model = model
+        return self._model
 
     def get_embedding(self, img_path):
-        img = Image.open(img_path).convert('RGB')
-        img_t = self.transform(img).unsqueeze(0).to(self.device)
+        if self.embedding_cache is None:
+            img = Image.open(img_path).convert('RGB')
+            img_t = self.transform(img).unsqueeze(0)
+            return self.embed_batch(img_t)[0]
+
+        # 파일은 1번만 읽어서 해시(캐시 키)와 디코딩에 같이 사용
+        with open(img_path, 'rb') as f:
+            data = f.read()
+        return self._embed_bytes(data, hashlib.sha256(data).hexdigest())
+
+    def _embed_bytes(self, data, content_hash):
+        # 이미지 파일 내용 -> 임베딩 (임베딩 캐시가 있으면 content_hash로 조회/저장)
+        vector = None
+        if self.embedding_cache is not None:
+            vector = self.embedding_cache.get(content_hash, self.cache_version)
+        if vector is None:
+            img = Image.open(io.BytesIO(data)).convert('RGB')
+            vector = self.embed_batch(self.transform(img).unsqueeze(0))[0]
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(content_hash, self.cache_version, vector)
+        return vector
+
+    def embed_batch(self, img_batch):
+        """
+        img_batch: (B, 3, H, W) 전처리된 텐서 -> (B, embedding_dim) numpy 임베딩
+        """
         with torch.no_grad():
-            embedding = self.model(img_t)
-        return embedding.cpu().numpy().flatten()
+            embeddings = self.model(img_batch.to(self.device))
+        return embeddings.cpu().numpy()
 
-    def ingest_data_folder(self, folder_path):
-        files = glob.glob(os.path.join(folder_path, "**", "*.jpg"), recursive=True) + \
-                glob.glob(os.path.join(folder_path, "**", "*.png"), recursive=True)
+    def embed_patch_batch(self, img_batch):
+        """
+        img_batch: (B, 3, H, W) 전처리된 텐서 (H, W는 14의 배수) -> (B, H/14, W/14, embedding_dim) 패치 토큰 텐서 (device에 그대로 둠)
+        """
+        batch, _, height, width = img_batch.shape
+        with torch.no_grad():
+            tokens = self.model.forward_features(img_batch.to(self.device))["x_norm_patchtokens"]
+        return tokens.reshape(batch, height // self.model.patch_size, width // self.model.patch_size, -1)
+
+    def ingest_data_folder(self, folder_path, batch_size=None, num_workers=4, chunk_size=1000, rebuild=False,
+                           incremental=False, manifest_path=None, embed_workers=1, write_workers=1, queue_size=4,
+                           metadata_fn=None):
+        """
+        batch_size=None  : 기존 방식 (이미지 1장씩 임베딩 후 1행씩 저장)
+        batch_size=N     : 배치 방식 (디코딩 -> N장씩 모델 추론 -> 저장소 적재를 파이프라인으로 동시에 실행)
+        num_workers      : 배치 방식의 디코딩 스레드 수 (embed_workers, write_workers: 추론/적재 스레드 수)
+        queue_size       : 단계 사이 큐에 쌓아 둘 최대 배치 수 (뒤 단계가 느리면 앞 단계가 기다림)
+        chunk_size       : 배치 방식에서 1회 커밋당 행 수 (PostgreSQL: COPY 1회 = 1 트랜잭션)
+        rebuild=True     : 배치 방식 전용. 저장소를 비우고 새로 적재 (PostgreSQL: ANN 인덱스를 내렸다가 재생성)
+        incremental=True : (파일 내용 해시, model_version)이 이미 저장된 이미지는 건너뛰고 새 이미지만 임베딩
+                           이동/이름 변경된 파일은 경로만 갱신, 폴더에서 사라진 파일의 행은 삭제
+                           커밋된 chunk는 다시 처리하지 않으므로 중단 후 재실행하면 이어서 진행
+        manifest_path    : 증분 모드의 파일 해시 캐시 경로 (기본: 폴더/.rag_manifest.json)
+        metadata_fn      : 파일 경로 -> {"line", "layer", "capture_date"} (검색 필터용, 예: folder_metadata())
+                           source_folder에는 folder_path의 절대 경로가 들어감. 이동한 파일은 메타데이터도 갱신
+        임베딩 캐시가 있으면 캐시에 있는 이미지는 모델을 돌리지 않고 저장된 임베딩을 그대로 적재
+        반환값: {'images', 'embedded', 'cache_hits', 'skipped', 'moved', 'deleted', 'seconds', 'images_per_sec',
+                 'stages'(배치 방식의 단계별 사용률, Pipeline.stats())}
+        """
+        if rebuild and batch_size is None:
+            raise ValueError("rebuild=True는 배치 방식(batch_size 지정)에서만 사용할 수 있습니다.")
+        self._check_writable()
+
+        files = list_image_files(folder_path)
 
         print(f"📂 {len(files)}개 이미지 발견. DB 저장을 시작합니다...")
 
-        with psycopg.connect(**self.db_info, autocommit=True) as conn:
-            register_vector(conn)
-            with conn.cursor() as cursor:
-                for i, filepath in enumerate(files):
-                    defect_type = os.path.basename(os.path.dirname(filepath))
-                    filename = os.path.basename(filepath)
-                    vector = self.get_embedding(filepath)
+        start = time.perf_counter()
+        if incremental:
+            manifest = IngestManifest(manifest_path or os.path.join(folder_path, IngestManifest.FILE_NAME))
+        else:
+            manifest = IngestManifest()
+        hashes = manifest.hash_files(folder_path, files, num_workers=max(num_workers, 1))
+        manifest.save()
+        metadata = {path: file_metadata(path, folder_path, metadata_fn) for path in files}
+
+        to_embed, moves, deletes = files, [], []
+        if incremental and not rebuild:
+            to_embed, moves, deletes = self._plan_incremental(folder_path, files, hashes, metadata)
+            if moves:
+                self.store.update_paths(moves)
+            if deletes:
+                self.store.delete(deletes)
+            print(f"   증분 계획: 신규 {len(to_embed)}개, 이동 {len(moves)}개, 삭제 {len(deletes)}개, "
+                  f"변경 없음 {len(files) - len(to_embed) - len(moves)}개")
+
+        cached_rows = []
+        if self.embedding_cache is not None and to_embed:
+            cached = self.embedding_cache.get_many([hashes[path] for path in to_embed], self.cache_version)
+            cached_rows = [self._make_row(path, cached[hashes[path]], hashes, metadata)
+                           for path in to_embed if hashes[path] in cached]
+            to_embed = [path for path in to_embed if hashes[path] not in cached]
+            print(f"   임베딩 캐시: {len(cached_rows)}개 재사용, {len(to_embed)}개 새로 계산")
+
+        embed_start = time.perf_counter()
+        stage_stats = None
+        if batch_size is None:
+            self._ingest_per_image(to_embed, hashes, metadata, cached_rows)
+        else:
+            stage_stats = self._ingest_batched(to_embed, hashes, metadata, batch_size, num_workers, chunk_size,
+                                               rebuild, cached_rows, embed_workers, write_workers, queue_size)
+        embed_elapsed = time.perf_counter() - embed_start
+        elapsed = time.perf_counter() - start
+
+        stats = {
+            'images': len(files),
+            'embedded': len(to_embed),
+            'cache_hits': len(cached_rows),
+            'skipped': len(files) - len(to_embed) - len(cached_rows) - len(moves),
+            'moved': len(moves),
+            'deleted': len(deletes),
+            'seconds': elapsed,
+            'images_per_sec': (len(to_embed) + len(cached_rows)) / embed_elapsed if embed_elapsed > 0 else 0.0,
+            'stages': stage_stats,
+        }
+        print(f"✅ DB 저장 완료! ({stats['embedded'] + stats['cache_hits']}/{stats['images']}장 저장, {elapsed:.1f}초, "
+              f"{stats['images_per_sec']:.2f} images/sec)")
+        return stats
+
+    def _plan_incremental(self, folder_path, files, hashes, metadata):
+        """
+        저장소의 (content_hash, source_path)와 현재 폴더 상태를 비교해 (신규 파일, 이동, 삭제할 id) 계산
+        이동/삭제는 이 폴더 아래에서 ingest된 행만 대상으로 함
+        """
+        root = os.path.join(os.path.abspath(folder_path), "")
+        current = {os.path.abspath(path): hashes[path] for path in files}
+        original_paths = {os.path.abspath(path): path for path in files}
+
+        known = {}
+        for row_id, content_hash, source_path in self.store.entries(self.model_version):
+            known.setdefault(content_hash, []).append((row_id, source_path))
+
+        def is_stale(source_path, content_hash):
+            # 이 폴더 소속인데 그 경로에 같은 내용의 파일이 더 이상 없음
+            return bool(source_path) and source_path.startswith(root) and current.get(source_path) != content_hash
+
+        new_files, moves, claimed, scheduled = [], [], set(), set()
+        for path, content_hash in current.items():
+            rows = known.get(content_hash)
+            if not rows:
+                if content_hash not in scheduled:  # 폴더 안의 같은 내용 중복 파일은 1번만 임베딩
+                    scheduled.add(content_hash)
+                    new_files.append(original_paths[path])
+                continue
+            if any(source_path == path for _, source_path in rows):
+                continue  # 변경 없음
+            for row_id, source_path in rows:
+                if row_id not in claimed and is_stale(source_path, content_hash):
+                    moves.append((row_id, os.path.basename(path), defect_type_of(path), path,
+                                  *metadata[original_paths[path]]))
+                    claimed.add(row_id)
+                    break
+            # 옮겨갈 행이 없으면 다른 경로에 같은 내용이 이미 저장된 것이므로 건너뜀
+
+        deletes = [
+            row_id
+            for content_hash, rows in known.items()
+            for row_id, source_path in rows
+            if row_id not in claimed and is_stale(source_path, content_hash)
+        ]
+        return new_files, moves, deletes
+
+    def _make_row(self, filepath, vector, hashes, metadata):
+        return DefectRow(
+            os.path.basename(filepath), defect_type_of(filepath), vector,
+            hashes[filepath], self.model_version, os.path.abspath(filepath), *metadata[filepath],
+        )
+
+    def _ingest_per_image(self, files, hashes, metadata, cached_rows=()):
+        if cached_rows:
+            self.store.add(cached_rows)
+
+        for i, filepath in enumerate(files):
+            vector = self.get_embedding(filepath)
+
+            self.store.add([self._make_row(filepath, vector, hashes, metadata)])
+
+            if (i + 1) % 10 == 0:
+                print(f"   Saving... {i + 1}/{len(files)}")
+
+    def _ingest_batched(self, files, hashes, metadata, batch_size, num_workers, chunk_size, rebuild, cached_rows=(),
+                        embed_workers=1, write_workers=1, queue_size=4):
+        # =================================================================
+        # 디코딩(num_workers 스레드) -> 모델 추론(embed_workers) -> DB 저장(write_workers)
+        # 세 단계를 pipeline.Pipeline으로 동시에 실행 (단계 사이 bounded queue, 에러 시 전체 중단 후 다시 던짐)
+        # -> 추론 중에는 DB가, DB 왕복 중에는 모델이 쉬지 않음
+        # =================================================================
+        if rebuild and write_workers > 1:
+            raise ValueError("rebuild=True는 write_workers=1에서만 사용할 수 있습니다. (인덱스 재생성은 1번만)")
+        pin_memory = self.device.type == "cuda"
+        progress = {"done": 0}
+        progress_lock = threading.Lock()
 
-                    cursor.execute(
-                        "INSERT INTO defect_images (filename, defect_type, embedding) VALUES (%s, %s, %s)",
-                        (filename, defect_type, vector)
-                    )
+        def source():
+            # 캐시에서 가져온 행은 디코딩/모델을 거치지 않고 그대로 writer까지 전달
+            for rows in chunked(cached_rows, batch_size):
+                yield "rows", rows
+            for indices in self._batch_plan(files, batch_size, num_workers):
+                yield "files", indices
 
-                    if (i + 1) % 10 == 0:
-                        print(f"   Saving... {i + 1}/{len(files)}")
+        def decode(item):
+            kind, payload = item
+            if kind == "rows":
+                return item
+            img_batch = torch.stack([self.transform(Image.open(files[index]).convert('RGB')) for index in payload])
+            return "batch", payload, img_batch.pin_memory() if pin_memory else img_batch
 
-        print("✅ DB 저장 완료!")
+        def embed(item):
+            if item[0] == "rows":
+                return item[1]
+            _, indices, img_batch = item
+            vectors = self.embed_batch(img_batch)
+            rows = [self._make_row(files[index], vector, hashes, metadata) for index, vector in zip(indices, vectors)]
+            if self.embedding_cache is not None:
+                self.embedding_cache.put_many([(row.content_hash, row.embedding) for row in rows], self.cache_version)
+            with progress_lock:
+                progress["done"] += len(rows)
+                print(f"   Saving... {progress['done']}/{len(files)}")
+            return rows
 
-    def search(self, query_img_path, top_k=5):
+        def write(batches):
+            self.store.add(itertools.chain.from_iterable(batches), chunk_size=chunk_size, rebuild=rebuild)
+
+        pipeline = Pipeline(source(), [
+            Stage("decode", decode, workers=max(num_workers, 1), queue_size=queue_size),
+            Stage("embed", embed, workers=embed_workers, queue_size=queue_size),
+            Stage("write", write, workers=write_workers, queue_size=queue_size, stream=True),
+        ], name="ingest")
+        stats = pipeline.run()
+        pipeline.print_stats()
+        return stats
+
+    def ingest_tiles_folder(self, folder_path, tile_size=518, overlap=0.25, batch_size=32, num_workers=4,
+                            chunk_size=1000, rebuild=False):
+        """
+        타일 모드 ingest: 큰 이미지를 tile_size 픽셀 타일로 겹치게 잘라 타일마다 임베딩을 좌표와 함께 저장
+        tile_size: 원본 픽셀 기준 타일 한 변 (모델 입력 크기와 같으면 리사이즈 없음)
+        overlap: 이웃 타일이 겹치는 비율 (경계에 걸친 결함도 한 타일 안에 들어오도록)
+        batch_size: 여러 이미지의 타일을 섞어서 batch_size장씩 모델 추론
+        반환값: {'images', 'tiles', 'seconds', 'tiles_per_sec', 'megapixels_per_sec'}
+        """
+        self._check_writable()
+        files = list_image_files(folder_path)
+        print(f"📂 {len(files)}개 이미지 발견. 타일 모드(tile {tile_size}px, overlap {overlap:.0%})로 저장합니다...")
+
+        start = time.perf_counter()
+        hashes = IngestManifest().hash_files(folder_path, files, num_workers=max(num_workers, 1))
+        model_version = self.tile_model_version(tile_size)
+        loader = DataLoader(
+            TiledImageDataset(files, tile_size, overlap, self.image_size),
+            batch_size=batch_size,
+            num_workers=num_workers,
+            pin_memory=self.device.type == "cuda",
+            prefetch_factor=2 if num_workers > 0 else None,
+        )
+
+        rows, tiles, pixels = [], 0, 0
+        rebuild_pending = rebuild
+        for tile_batch, indices, boxes in loader:
+            vectors = self.embed_batch(tile_batch)
+            for index, (x, y, w, h), vector in zip(indices.tolist(), boxes.tolist(), vectors):
+                path = files[index]
+                rows.append(TileRow(os.path.basename(path), defect_type_of(path), vector, x, y, w, h,
+                                    hashes[path], model_version, os.path.abspath(path)))
+                pixels += w * h
+            tiles += len(vectors)
+            if len(rows) >= chunk_size:
+                self.store.add_tiles(rows, chunk_size=chunk_size, rebuild=rebuild_pending)
+                rows, rebuild_pending = [], False
+                print(f"   Saving... {tiles} tiles")
+        if rows or rebuild_pending:
+            self.store.add_tiles(rows, chunk_size=chunk_size, rebuild=rebuild_pending)
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            'images': len(files),
+            'tiles': tiles,
+            'seconds': elapsed,
+            'tiles_per_sec': tiles / elapsed if elapsed > 0 else 0.0,
+            'megapixels_per_sec': pixels / 1e6 / elapsed if elapsed > 0 else 0.0,
+        }
+        print(f"✅ 타일 저장 완료! ({len(files)}장 -> {tiles}개 타일, {elapsed:.1f}초, "
+              f"{stats['tiles_per_sec']:.2f} tiles/sec)")
+        return stats
+
+    def tile_model_version(self, tile_size):
+        return f"{self.model_name}/tile{tile_size}-resize{self.image_size}"
+
+    def search_tiles(self, query_img_path, top_k=5, verbose=True, **options):
+        """
+        질의 이미지(결함 크롭)와 가장 비슷한 타일 검색 -> [(defect_type, filename, similarity, id, x, y, w, h), ...]
+        어떤 이미지의 어느 위치(타일 좌표)가 맞았는지 함께 반환
+        """
         query_vector = self.get_embedding(query_img_path)
+        results = self.store.search_tiles(query_vector, top_k, **options)
+        if verbose:
+            print(f"\n🔍 {self.store.name} 타일 검색 결과 (Top {top_k} - 코사인 유사도 기준):")
+            print("-" * 90)
+            for defect_type, fname, sim, _, x, y, w, h in results:
+                print(f"   - [{defect_type}] {fname} @ (x={x}, y={y}, {w}x{h}) (유사도: {sim:.4f})")
+            print("-" * 90)
+        return results
 
-        with psycopg.connect(**self.db_info, autocommit=True) as conn:
-            register_vector(conn)
-            with conn.cursor() as cursor:
-                # =================================================================
-                # SQL 쿼리: 코사인 유사도(<=>)
-                # 1 - (embedding <=> query)를 통해 코사인 유사도(Cosine Similarity)를 계산
-                # 유사도가 높은 순으로 내림차순(DESC) 정렬
-                # =================================================================
-                cursor.execute("""
-                    SELECT defect_type, filename, 1 - (embedding <=> %s) as similarity
-                    FROM defect_images
-                    ORDER BY similarity DESC
-                    LIMIT %s
-                """, (query_vector, top_k))
-
-                results = cursor.fetchall()
+    def close(self):
+        self.store.close()
 
-        detailed_board = {}
-        print(f"\n🔍 PostgreSQL 검색 결과 (Top {top_k} - 코사인 유사도 기준):")
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def search(self, query_img_path, top_k=5, verbose=True, **options):
+        """
+        options: 백엔드별 검색 옵션 (PostgreSQL: ef_search, probes, exact, classes, cells)
+        """
+        query_vector = self.get_embedding(query_img_path)
+        results = self.search_vector(query_vector, top_k, **options)
+        return self._make_board(results, top_k, verbose)
+
+    def search_vector(self, query_vector, top_k=5, **options):
+        """
+        임베딩 벡터로 직접 검색 -> [(defect_type, filename, similarity, id), ...]
+        """
+        return self.store.search(query_vector, top_k, **options)
+
+    def search_many(self, query_img_paths, top_k=5, batch_size=32, num_workers=4, verbose=False, **options):
+        """
+        여러 질의 이미지를 한 번에 검색 -> 질의 순서대로 결함별 점수 집계표 목록
+        임베딩은 batch_size장씩 배치 추론하고, 모든 질의 벡터는 DB에 쿼리 1개(왕복 1회)로 보냄
+        """
+        paths, vectors = [], []
+        for batch_paths, batch_vectors in self.iter_embeddings(list(query_img_paths), batch_size, num_workers):
+            paths.extend(batch_paths)
+            vectors.extend(batch_vectors)
+        results = self.store.search_many(vectors, top_k, **options)
+        return [board for _, board in self._boards(paths, results, top_k, verbose)]
+
+    def iter_search_many(self, query_img_paths, top_k=5, batch_size=32, num_workers=4, verbose=False, **options):
+        """
+        search_many의 스트리밍 버전: (질의 경로, 집계표)를 질의 순서대로 하나씩 yield
+        배치 단위(batch_size개)로 DB에 보내며, 배치 i의 검색은 별도 스레드에서 돌고 그동안 배치 i+1을 임베딩함
+        """
+        query_img_paths = list(query_img_paths)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            in_flight = None
+            for paths, vectors in self.iter_embeddings(query_img_paths, batch_size, num_workers):
+                future = executor.submit(self.store.search_many, vectors, top_k, **options)
+                if in_flight is not None:
+                    yield from self._boards(in_flight[0], in_flight[1].result(), top_k, verbose)
+                in_flight = (paths, future)
+            if in_flight is not None:
+                yield from self._boards(in_flight[0], in_flight[1].result(), top_k, verbose)
+
+    def verdict(self, query_img_path, top_k=200, temperature=None, evidence=3, verbose=True, **options):
+        """
+        판정 모드: 결함 종류별 점수 집계를 저장소(PostgreSQL은 SQL)에서 수행하고 요약만 받음
+        temperature: None이면 유사도*100 합산 (search()의 판정과 같은 점수), 값이 있으면 softmax(sim / T) 가중 투표
+        evidence: 결함 종류마다 받을 근거 파일 수
+        반환값: [ClassVote(defect_type, score, votes, evidence), ...] (점수 내림차순, 첫 번째가 판정 결과)
+        """
+        query_vector = self.get_embedding(query_img_path)
+        votes = self.store.verdict_many([query_vector], top_k, temperature=temperature, evidence=evidence,
+                                        **options)[0]
+        if verbose:
+            self._print_votes(votes, top_k, temperature)
+        return votes
+
+    def verdict_many(self, query_img_paths, top_k=200, temperature=None, evidence=3, batch_size=32, num_workers=4,
+                     verbose=False, **options):
+        """
+        여러 질의 이미지의 판정 모드 -> 질의 순서대로 ClassVote 목록. 모든 질의를 쿼리 1개로 집계
+        """
+        paths, vectors = [], []
+        for batch_paths, batch_vectors in self.iter_embeddings(list(query_img_paths), batch_size, num_workers):
+            paths.extend(batch_paths)
+            vectors.extend(batch_vectors)
+        all_votes = self.store.verdict_many(vectors, top_k, temperature=temperature, evidence=evidence, **options)
+        if verbose:
+            for path, votes in zip(paths, all_votes):
+                print(f"\n📷 질의: {path}")
+                self._print_votes(votes, top_k, temperature)
+        return all_votes
+
+    def _print_votes(self, votes, top_k, temperature):
+        weighting = "유사도 합산" if temperature is None else f"softmax 가중 투표, T={temperature}"
+        print(f"\n🔍 {self.store.name} 판정 결과 (Top {top_k} 이웃, {weighting}):")
+        print("-" * 90)
+        if not votes:
+            print("✅ 최종 판정: 알 수 없음 (DB에 데이터가 없거나 검색 실패)")
+            return
+        for vote in votes:
+            print(f"   - [{vote.defect_type}] 점수: {vote.score:.4f} (이웃 {vote.votes}개)")
         print("-" * 90)
+        best = votes[0]
+        print(f"🏆 최종 판정: '{best.defect_type}'")
+        print(f"\n   📂 [{best.defect_type} 판정의 근거 데이터]")
+        for i, (fname, sim, _) in enumerate(best.evidence):
+            print(f"     {i + 1}. {fname} (유사도: {sim:.4f})")
+        print("\n" + "=" * 50)
+
+    def _boards(self, paths, results_list, top_k, verbose):
+        for path, results in zip(paths, results_list):
+            if verbose:
+                print(f"\n📷 질의: {path}")
+            yield path, self._make_board(results, top_k, verbose)
 
-        for defect_type, fname, sim in results:
+    def iter_embeddings(self, paths, batch_size=32, num_workers=4):
+        """
+        이미지를 batch_size개씩 임베딩 -> (경로 목록, 임베딩 목록)을 입력 순서대로 yield (DB에는 쓰지 않음)
+        임베딩 캐시에 있는 이미지는 모델을 건너뛰고, 나머지만 DataLoader 워커로 디코딩해 배치 추론
+        search_many/verdict_many 외에 재임베딩(reindex.py)과 벤치마크에서도 사용
+        """
+        cached, hashes = {}, {}
+        if self.embedding_cache is not None and paths:
+            with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+                hashes = dict(zip(paths, executor.map(file_sha256, paths)))
+            cached = self.embedding_cache.get_many(hashes.values(), self.cache_version)
+        missing = [path for path in paths if hashes.get(path) not in cached]
+
+        loader = None
+        if missing:
+            loader = iter(DataLoader(
+                DefectImageDataset(missing, self.transform),
+                batch_sampler=self._batch_plan(missing, batch_size, num_workers),
+                num_workers=num_workers,
+                pin_memory=self.device.type == "cuda",
+                prefetch_factor=2 if num_workers > 0 else None,
+            ))
+        # missing 인덱스 -> 계산된 임베딩 (aspect 모드는 버킷 순서로 계산되므로 입력 순서가 될 때까지 보관)
+        embedded = {}
+        next_missing = 0
+
+        for batch_paths in chunked(paths, batch_size):
+            vectors = []
+            for path in batch_paths:
+                if hashes.get(path) in cached:
+                    vectors.append(cached[hashes[path]])
+                    continue
+                while next_missing not in embedded:
+                    img_batch, indices = next(loader)
+                    new_vectors = self.embed_batch(img_batch)
+                    if self.embedding_cache is not None:
+                        self.embedding_cache.put_many(
+                            [(hashes[missing[index]], vector) for index, vector in zip(indices.tolist(), new_vectors)],
+                            self.cache_version,
+                        )
+                    embedded.update(zip(indices.tolist(), new_vectors))
+                vectors.append(embedded.pop(next_missing))
+                next_missing += 1
+            yield batch_paths, vectors
+
+    def _make_board(self, results, top_k, verbose=True):
+        """
+        results: (defect_type, filename, similarity, ...) 목록 -> 결함별 점수 집계표
+        """
+        log = print if verbose else (lambda *args, **kwargs: None)
+
+        detailed_board = {}
+        log(f"\n🔍 {self.store.name} 검색 결과 (Top {top_k} - 코사인 유사도 기준):")
+        log("-" * 90)
+
+        for defect_type, fname, sim, *_ in results:
             # =================================================================
             # 코사인 유사도는 -1 ~ 1 사이의 값이므로, 이를 100점 만점 척도로 변환
             # =================================================================
             score = sim * 100
-            print(f"   - [{defect_type}] {fname} (유사도: {sim:.4f}, 점수: {score:.2f}점)")
+            log(f"   - [{defect_type}] {fname} (유사도: {sim:.4f}, 점수: {score:.2f}점)")
 
             if defect_type not in detailed_board:
                 detailed_board[defect_type] = {'total_score': 0, 'files': []}
@@ -111,13 +851,13 @@ class DefectRAG_Postgres:
             detailed_board[defect_type]['total_score'] += score
             detailed_board[defect_type]['files'].append((fname, score))
 
-        print("-" * 90)
+        log("-" * 90)
 
         # =====================================================
         # 최종 판정 로직
         # =====================================================
         if not detailed_board:
-            print("✅ 최종 판정: 알 수 없음 (DB에 데이터가 없거나 검색 실패)")
+            log("✅ 최종 판정: 알 수 없음 (DB에 데이터가 없거나 검색 실패)")
         else:
             # 점수 합계가 가장 높은 결함 찾기
             sorted_defects = sorted(detailed_board.items(), key=lambda item: item[1]['total_score'], reverse=True)
@@ -125,13 +865,115 @@ class DefectRAG_Postgres:
             best_defect = sorted_defects[0][0]  # 1등 결함 이름
             best_data = sorted_defects[0][1]  # 1등 정보
 
-            print(f"🏆 최종 판정: '{best_defect}'")
-            print(f"   (이유: 코사인 유사도 점수 합계 {best_data['total_score']:.2f}점으로 1위)")
+            log(f"🏆 최종 판정: '{best_defect}'")
+            log(f"   (이유: 코사인 유사도 점수 합계 {best_data['total_score']:.2f}점으로 1위)")
 
-            print(f"\n   📂 [{best_defect} 판정의 근거 데이터]")
+            log(f"\n   📂 [{best_defect} 판정의 근거 데이터]")
             for i, (fname, score) in enumerate(best_data['files']):
-                print(f"     {i + 1}. {fname} (기여 점수: {score:.2f}점)")
+                log(f"     {i + 1}. {fname} (기여 점수: {score:.2f}점)")
+
+            log("\n" + "=" * 50)
+
+        return detailed_board
+
+
+class DefectRAG_Postgres(DefectRAG):
+    """
+    PostgreSQL + pgvector 백엔드를 쓰는 DefectRAG (기존 사용법 그대로)
+    """
 
-            print("\n" + "=" * 50)
+    def __init__(self, db_info, pool_size=4, pool_timeout=30.0, embedding_cache=None, weights_path=None,
+                 storage="float32", rerank_factor=4, projection=None, resize_mode="square", model_name="dinov2_vitl14",
+                 result_cache=None, runtime="eager"):
+        """
+        db_info: DB 접속 정보 딕셔너리
+        pool_size: 커넥션 풀 크기 (동시에 검색/저장할 수 있는 최대 세션 수)
+        pool_timeout: 풀에서 커넥션을 기다리는 최대 시간(초)
+        embedding_cache: embedding_cache.EmbeddingCache (선택)
+        result_cache: result_cache.ResultCache (선택). search()의 결과를 DB 세대 번호가 바뀔 때까지 재사용
+        runtime: 백본 실행 방식 ("eager", "trace", "compile", "onnx", "int8")
+        weights_path: DINOv2 가중치 파일 경로 (선택)
+        storage: ANN 인덱스/1차 검색 형식 ("float32", "halfvec", "bit"). halfvec/bit는 float32로 재정렬
+        rerank_factor: halfvec/bit에서 재정렬할 후보 수 = top_k * rerank_factor
+        projection: 검색에 쓸 PCA 사영 버전 태그 (projection.py fit으로 등록, 선택)
+        resize_mode: "square"(기본) 또는 "aspect"(비율 유지 + 토큰 격자별 배치)
+        model_name: DINOv2 백본 (defect_images를 새로 만들 때 이 모델의 차원으로 만듦)
+        """
+        self._init_start = time.perf_counter()
+        self.db_info = db_info
+        store = PostgresVectorStore(db_info, pool_size=pool_size, pool_timeout=pool_timeout,
+                                    storage=storage, rerank_factor=rerank_factor, projection=projection,
+                                    dim=backbone_dim(model_name))
+        super().__init__(store, embedding_cache=embedding_cache, weights_path=weights_path, resize_mode=resize_mode,
+                         model_name=model_name, runtime=runtime)
+        self.result_cache = result_cache
+
+    def search(self, query_img_path, top_k=5, verbose=True, **options):
+        """
+        result_cache가 있으면 (파일 내용 해시, 모델 버전, top_k, 필터/옵션, DB 세대 번호)가 같은 이전 결과를 그대로 사용
+        (임베딩 계산과 DB 검색 생략). 적재/삭제/인덱스 재생성/모델 전환이 있으면 세대 번호가 바뀌어 다시 검색
+        """
+        if self.result_cache is None:
+            return super().search(query_img_path, top_k, verbose, **options)
+
+        with open(query_img_path, 'rb') as f:
+            data = f.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+        key = ResultCache.make_key(content_hash, self.cache_version, top_k, options)
+        generation = self.store.generation()  # 검색보다 먼저 읽어야 결과가 이 세대보다 오래되지 않음
+        results = self.result_cache.get(key, generation)
+        if results is None:
+            results = self.search_vector(self._embed_bytes(data, content_hash), top_k, **options)
+            self.result_cache.put(key, generation, results)
+        return self._make_board(results, top_k, verbose)
+
+    @property
+    def pool(self):
+        return self.store.pool
+
+    def bulk_load(self, rows, chunk_size=5000, rebuild=False):
+        return self.store.add(rows, chunk_size=chunk_size, rebuild=rebuild)
+
+    @property
+    def storage(self):
+        return self.store.storage
 
-        return detailed_board
\ No newline at end of file
+    def create_index(self, *args, **kwargs):
+        return self.store.create_index(*args, **kwargs)
+
+    def drop_index(self):
+        return self.store.drop_index()
+
+    def index_info(self):
+        return self.store.index_info()
+
+    def build_prototypes(self, *args, **kwargs):
+        return self.store.build_prototypes(*args, **kwargs)
+
+    def pool_stats(self):
+        return self.store.pool_stats()
+
+    def check_pool(self):
+        return self.store.check_pool()
+
+
+class DefectRAG_Local(DefectRAG):
+    """
+    DB 서버 없이 로컬 파일(메모리 맵 행렬 + 메타데이터)에 저장하는 DefectRAG
+    """
+
+    def __init__(self, store_dir, dtype="float32", embedding_cache=None, weights_path=None, resize_mode="square",
+                 model_name="dinov2_vitl14", runtime="eager"):
+        """
+        store_dir: 저장소 폴더 (없으면 생성)
+        dtype: 임베딩 저장 정밀도 ("float16"이면 용량 절반)
+        embedding_cache: embedding_cache.EmbeddingCache (선택)
+        weights_path: DINOv2 가중치 파일 경로 (선택)
+        resize_mode: "square"(기본) 또는 "aspect"
+        model_name: DINOv2 백본 (저장소를 새로 만들 때 이 모델의 차원으로 만듦)
+        runtime: 백본 실행 방식 ("eager", "trace", "compile", "onnx", "int8")
+        """
+        self._init_start = time.perf_counter()
+        super().__init__(LocalVectorStore(store_dir, dim=backbone_dim(model_name), dtype=dtype),
+                         embedding_cache=embedding_cache, weights_path=weights_path, resize_mode=resize_mode,
+                         model_name=model_name, runtime=runtime)
@@ -0,0 +1,181 @@
+import argparse
+import os
+import time
+
+from vector_store import DefectRow
+
+
+class ReindexJob:
+    """
+    defect_images를 새 모델 버전(백본/전처리)으로 재임베딩하고 원자적으로 전환하는 백그라운드 작업
+        1. build  : 활성 테이블의 행을 id 순서로 chunk_size개씩 읽어 source_path 이미지를 새 모델로 임베딩 -> 그림자 테이블
+                    (그동안 검색/적재는 기존 버전으로 계속 동작. 중단해도 등록부의 last_id 다음 행부터 이어서 진행)
+        2. cutover: 그림자 테이블에 ANN 인덱스를 만들고, 그 사이 추가된 행을 마저 임베딩한 뒤 테이블 이름 교체로 전환
+                    (프로토타입이 있었다면 새 임베딩으로 다시 만듦)
+        3. gc     : 전환 전 테이블 삭제
+    진행 상황(처리 행 수, 초당 행 수, 남은 시간)은 등록부(defect_model_versions)에 기록 -> 다른 프로세스에서 status로 확인
+    원본 이미지(source_path)가 없는 행은 재임베딩할 수 없어 건너뛰며, 전환하면 사라짐 (rows_missing으로 보고)
+    """
+
+    def __init__(self, rag, chunk_size=1024, batch_size=32, num_workers=4, report_seconds=10.0):
+        """
+        rag: 새 모델 설정(model_name, resize_mode)으로 만든 DefectRAG_Postgres. rag.model_version이 새 버전 이름
+        chunk_size: 한 번에 읽어 임베딩하고 커밋할 행 수 (중단되면 최대 이만큼 다시 임베딩)
+        batch_size, num_workers: 임베딩 배치 크기와 DataLoader 워커 수
+        report_seconds: 진행 상황 출력 간격(초)
+        """
+        if rag.runtime == "int8":
+            raise ValueError("runtime='int8'은 검색 전용입니다. 재임베딩은 fp32 runtime(eager 등)으로 실행하세요.")
+        self.rag = rag
+        self.store = rag.store
+        self.version = rag.model_version
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.report_seconds = report_seconds
+
+    def build(self):
+        """
+        남은 행을 모두 재임베딩 -> {'rows', 'missing', 'seconds', 'rows_per_second'} (이번 실행에서 처리한 양)
+        """
+        state = self.store.begin_version(self.version, self.rag.embedding_dim)
+        last_id = state['last_id']
+        print(f"🔄 재임베딩 시작: {self.version} ({state['rows_done'] + state['rows_missing']}/{state['rows_total']}행 "
+              f"완료된 상태에서 이어서)")
+
+        start = last_report = time.perf_counter()
+        done = missing = 0
+        while True:
+            rows = self.store.pending_rows(last_id, self.chunk_size)
+            if not rows:
+                break
+            present = [row for row in rows if row[4] and os.path.exists(row[4])]
+            vectors = [vector for _, batch in self.rag.iter_embeddings(
+                [row[4] for row in present], self.batch_size, self.num_workers) for vector in batch]
+            new_rows = [(row_id, DefectRow(filename, defect_type, vector, content_hash, self.version, source_path,
+                                           *metadata))
+                        for (row_id, filename, defect_type, content_hash, source_path, *metadata), vector
+                        in zip(present, vectors)]
+
+            last_id = rows[-1][0]
+            done += len(new_rows)
+            missing += len(rows) - len(new_rows)
+            elapsed = time.perf_counter() - start
+            self.store.add_version_rows(self.version, new_rows, last_id, len(rows) - len(new_rows),
+                                        (done + missing) / elapsed)
+            if time.perf_counter() - last_report >= self.report_seconds:
+                self.report()
+                last_report = time.perf_counter()
+
+        seconds = time.perf_counter() - start
+        stats = {
+            'rows': done,
+            'missing': missing,
+            'seconds': seconds,
+            'rows_per_second': (done + missing) / seconds if seconds > 0 else 0.0,
+        }
+        print(f"✅ 재임베딩 완료: {done}행 (원본 없음 {missing}행), {seconds:.1f}초, "
+              f"{stats['rows_per_second']:.1f}행/초")
+        return stats
+
+    def cutover(self, attempts=5):
+        """
+        남은 행 재임베딩 -> ANN 인덱스 생성 -> 전환. 전환 직전에 새 행이 들어와 있으면 마저 임베딩 후 다시 시도
+        -> activate_version() 결과
+        """
+        self.build()
+        self.store.prepare_version(self.version)
+        for _ in range(attempts):
+            self.build()  # 인덱스를 만드는 동안 들어온 행
+            result = self.store.activate_version(self.version)
+            if result['activated']:
+                if result['cluster_size']:
+                    self.store.build_prototypes(result['cluster_size'], model_version=self.version)
+                return result
+            print(f"🔄 전환 직전에 새 행 {result['pending']}개가 들어와 마저 재임베딩 후 다시 시도합니다.")
+        raise RuntimeError(f"적재가 계속 들어와 {attempts}번 시도에도 전환하지 못했습니다: {self.version}")
+
+    def report(self):
+        state = self.store.versions(self.version)[0]
+        print_version(state)
+
+
+def print_version(state):
+    processed = state['rows_done'] + state['rows_missing']
+    total = state['rows_total'] or 0
+    line = f"   [{state['status']:<8}] {state['version']} ({state['dim']}차원, {state['table'] or '-'})"
+    if state['status'] == "building":
+        rate = state['rows_per_second'] or 0.0
+        eta = f"{state['eta_seconds']:.0f}초" if state['eta_seconds'] is not None else "-"
+        line += (f" {processed}/{total}행 ({processed / total if total else 0:.0%}), 원본 없음 {state['rows_missing']}행, "
+                 f"{rate:.1f}행/초, 남은 시간 {eta}")
+    elif state['activated_at'] is not None:
+        line += f" 전환 {state['activated_at']:%Y-%m-%d %H:%M:%S}"
+    print(line)
+
+
+if __name__ == "__main__":
+    from embedding_cache import EmbeddingCache
+    from rag_core import DefectRAG_Postgres
+    from vector_store import PostgresVectorStore
+
+    # ★ build_db.py와 동일한 DB 접속 정보 ★
+    DB_CONFIG = {
+        "host": "localhost",
+        "port": "5432",
+        "dbname": "postgres",
+        "user": "postgres",
+        "password": "3510"
+    }
+
+    # 임베딩 캐시 파일 (build_db.py, search.py와 같은 파일을 사용)
+    CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3")
+
+    parser = argparse.ArgumentParser(description="새 모델 버전으로 재임베딩 -> 원자적 전환 -> 이전 버전 정리")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in [("build", "새 모델로 그림자 테이블을 채움 (검색은 기존 버전으로 계속)"),
+                            ("cutover", "남은 행을 채우고 새 버전으로 전환")]:
+        command_parser = subparsers.add_parser(name, help=help_text)
+        command_parser.add_argument("--model-name", required=True, help="예: dinov2_vitb14_reg")
+        command_parser.add_argument("--resize-mode", choices=["square", "aspect"], default="square")
+        command_parser.add_argument("--weights-path", default=None)
+        command_parser.add_argument("--chunk-size", type=int, default=1024)
+        command_parser.add_argument("--batch-size", type=int, default=32)
+        command_parser.add_argument("--num-workers", type=int, default=4)
+        command_parser.add_argument("--no-cache", action="store_true", help="임베딩 캐시를 쓰지 않음")
+    subparsers.choices["cutover"].add_argument("--gc", action="store_true", help="전환 후 이전 버전 테이블을 바로 삭제")
+
+    subparsers.add_parser("status", help="모델 버전 목록과 재임베딩 진행 상황")
+    subparsers.add_parser("gc", help="전환 전 테이블 삭제")
+    abort_parser = subparsers.add_parser("abort", help="재임베딩 취소 (그림자 테이블 삭제)")
+    abort_parser.add_argument("version")
+
+    args = parser.parse_args()
+    if args.command in ("build", "cutover"):
+        cache = None if args.no_cache else EmbeddingCache(CACHE_PATH)
+        with DefectRAG_Postgres(DB_CONFIG, pool_size=1, embedding_cache=cache, weights_path=args.weights_path,
+                                resize_mode=args.resize_mode, model_name=args.model_name) as rag:
+            job = ReindexJob(rag, args.chunk_size, args.batch_size, args.num_workers)
+            if args.command == "build":
+                job.build()
+                job.report()
+            else:
+                job.cutover()
+                if args.gc:
+                    rag.store.gc_versions()
+    else:
+        store = PostgresVectorStore(DB_CONFIG, pool_size=1)
+        try:
+            if args.command == "status":
+                print("\n📊 [모델 버전] 검색은 active 버전의 defect_images에서 수행")
+                print("-" * 100)
+                for state in store.versions():
+                    print_version(state)
+                print("-" * 100)
+            elif args.command == "gc":
+                store.gc_versions()
+            elif args.command == "abort":
+                store.abort_version(args.version)
+        finally:
+            store.close()
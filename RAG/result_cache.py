@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+
+from vector_store import normalize_filters
+
+
+def _freeze(value):
+    # 검색 옵션 -> 딕셔너리 키로 쓸 수 있는 값 (dict/list는 정렬된 튜플로)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class ResultCache:
+    """
+    메모리 질의 결과 캐시 (LRU, 프로세스 안에서만 유지)
+    키: (질의 이미지 파일 내용 해시, 모델 버전(모델 + 전처리), top_k, 필터/검색 옵션, DB 세대 번호)
+    DB 세대 번호는 적재/삭제/인덱스 재생성/모델 전환 때마다 증가하므로 (vector_store.BUMP_GENERATION_SQL),
+    번호가 바뀌면 이전 결과를 모두 버림 -> 바뀐 DB로는 다시 검색 (오래된 판정을 돌려주지 않음)
+
+    같은 이미지를 반복 질의하면 임베딩 계산과 DB 검색을 모두 건너뜀 (EmbeddingCache는 임베딩 계산만 건너뜀)
+    """
+
+    def __init__(self, max_entries=1024):
+        """
+        max_entries: 보관할 최대 결과 수 (넘으면 가장 오래 안 쓴 결과부터 삭제)
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0  # 세대 번호가 바뀌어 전체를 비운 횟수
+        self.generation = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(content_hash, model_version, top_k, options):
+        """
+        model_version: 질의 임베딩을 만든 모델 + 전처리 식별자 (DefectRAG.cache_version)
+                       resize_mode나 모델이 바뀌면 같은 이미지라도 임베딩이 달라지므로 다른 키
+        options: 검색 옵션 (filters는 normalize_filters로 정규화해서 {"line": "L1"}과 {"line": ["L1"]}이 같은 키)
+        """
+        options = dict(options)
+        if "filters" in options:
+            options["filters"] = normalize_filters(options["filters"])
+        return content_hash, model_version, top_k, _freeze(options)
+
+    def _check_generation(self, generation):
+        """
+        세대 번호가 올라갔으면 이전 결과를 비움 -> 이 세대의 결과를 써도 되는지
+        (다른 스레드가 이미 더 새 세대를 봤다면, 그 전에 읽은 세대 번호로는 조회/저장하지 않음)
+        """
+        if self.generation is not None and generation < self.generation:
+            return False
+        if generation != self.generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.generation = generation
+        return True
+
+    def get(self, key, generation):
+        """
+        -> 저장된 검색 결과(목록 복사본) 또는 None
+        """
+        with self._lock:
+            results = self._entries.get(key) if self._check_generation(generation) else None
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(results)
+
+    def put(self, key, generation, results):
+        with self._lock:
+            if not self._check_generation(generation):
+                return
+            self._entries[key] = list(results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "generation": self.generation,
+            }
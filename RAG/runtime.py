@@ -0,0 +1,236 @@
+import hashlib
+import inspect
+import os
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+import torch
+
+RUNTIMES = ("eager", "trace", "compile", "onnx", "int8")
+
+
+# =================================================================
+# CPU 추론용 백본 실행 방식 (DefectRAG(runtime=...)로 선택)
+#   eager   : DinoVisionTransformer를 그대로 실행 (기존 방식)
+#   trace   : TorchScript trace -> freeze -> optimize_for_inference (상수 접기, 연산 융합)
+#   compile : torch.compile (inductor). C++ 컴파일러가 필요하고 첫 호출의 컴파일이 오래 걸림
+#   onnx    : 배치 축만 동적인 ONNX로 내보내 onnxruntime(CPUExecutionProvider)으로 실행 (onnxruntime 필요)
+#   int8    : Attention(qkv, proj)과 Mlp/SwiGLUFFN의 Linear를 동적 int8로 양자화 (CPU 전용, 근사값)
+#             그래프를 만들지 않으므로 격자와 무관. 정확도는 quantize.py report로 fp32와 비교
+# 위치 임베딩 보간이 입력 해상도에 고정되므로 그래프는 토큰 격자(H, W)마다 1개씩 만들어 재사용
+# (square 모드는 518x518 1개, aspect 모드는 격자별로 첫 배치 때 생성). 배치 크기는 그래프와 무관
+# =================================================================
+
+class ClsEmbedding(torch.nn.Module):
+    """
+    model(x) -> CLS 임베딩만 입력 1개로 감싼 모듈 (forward(*args, **kwargs)의 masks 등이 그래프 입력이 되지 않도록)
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x)
+
+
+class BackboneRuntime:
+    """
+    DINOv2 백본을 격자별 그래프로 실행하는 래퍼. DefectRAG.model 자리에 그대로 들어감
+        runtime(x) -> CLS 임베딩 (eager 모델과 같은 값)
+        forward_features, patch_size 등 나머지 속성은 eager 모델로 위임 (패치 토큰은 eager로 계산)
+    그래프를 만들 때 eager 출력과 코사인 유사도를 비교해서, 만들기에 실패하거나 값이 다르면 그 격자는 eager로 실행
+    """
+
+    name = "eager"
+
+    def __init__(self, model, min_cosine=0.999):
+        """
+        model: eval() 상태의 DinoVisionTransformer
+        min_cosine: 그래프 출력과 eager 출력의 최소 코사인 유사도 (이보다 낮으면 그 격자는 eager 사용)
+        """
+        self.model = model
+        self.module = ClsEmbedding(model).eval()
+        self.min_cosine = min_cosine
+        self.build_seconds = {}  # 격자 -> 그래프 생성(내보내기/컴파일 + 첫 실행) 시간
+        self.fallbacks = {}  # 격자 -> eager로 대체한 이유 (생성 실패 / 출력 불일치)
+        self._graphs = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # __init__에서 만든 속성이 아니면 eager 모델의 속성 (forward_features, patch_size, embed_dim 등)
+        return getattr(self.__dict__["model"], name)
+
+    def __call__(self, x):
+        grid = tuple(x.shape[2:])
+        graph = self._graphs.get(grid)
+        if graph is None:
+            with self._lock:
+                graph = self._graphs.get(grid)
+                if graph is None:
+                    graph = self._graphs[grid] = self._prepare(x)
+        with torch.no_grad():
+            if graph is self.model:
+                return self.model(x)
+            return self._run(graph, x)
+
+    def _prepare(self, x):
+        start = time.perf_counter()
+        try:
+            with torch.no_grad():
+                graph = self._build(x)
+                expected = self.model(x)
+                actual = self._run(graph, x)
+            cosine = torch.nn.functional.cosine_similarity(actual.float(), expected.float(), dim=1).min().item()
+        except Exception as e:
+            self.fallbacks[tuple(x.shape[2:])] = f"그래프 생성 실패: {type(e).__name__}: {e}"
+            print(f"⚠️ {self.name} 그래프 생성 실패 ({x.shape[2]}x{x.shape[3]}), eager로 실행합니다: {e}")
+            return self.model
+        grid = tuple(x.shape[2:])
+        self.build_seconds[grid] = time.perf_counter() - start
+        if cosine < self.min_cosine:
+            self.fallbacks[grid] = f"eager와 출력이 다름 (코사인 {cosine:.6f})"
+            print(f"⚠️ {self.name} 그래프 출력이 eager와 다릅니다 (코사인 {cosine:.6f}), eager로 실행합니다.")
+            return self.model
+        print(f"🔧 {self.name} 그래프 준비 완료 ({grid[0]}x{grid[1]}, {self.build_seconds[grid]:.1f}초, "
+              f"eager 대비 코사인 {cosine:.6f})")
+        return graph
+
+    def _build(self, x):
+        raise NotImplementedError
+
+    def _run(self, graph, x):
+        return graph(x)
+
+
+class TracedBackbone(BackboneRuntime):
+    name = "trace"
+
+    def _build(self, x):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", torch.jit.TracerWarning)  # 격자 크기가 상수로 고정된다는 경고 (의도한 동작)
+            traced = torch.jit.trace(self.module, x, check_trace=False)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+
+class CompiledBackbone(BackboneRuntime):
+    name = "compile"
+
+    def _build(self, x):
+        # 격자마다 고정 shape로 컴파일 (배치 크기가 바뀌면 torch.compile이 다시 컴파일)
+        return torch.compile(self.module, dynamic=False)
+
+
+class OnnxBackbone(BackboneRuntime):
+    """
+    격자마다 ONNX 파일({cache_dir}/{tag}_{H}x{W}.onnx)을 1번 내보내고, 이후에는 파일을 바로 열어서 사용
+    tag: 모델/가중치 식별자 (가중치가 바뀌면 다른 파일을 쓰도록, 보통 weights_tag(가중치 파일)). None이면 파라미터 해시
+    """
+
+    name = "onnx"
+
+    def __init__(self, model, min_cosine=0.999, cache_dir=None, tag=None, num_threads=None):
+        super().__init__(model, min_cosine)
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("runtime='onnx'는 onnxruntime이 필요합니다. (pip install onnx onnxruntime)")
+        self._onnxruntime = onnxruntime
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "defect_rag_onnx")
+        self.tag = tag or state_dict_tag(model)
+        self.num_threads = num_threads or torch.get_num_threads()
+
+    def _build(self, x):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{self.tag}_{x.shape[2]}x{x.shape[3]}.onnx")
+        if not os.path.exists(path):
+            tmp_path = path + ".tmp"
+            # torch 2.5 이상은 dynamo 내보내기가 생겨서 TorchScript 방식을 명시 (requirements의 torch 2.0에는 인자 자체가 없음)
+            options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", torch.jit.TracerWarning)
+                torch.onnx.export(
+                    self.module, (x[:1].cpu(),), tmp_path, input_names=["pixels"], output_names=["embedding"],
+                    dynamic_axes={"pixels": {0: "batch"}, "embedding": {0: "batch"}}, opset_version=17,
+                    **options,
+                )
+            os.replace(tmp_path, path)
+        options = self._onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        return self._onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def _run(self, session, x):
+        output = session.run(None, {"pixels": x.detach().cpu().numpy()})[0]
+        return torch.from_numpy(output).to(x.device)
+
+
+def weights_tag(path):
+    """
+    가중치 파일 -> 짧은 식별자 (ONNX 파일 이름, int8 보정 파일 확인용). 절대 경로 + 크기 + 수정 시각의 sha1 앞 12자리
+    파일 내용을 읽지 않으므로 모델을 로드할 때마다 계산해도 비용이 없음 (파일을 바꾸면 크기/수정 시각이 달라져 새 태그)
+    """
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def state_dict_tag(model):
+    """
+    모델 파라미터 값 전체의 sha1 앞 12자리 (가중치 파일을 모를 때만 사용. 큰 모델은 수 초 걸림)
+    """
+    digest = hashlib.sha1()
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode("utf-8"))
+        digest.update(np.ascontiguousarray(tensor.detach().cpu().numpy()).tobytes())
+    return digest.hexdigest()[:12]
+
+
+def quantizable_linears(model):
+    """
+    동적 int8 양자화 대상 Linear 이름 목록 (블록 순서) -> ["blocks.0.attn.qkv", "blocks.0.attn.proj", "blocks.0.mlp.fc1", ...]
+    Attention의 qkv/proj, Mlp의 fc1/fc2, SwiGLUFFN의 w12/w3 (xFormers 융합 SwiGLU는 가중치를 직접 읽으므로 제외)
+    """
+    from dinov2.layers import Attention, Mlp, SwiGLUFFN, SwiGLUFFNAligned  # 모델을 만들 때 이미 import됨
+
+    names = []
+    for name, module in model.named_modules():
+        if isinstance(module, (Attention, Mlp, SwiGLUFFN, SwiGLUFFNAligned)):
+            names.extend(f"{name}.{child_name}" for child_name, child in module.named_children()
+                         if isinstance(child, torch.nn.Linear))
+    return names
+
+
+def quantize_int8(model, skip=()):
+    """
+    동적 int8 양자화한 모델 복사본 (원본 model은 그대로). 보정 데이터 없이 바로 사용 가능
+    가중치는 출력 채널별 int8, 활성값은 호출할 때마다 배치 범위로 int8 변환 -> CPU에서 Linear 연산량/메모리 대역폭 감소
+    skip: fp32로 남길 블록/Linear 이름 (예: ["blocks.23"]). quantize.py calibrate가 민감한 블록을 골라 둠
+    """
+    from torch.ao.quantization import per_channel_dynamic_qconfig, quantize_dynamic
+
+    targets = [name for name in quantizable_linears(model)
+               if not any(name == prefix or name.startswith(prefix + ".") for prefix in skip)]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # torch.ao.quantization 이전 예정 안내
+        return quantize_dynamic(model, {name: per_channel_dynamic_qconfig for name in targets}, dtype=torch.qint8)
+
+
+def make_runtime(runtime, model, **options):
+    """
+    runtime 이름 -> 실행 래퍼. "eager"는 model을 그대로 돌려줌 (래퍼 없음), "int8"은 양자화한 모델 복사본
+    options: OnnxBackbone의 cache_dir, tag, num_threads 등 / int8의 skip
+    """
+    if runtime == "eager":
+        return model
+    if runtime == "trace":
+        return TracedBackbone(model)
+    if runtime == "compile":
+        return CompiledBackbone(model)
+    if runtime == "onnx":
+        return OnnxBackbone(model, **options)
+    if runtime == "int8":
+        return quantize_int8(model, **options)
+    raise ValueError(f"지원하지 않는 runtime입니다: {runtime} ({', '.join(RUNTIMES)})")
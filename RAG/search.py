@@ -1,4 +1,7 @@
 from rag_core import DefectRAG_Postgres  # Postgres를 불러옵니다.
+from embedding_cache import EmbeddingCache
+from result_cache import ResultCache
+from filename_index import FilenameIndex
 import os
 import sys
 
@@ -11,6 +14,13 @@ DB_CONFIG = {
     "password": "3510"  # 설정하신 비밀번호
 }
 
+# 임베딩 캐시 파일 (build_db.py와 같은 파일을 사용)
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3")
+
+
+# 폴더별 파일 이름 색인 (처음 질문할 때 1번 만들고, 이후에는 추가/삭제된 파일만 반영)
+_FILENAME_INDEXES = {}
+
 
 def find_file_fuzzy(user_input, folder_path):
     """
@@ -20,32 +30,17 @@ def find_file_fuzzy(user_input, folder_path):
     if not os.path.exists(folder_path):
         return None, "폴더를 찾을 수 없습니다."
 
-    all_files = os.listdir(folder_path)
+    index = _FILENAME_INDEXES.get(folder_path)
+    if index is None:
+        index = _FILENAME_INDEXES[folder_path] = FilenameIndex(folder_path)
 
     # 특수문자 제거 및 단어 분리
     clean_input = user_input.replace("'", "").replace('"', "").replace("?", "").replace("!", "")
     words = clean_input.split()
 
-    candidate = None
-
-    for file in all_files:
-        # (1) 정확히 일치하는 경우
-        if file in words:
-            candidate = file
-            break
-
-        # (2) 확장자 떼고 비교 (예: 사용자가 "img_01"이라고만 했을 때 "img_01.png" 찾기)
-        filename_no_ext = os.path.splitext(file)[0]
-        for word in words:
-            if word == filename_no_ext:
-                candidate = file
-                break
-            # 너무 짧은 단어(4글자 이하)는 오탐지 방지를 위해 제외
-            if len(word) > 4 and word in filename_no_ext:
-                candidate = file
-                break
-
-        if candidate: break
+    # (1) 정확히 일치 -> (2) 확장자 떼고 일치 (예: "img_01" -> "img_01.png")
+    # -> (3) 확장자 뗀 이름에 포함 (너무 짧은 단어(4글자 이하)는 오탐지 방지를 위해 제외)
+    candidate = index.resolve(words)
 
     if candidate:
         return os.path.join(folder_path, candidate), candidate
@@ -56,7 +51,10 @@ def find_file_fuzzy(user_input, folder_path):
 if __name__ == "__main__":
     # 1. 시스템 로딩 (DB 연결)
     try:
-        rag = DefectRAG_Postgres(DB_CONFIG)
+        # 같은 이미지를 반복 질의하면 모델을 다시 돌리지 않도록 임베딩 캐시 사용 (build_db.py와 공유)
+        # 결과 캐시: DB가 바뀌지 않았으면 같은 이미지/필터의 이전 검색 결과를 그대로 보여줌 (DB 검색도 생략)
+        rag = DefectRAG_Postgres(DB_CONFIG, embedding_cache=EmbeddingCache(CACHE_PATH),
+                                 result_cache=ResultCache(max_entries=1024))
     except Exception as e:
         print(f"❌ DB 연결 실패: {e}")
         sys.exit()
@@ -64,11 +62,15 @@ if __name__ == "__main__":
     # 2. 검사 대상 폴더 (검색할 이미지가 들어있는 폴더)
     target_folder = r"C:\Users\hjchung\Desktop\RAG Test"
 
+    # 검색 범위 (예: {"line": "L1", "capture_date": ("2024-05-01", None)}). None이면 DB 전체에서 검색
+    search_filters = None
+
     print("\n" + "=" * 50)
     print("🤖 PostgreSQL 기반 AI 결함 판별 챗봇 준비 완료!")
     print(f"📂 대상 폴더: {os.path.basename(target_folder)}")
     print("💡 사용법: 파일명을 포함하여 질문해 주세요.")
     print("   예시: '[000001]R3xC10' 이미지 결함 종류가 뭐야?")
+    print("📊 'stats' 또는 '통계'를 입력하면 결과 캐시 적중률을 보여줍니다.")
     print("❌ 종료하려면 'exit' 또는 '종료'라고 입력하세요.")
     print("=" * 50 + "\n")
 
@@ -83,13 +85,21 @@ if __name__ == "__main__":
         if not user_query.strip():
             continue
 
+        if user_query.strip().lower() in ["stats", "통계"]:
+            stats = rag.result_cache.stats()
+            print(f"📊 결과 캐시: 적중 {stats['hits']}회, 실패 {stats['misses']}회 (적중률 {stats['hit_rate']:.0%}), "
+                  f"보관 {stats['entries']}/{stats['max_entries']}개, DB 세대 {stats['generation']} "
+                  f"(변경으로 비운 횟수 {stats['invalidations']})")
+            print("-" * 30)
+            continue
+
         # 질문에서 파일명 찾기
         found_path, filename = find_file_fuzzy(user_query, target_folder)
 
         if found_path:
             print(f"🤖 아하! '{filename}' 파일을 분석할게요.")
             # DB 검색 실행
-            rag.search(found_path)
+            rag.search(found_path, filters=search_filters)
             print("-" * 30)
         else:
             print("🤖 죄송해요. 문장에서 파일 이름을 찾을 수 없거나, 폴더에 없는 파일입니다.")
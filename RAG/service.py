@@ -0,0 +1,436 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+import torch
+from PIL import Image
+
+from embedding_cache import EmbeddingCache
+from rag_core import DefectRAG_Postgres
+from runtime import RUNTIMES
+from vector_store import normalize_filters
+
+# ★ build_db.py와 동일한 DB 접속 정보 ★
+DB_CONFIG = {
+    "host": "localhost",
+    "port": "5432",
+    "dbname": "postgres",
+    "user": "postgres",
+    "password": "3510"
+}
+
+# 임베딩 캐시 파일 (build_db.py, search.py와 같은 파일을 사용)
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3")
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+# /search, /verdict 요청의 options로 받는 검색 옵션 (PostgresVectorStore.search_many 인자)
+SEARCH_OPTIONS = ("ef_search", "probes", "exact", "shortlist", "classes", "cells", "filters")
+
+
+class MicroBatcher:
+    """
+    동시에 들어온 요청을 모아서 한 번에 처리 (dynamic micro-batching)
+    첫 요청이 들어오면 최대 max_wait_ms 동안 max_batch_size개까지 모은 뒤, handler(items)를 전용 스레드 1개에서 실행
+    handler가 돌고 있는 동안 쌓인 요청은 다음 배치로 바로 묶이므로, 부하가 높을수록 배치가 커짐
+    """
+
+    def __init__(self, name, handler, max_batch_size=32, max_wait_ms=10.0):
+        """
+        handler: 항목 목록 -> 같은 순서의 결과 목록 (스레드에서 실행되는 동기 함수)
+                 일부 항목만 실패하면 그 자리에 예외 객체를 넣어서 반환 -> 그 요청만 실패 (나머지는 정상 응답)
+                 handler 자체가 예외를 던지면 배치의 모든 요청이 실패
+        """
+        self.name = name
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"batch-{name}")
+        self.queue = None
+        self._task = None
+
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.batch_sizes = deque(maxlen=1000)
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self.handler, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if future.done():  # 클라이언트가 끊겨 취소된 요청은 건너뜀
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            self.busy_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.items += len(batch)
+            self.batch_sizes.append(len(batch))
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "recent_mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            "busy_seconds": self.busy_seconds,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+
+def _group_calls(items, call):
+    """
+    items: [(벡터, 옵션 키, 옵션 딕셔너리), ...] -> 같은 옵션끼리 call(벡터 목록, 옵션)을 1번씩 호출해 원래 순서로 결과 반환
+    한 옵션 그룹의 호출이 실패하면 그 그룹 자리에만 예외 객체를 넣음 (다른 클라이언트의 요청은 영향 없음)
+    """
+    results = [None] * len(items)
+    groups = {}
+    for index, (vector, key, options) in enumerate(items):
+        groups.setdefault(key, (options, [], []))
+        groups[key][1].append(index)
+        groups[key][2].append(vector)
+    for options, indices, vectors in groups.values():
+        try:
+            group_results = call(vectors, options)
+        except Exception as e:
+            group_results = [e] * len(indices)
+        for index, result in zip(indices, group_results):
+            results[index] = result
+    return results
+
+
+def _check_int(value, name, minimum=1):
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f"{name}은(는) {minimum} 이상의 정수여야 합니다: {value!r}")
+    return value
+
+
+def _check_options(options):
+    """
+    요청의 검색 옵션 검사 (배치에 넣기 전에 거절해서 잘못된 요청이 다른 요청과 같은 쿼리로 묶이지 않도록)
+    잘못된 옵션이면 ValueError -> 400
+    """
+    if not isinstance(options, dict):
+        raise ValueError(f"options는 JSON 객체여야 합니다: {options!r}")
+    unknown = sorted(set(options) - set(SEARCH_OPTIONS))
+    if unknown:
+        raise ValueError(f"지원하지 않는 옵션입니다: {', '.join(unknown)} ({', '.join(SEARCH_OPTIONS)})")
+    for name, value in options.items():
+        if value is None:
+            continue
+        if name == "exact":
+            if not isinstance(value, bool):
+                raise ValueError(f"exact는 true/false여야 합니다: {value!r}")
+        elif name == "filters":
+            if not isinstance(value, dict):
+                raise ValueError(f"filters는 JSON 객체여야 합니다: {value!r}")
+            normalize_filters(value)  # 지원하지 않는 필터 이름, 날짜 형식 확인
+        else:
+            _check_int(value, name)
+    return dict(options)
+
+
+class InferenceService:
+    """
+    DefectRAG를 감싼 로컬 asyncio HTTP 서비스 (JSON 요청/응답, HTTP/1.1 keep-alive)
+        POST /embed   {"path": 이미지 경로} 또는 {"image": base64 이미지}     -> {"embedding": [...]}
+        POST /search  {..., "top_k": 5, "options": {"ef_search": 80, "filters": {"line": "L1"}, ...}}
+                                                                              -> {"results": [...]}
+        POST /verdict {..., "top_k": 200, "temperature": null, "evidence": 3}  -> {"votes": [...]}
+        GET  /metrics -> 배치 큐 깊이, 배치 크기, 엔드포인트별 요청 수/지연시간
+        GET  /health
+    이미지 디코딩/전처리는 스레드 풀에서 요청마다 병렬로, 모델 추론과 DB 검색은 각각 MicroBatcher로 묶어서 실행
+    모델은 서비스 시작 때 1번만 로드
+    """
+
+    def __init__(self, rag, max_batch_size=32, max_wait_ms=10.0, db_batch_size=64, db_max_wait_ms=2.0,
+                 decode_workers=4):
+        """
+        rag: DefectRAG (모델/저장소/임베딩 캐시 공유)
+        max_batch_size, max_wait_ms: 모델 추론 배치 최대 크기와 첫 요청 이후 최대 대기 시간
+        db_batch_size, db_max_wait_ms: 검색/판정 쿼리 배치 (질의 여러 개를 쿼리 1개로 보냄)
+        decode_workers: 이미지 디코딩/전처리 스레드 수
+        """
+        self.rag = rag
+        self.decode_executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+        self.embedder = MicroBatcher("embed", self._embed_items, max_batch_size, max_wait_ms)
+        self.searcher = MicroBatcher("search", self._search_items, db_batch_size, db_max_wait_ms)
+        self.verdicter = MicroBatcher("verdict", self._verdict_items, db_batch_size, db_max_wait_ms)
+        self.routes = {
+            ("POST", "/embed"): self.handle_embed,
+            ("POST", "/search"): self.handle_search,
+            ("POST", "/verdict"): self.handle_verdict,
+            ("GET", "/metrics"): self.handle_metrics,
+            ("GET", "/health"): self.handle_health,
+        }
+        self.in_flight = 0
+        self.requests = {}
+        self.errors = {}
+        self.latencies = {}
+        self.cache_hits = 0
+        self.started_at = None
+
+    # =================================================================
+    # 배치 처리 (MicroBatcher 전용 스레드에서 실행)
+    # =================================================================
+    def _embed_items(self, items):
+        # aspect 모드에서는 이미지마다 크기가 다를 수 있으므로 같은 크기(토큰 격자)끼리 묶어서 추론
+        vectors = [None] * len(items)
+        by_shape = {}
+        for index, (_, tensor) in enumerate(items):
+            by_shape.setdefault(tuple(tensor.shape), []).append(index)
+        for indices in by_shape.values():
+            for index, vector in zip(indices, self.rag.embed_batch(torch.stack([items[i][1] for i in indices]))):
+                vectors[index] = vector
+        if self.rag.embedding_cache is not None:
+            self.rag.embedding_cache.put_many(
+                [(content_hash, vector) for (content_hash, _), vector in zip(items, vectors)],
+                self.rag.cache_version,
+            )
+        return vectors
+
+    def _search_items(self, items):
+        return _group_calls(items, lambda vectors, options: self.rag.store.search_many(vectors, **options))
+
+    def _verdict_items(self, items):
+        return _group_calls(items, lambda vectors, options: self.rag.store.verdict_many(vectors, **options))
+
+    # =================================================================
+    # 요청 처리
+    # =================================================================
+    def _prepare(self, payload):
+        """
+        (디코딩 스레드) 요청 이미지 -> (content_hash, 캐시된 임베딩) 또는 (content_hash, 전처리된 텐서)
+        """
+        if "path" in payload:
+            with open(payload["path"], "rb") as f:
+                data = f.read()
+        elif "image" in payload:
+            data = base64.b64decode(payload["image"])
+        else:
+            raise ValueError("'path' 또는 'image'(base64) 중 하나가 필요합니다.")
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        if self.rag.embedding_cache is not None:
+            vector = self.rag.embedding_cache.get(content_hash, self.rag.cache_version)
+            if vector is not None:
+                return content_hash, vector
+        img = Image.open(io.BytesIO(data)).convert('RGB')
+        return content_hash, self.rag.transform(img)
+
+    async def embed(self, payload):
+        loop = asyncio.get_running_loop()
+        content_hash, prepared = await loop.run_in_executor(self.decode_executor, self._prepare, payload)
+        if isinstance(prepared, np.ndarray):
+            self.cache_hits += 1
+            return prepared
+        return await self.embedder.submit((content_hash, prepared))
+
+    async def handle_embed(self, payload):
+        vector = await self.embed(payload)
+        return {"embedding": vector.tolist(), "model_version": self.rag.model_version}
+
+    async def handle_search(self, payload):
+        options = dict(_check_options(payload.get("options") or {}),
+                       top_k=_check_int(payload.get("top_k", 5), "top_k"))
+        vector = await self.embed(payload)
+        rows = await self.searcher.submit((vector, json.dumps(options, sort_keys=True), options))
+        return {"results": [{"defect_type": defect_type, "filename": filename, "similarity": float(sim), "id": row_id}
+                            for defect_type, filename, sim, row_id, *_ in rows]}
+
+    async def handle_verdict(self, payload):
+        temperature = payload.get("temperature")
+        if temperature is not None and (isinstance(temperature, bool) or not isinstance(temperature, (int, float))
+                                        or temperature <= 0):
+            raise ValueError(f"temperature는 양수 또는 null이어야 합니다: {temperature!r}")
+        options = dict(_check_options(payload.get("options") or {}),
+                       top_k=_check_int(payload.get("top_k", 200), "top_k"), temperature=temperature,
+                       evidence=_check_int(payload.get("evidence", 3), "evidence", minimum=0))
+        vector = await self.embed(payload)
+        votes = await self.verdicter.submit((vector, json.dumps(options, sort_keys=True), options))
+        return {"votes": [{"defect_type": vote.defect_type, "score": float(vote.score), "votes": vote.votes,
+                           "evidence": [{"filename": filename, "similarity": float(sim), "id": row_id}
+                                        for filename, sim, row_id in vote.evidence]}
+                          for vote in votes]}
+
+    async def handle_metrics(self, payload):
+        endpoints = {}
+        for path, count in self.requests.items():
+            latencies_ms = np.array(self.latencies[path]) * 1000
+            endpoints[path] = {
+                "requests": count,
+                "errors": self.errors.get(path, 0),
+                "p50_ms": float(np.percentile(latencies_ms, 50)),
+                "p99_ms": float(np.percentile(latencies_ms, 99)),
+            }
+        return {
+            "uptime_seconds": time.perf_counter() - self.started_at,
+            "in_flight": self.in_flight,
+            "cache_hits": self.cache_hits,
+            "batchers": {batcher.name: batcher.stats() for batcher in (self.embedder, self.searcher, self.verdicter)},
+            "endpoints": endpoints,
+        }
+
+    async def handle_health(self, payload):
+        return {"status": "ok", "model_version": self.rag.model_version, "store": self.rag.store.name}
+
+    async def dispatch(self, method, path, body):
+        """
+        -> (HTTP 상태 코드, 응답 JSON). 요청 수/오류 수/지연시간(최근 10000개)을 경로별로 기록
+        """
+        handler = self.routes.get((method, path))
+        if handler is None:
+            return 404, {"error": f"{method} {path} 없음"}
+
+        start = time.perf_counter()
+        self.in_flight += 1
+        try:
+            payload = json.loads(body) if body else {}
+            status, response = 200, await handler(payload)
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            status, response = 400, {"error": f"{type(e).__name__}: {e}"}
+        except Exception as e:
+            status, response = 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            self.in_flight -= 1
+        self.requests[path] = self.requests.get(path, 0) + 1
+        self.latencies.setdefault(path, deque(maxlen=10000)).append(time.perf_counter() - start)
+        if status != 200:
+            self.errors[path] = self.errors.get(path, 0) + 1
+        return status, response
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, response = await self.dispatch(method, urlsplit(target).path, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                data = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080, ready=None):
+        """
+        서비스 실행 (취소될 때까지). ready: 지정하면 요청을 받을 준비가 끝났을 때 set()하는 asyncio.Event
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lambda: self.rag.model)  # 첫 요청 전에 모델 로드
+        for batcher in (self.embedder, self.searcher, self.verdicter):
+            batcher.start()
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        self.started_at = time.perf_counter()
+        print(f"✅ 추론 서비스 시작: http://{host}:{port} (배치 최대 {self.embedder.max_batch_size}개, "
+              f"대기 {self.embedder.max_wait * 1000:.0f}ms)")
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for batcher in (self.embedder, self.searcher, self.verdicter):
+                await batcher.close()
+            self.decode_executor.shutdown(wait=True)
+            print("🧹 추론 서비스 종료")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DINOv2 결함 검색 추론 서비스 (동적 마이크로 배치)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--db-batch-size", type=int, default=64)
+    parser.add_argument("--decode-workers", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--no-cache", action="store_true", help="임베딩 캐시를 쓰지 않음")
+    parser.add_argument("--runtime", choices=RUNTIMES, default="eager", help="백본 실행 방식 (runtime.py 참고)")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else EmbeddingCache(CACHE_PATH)
+    with DefectRAG_Postgres(DB_CONFIG, pool_size=args.pool_size, embedding_cache=cache, runtime=args.runtime) as rag:
+        service = InferenceService(rag, args.max_batch_size, args.max_wait_ms, args.db_batch_size,
+                                   decode_workers=args.decode_workers)
+        try:
+            asyncio.run(service.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
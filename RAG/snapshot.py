@@ -0,0 +1,207 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import time
+from collections import Counter
+
+from ingest_manifest import file_sha256
+from vector_store import LocalVectorStore
+
+SNAPSHOT_FORMAT = 1  # 스냅샷 형식 버전 (meta.json의 snapshot.format)
+
+
+# =================================================================
+# 스냅샷 = LocalVectorStore 폴더 (embeddings.bin + metadata.N.jsonl + meta.json)
+#   - 이미지/모델 없이 벡터와 메타데이터만 옮겨서 새 검사 PC를 바로 띄우는 용도
+#   - embeddings.bin은 (N, dim) 행렬 그대로라 메모리 맵으로 바로 검색 가능 -> DefectRAG_Local(스냅샷 폴더)
+#   - PostgreSQL로 가져올 때는 binary COPY로 적재 (import_snapshot)
+#   - meta.json의 "snapshot": 모델 버전, 원본 저장소, 내보낸 시각, 파일별 sha256
+#   - 벡터는 정규화하지 않은 원본 그대로 저장 (등록된 PCA/whitening 사영이 원본 벡터로 학습되므로)
+# =================================================================
+
+def read_snapshot(snapshot_dir):
+    """
+    스냅샷 폴더의 meta.json -> dict (dim, dtype, count, snapshot 등)
+    """
+    meta_path = os.path.join(snapshot_dir, LocalVectorStore.META_FILE)
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"스냅샷 폴더가 아닙니다: {snapshot_dir} ({LocalVectorStore.META_FILE} 없음)")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    if "snapshot" not in meta:
+        raise ValueError(f"snapshot.py export로 만든 폴더가 아닙니다: {snapshot_dir}")
+    if meta["snapshot"]["format"] > SNAPSHOT_FORMAT:
+        raise ValueError(f"지원하지 않는 스냅샷 형식입니다: {meta['snapshot']['format']} (지원: {SNAPSHOT_FORMAT} 이하)")
+    return meta
+
+
+def verify_snapshot(snapshot_dir):
+    """
+    파일별 sha256을 내보낼 때 기록한 값과 비교 (복사 중 손상 확인). 다르면 ValueError
+    (스냅샷 폴더를 DefectRAG_Local로 열어 적재/삭제했다면 파일이 바뀌었으므로 역시 ValueError)
+    """
+    meta = read_snapshot(snapshot_dir)
+    for name, expected in meta["snapshot"]["checksums"].items():
+        path = os.path.join(snapshot_dir, name)
+        if not os.path.exists(path):
+            raise ValueError(f"스냅샷 파일이 없습니다: {path} (내보낸 뒤 저장소로 사용해 변경되었을 수 있음)")
+        if file_sha256(path) != expected:
+            raise ValueError(f"스냅샷 파일이 손상되었습니다: {path} (sha256 불일치)")
+    return meta
+
+
+def export_snapshot(store, out_dir, dtype="float32", chunk_size=5000):
+    """
+    store(PostgresVectorStore 또는 LocalVectorStore)의 모든 행을 out_dir에 스냅샷으로 내보냄 -> meta.json의 snapshot 정보
+    dtype: 스냅샷 행렬 정밀도 ("float16"이면 용량 절반)
+    out_dir.tmp에 모두 쓴 뒤 이름을 바꾸므로, 중간에 중단돼도 불완전한 스냅샷이 out_dir에 남지 않음
+    """
+    if os.path.exists(out_dir):
+        raise FileExistsError(f"이미 있는 폴더입니다: {out_dir}")
+    tmp_dir = out_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    start = time.perf_counter()
+    # PostgreSQL은 원본 벡터를 저장하므로 그대로 내보냄 (정규화해서 저장한 로컬 저장소는 정규화 벡터밖에 없음)
+    snapshot = LocalVectorStore(tmp_dir, dim=store.dim, dtype=dtype, normalize=getattr(store, "normalized", False))
+    model_versions = Counter()
+
+    def rows():
+        for chunk in store.iter_rows(chunk_size):
+            model_versions.update(row.model_version for row in chunk if row.model_version)
+            yield from chunk
+
+    total = snapshot.add(rows(), chunk_size=chunk_size)
+    model_version = store.active_version
+    if model_version is None and model_versions:
+        model_version = model_versions.most_common(1)[0][0]
+
+    info = {
+        "format": SNAPSHOT_FORMAT,
+        "model_version": model_version,
+        "model_versions": dict(model_versions),
+        "source": store.name,
+        "rows": total,
+        "exported_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "checksums": {
+            name: file_sha256(os.path.join(tmp_dir, name))
+            for name in (LocalVectorStore.EMBEDDINGS_FILE, snapshot.meta["metadata_file"])
+        },
+    }
+    snapshot.set_snapshot_info(info)
+    os.replace(tmp_dir, out_dir)
+
+    size = sum(os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir))
+    print(f"✅ 스냅샷 내보내기 완료: {out_dir} ({total}행, {dtype}, {size / 1024 ** 2:.1f}MB, "
+          f"{time.perf_counter() - start:.1f}초)")
+    if len(model_versions) > 1:
+        print(f"⚠️ 여러 모델 버전의 임베딩이 섞여 있습니다: {dict(model_versions)}")
+    return info
+
+
+def import_snapshot(snapshot_dir, store, chunk_size=5000, verify=True):
+    """
+    스냅샷을 PostgresVectorStore에 적재 -> 적재한 행 수
+    defect_images를 비우고 binary COPY로 교체 (ANN 인덱스/프로토타입은 add(rebuild=True)가 다시 만듦)
+    등록된 PCA 사영은 그대로 두고, 적재한 원본 벡터로 축소 테이블을 다시 채움 (sync_projection)
+    등록부의 활성 모델 버전은 스냅샷의 모델 버전으로 기록
+    verify: 적재 전에 sha256 확인
+    """
+    meta = verify_snapshot(snapshot_dir) if verify else read_snapshot(snapshot_dir)
+    info = meta["snapshot"]
+    if meta["dim"] != store.dim:
+        raise ValueError(f"스냅샷 차원({meta['dim']})과 defect_images 차원({store.dim})이 다릅니다.")
+    building = [state["version"] for state in store.versions() if state["status"] == "building"]
+    if building:
+        raise RuntimeError(f"재임베딩 중인 버전이 있어 가져올 수 없습니다: {building} (먼저 abort 하세요)")
+
+    start = time.perf_counter()
+    snapshot = LocalVectorStore(snapshot_dir)
+    total = store.add((row for chunk in snapshot.iter_rows(chunk_size) for row in chunk),
+                      chunk_size=chunk_size, rebuild=True)
+    # add()가 적재하면서 축소 행도 채우지만, 빠진 행이 없도록 사영마다 한 번 더 확인
+    synced = {version: store.sync_projection(version, chunk_size) for version in store.projections}
+    if info["model_version"]:
+        store.set_active_version(info["model_version"])
+    print(f"✅ 스냅샷 가져오기 완료: {total}행 (모델 버전 {info['model_version'] or '-'}, "
+          f"{time.perf_counter() - start:.1f}초)")
+    if synced:
+        print(f"   등록된 사영 {len(synced)}개 유지, 축소 테이블 동기화: "
+              f"{', '.join(f'{version}(+{count})' for version, count in synced.items())}")
+        if meta.get("normalized", True):
+            print("⚠️ 정규화된 벡터로 만든 스냅샷입니다. 사영은 원본 벡터로 학습했으므로 평균/whitening이 맞지 않을 수 있습니다. "
+                  "(projection.py fit으로 다시 학습 권장)")
+    return total
+
+
+def print_snapshot(snapshot_dir, meta):
+    info = meta["snapshot"]
+    size = sum(os.path.getsize(os.path.join(snapshot_dir, name)) for name in info["checksums"])
+    print(f"\n📊 [스냅샷] {snapshot_dir}")
+    print("-" * 80)
+    print(f"   모델 버전 : {info['model_version'] or '-'}")
+    print(f"   행 수     : {info['rows']} ({meta['dim']}차원, {meta['dtype']}, "
+          f"{'정규화 벡터' if meta.get('normalized', True) else '원본 벡터'}, {size / 1024 ** 2:.1f}MB)")
+    print(f"   원본      : {info['source']} ({info['exported_at']})")
+    if len(info["model_versions"]) > 1:
+        print(f"   ⚠️ 섞인 모델 버전: {info['model_versions']}")
+    print("-" * 80)
+
+
+if __name__ == "__main__":
+    from vector_store import PostgresVectorStore
+
+    # ★ build_db.py와 동일한 DB 접속 정보 ★
+    DB_CONFIG = {
+        "host": "localhost",
+        "port": "5432",
+        "dbname": "postgres",
+        "user": "postgres",
+        "password": "3510"
+    }
+
+    parser = argparse.ArgumentParser(description="defect_images 스냅샷 내보내기/가져오기 (이미지/모델 없이 새 PC 구성)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="DB(또는 로컬 저장소)를 스냅샷 폴더로 내보냄")
+    export_parser.add_argument("out_dir")
+    export_parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                               help="float16이면 용량 절반")
+    export_parser.add_argument("--from-local", default=None, help="DB 대신 이 로컬 저장소 폴더를 내보냄")
+    export_parser.add_argument("--chunk-size", type=int, default=5000)
+
+    import_parser = subparsers.add_parser("import", help="스냅샷을 DB에 적재 (defect_images 교체)")
+    import_parser.add_argument("snapshot_dir")
+    import_parser.add_argument("--chunk-size", type=int, default=5000)
+    import_parser.add_argument("--no-verify", action="store_true", help="sha256 확인 생략")
+
+    info_parser = subparsers.add_parser("info", help="스냅샷 정보 (--verify: sha256 확인)")
+    info_parser.add_argument("snapshot_dir")
+    info_parser.add_argument("--verify", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        store = LocalVectorStore(args.from_local) if args.from_local else PostgresVectorStore(DB_CONFIG, pool_size=1)
+        try:
+            info = export_snapshot(store, args.out_dir, dtype=args.dtype, chunk_size=args.chunk_size)
+        finally:
+            store.close()
+        if info["model_version"] and "/" in info["model_version"]:
+            model_name, resize = info["model_version"].split("/", 1)
+            resize_mode = "aspect" if resize.startswith("aspect") else "square"
+            print(f"💡 DB 없이 바로 검색: DefectRAG_Local(r\"{args.out_dir}\", model_name=\"{model_name}\", "
+                  f"resize_mode=\"{resize_mode}\")")
+    elif args.command == "import":
+        meta = read_snapshot(args.snapshot_dir)
+        store = PostgresVectorStore(DB_CONFIG, pool_size=1, dim=meta["dim"])
+        try:
+            import_snapshot(args.snapshot_dir, store, chunk_size=args.chunk_size, verify=not args.no_verify)
+        finally:
+            store.close()
+    elif args.command == "info":
+        meta = verify_snapshot(args.snapshot_dir) if args.verify else read_snapshot(args.snapshot_dir)
+        print_snapshot(args.snapshot_dir, meta)
+        if args.verify:
+            print("✅ sha256 확인 완료")
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# RAG/의 모듈은 스크립트 폴더에서 서로 `from vector_store import ...`로 불러오므로 같은 방식으로 import
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAG_DIR not in sys.path:
+    sys.path.insert(0, RAG_DIR)
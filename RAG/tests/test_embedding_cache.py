@@ -0,0 +1,72 @@
+import itertools
+import types
+
+import numpy as np
+import pytest
+
+import embedding_cache
+from embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # last_access가 호출 순서대로 커지도록 시계를 고정 (같은 시각이면 LRU 순서가 정해지지 않음)
+    clock = itertools.count(1.0)
+    monkeypatch.setattr(embedding_cache, "time", types.SimpleNamespace(time=lambda: next(clock)))
+    # 4차원 float32 = 16바이트 -> 3개까지 보관
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=48)
+    yield cache
+    cache.close()
+
+
+def vector(value):
+    return np.full(4, value, dtype=np.float32)
+
+
+def test_round_trip_and_stats(cache):
+    cache.put("a", "v1", vector(1))
+
+    np.testing.assert_array_equal(cache.get("a", "v1"), vector(1))
+    assert cache.get("b", "v1") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_model_version_is_part_of_the_key(cache):
+    cache.put_many([("a", vector(1))], "fp32")
+    cache.put_many([("a", vector(2))], "int8")
+
+    np.testing.assert_array_equal(cache.get("a", "fp32"), vector(1))
+    np.testing.assert_array_equal(cache.get("a", "int8"), vector(2))
+    assert cache.get_many(["a"], "onnx") == {}
+
+
+def test_evicts_least_recently_used(cache):
+    cache.put_many([("a", vector(1)), ("b", vector(2)), ("c", vector(3))], "v1")
+    cache.get("a", "v1")  # a를 최근에 사용 -> b, c 순서로 오래 안 쓴 항목
+    cache.put("d", "v1", vector(4))
+
+    # 상한(48)을 넘으면 90%(43.2) 아래까지 지우므로 b, c가 함께 삭제됨
+    assert set(cache.get_many(["a", "b", "c", "d"], "v1")) == {"a", "d"}
+    assert cache.stats()["bytes"] == 32
+
+
+def test_replacing_an_entry_keeps_byte_count(cache):
+    cache.put("a", "v1", vector(1))
+    cache.put("a", "v1", vector(2))
+
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == 16
+    np.testing.assert_array_equal(cache.get("a", "v1"), vector(2))
+
+
+def test_entries_survive_reopen(cache):
+    cache.put("a", "v1", vector(1))
+    cache.close()
+
+    reopened = EmbeddingCache(cache.path, max_bytes=48)
+    try:
+        np.testing.assert_array_equal(reopened.get("a", "v1"), vector(1))
+        assert reopened.stats()["bytes"] == 16
+    finally:
+        reopened.close()
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from filename_index import FilenameIndex
+
+
+@pytest.fixture
+def folder(tmp_path):
+    for name in ["crack_0001.png", "crack_0001_zoom.png", "scratch_0002.jpg", "LOT42_particle_0003.png"]:
+        (tmp_path / name).write_bytes(b"")
+    return tmp_path
+
+
+def touch_folder(folder, names=(), removed=()):
+    # 폴더 수정 시각을 확실히 바꿔서 refresh가 변경을 감지하도록 (파일 시스템 시각 해상도와 무관하게)
+    for name in names:
+        (folder / name).write_bytes(b"")
+    for name in removed:
+        (folder / name).unlink()
+    stat = os.stat(folder)
+    os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_full_name_wins_over_stem_and_substring(folder):
+    index = FilenameIndex(str(folder))
+
+    assert len(index) == 4
+    assert index.resolve(["보여줘", "crack_0001_zoom.png"]) == "crack_0001_zoom.png"
+    assert index.resolve(["crack_0001"]) == "crack_0001.png"
+    assert index.resolve(["scratch_0002"]) == "scratch_0002.jpg"
+
+
+def test_substring_match_picks_shortest_name(folder):
+    index = FilenameIndex(str(folder))
+
+    assert index.resolve(["0001"]) is None  # min_substring(5)보다 짧은 단어는 부분 일치로 찾지 않음
+    assert index.resolve(["ck_0001"]) == "crack_0001.png"
+    assert index.resolve(["particle"]) == "LOT42_particle_0003.png"
+    assert index.resolve(["nothing_like_this"]) is None
+
+
+def test_refresh_picks_up_added_and_removed_files(folder):
+    index = FilenameIndex(str(folder))
+    touch_folder(folder, names=["dent_0004.png"], removed=["scratch_0002.jpg"])
+
+    assert index.resolve(["dent_0004"]) == "dent_0004.png"
+    assert index.resolve(["scratch_0002"]) is None
+    assert index.resolve(["scratch"]) is None
+    assert len(index) == 4
+
+
+def test_refresh_skips_unchanged_folder(folder):
+    index = FilenameIndex(str(folder))
+
+    assert index.refresh() is False
+    assert index.refresh(force=True) is True
+
+
+def test_rejects_min_substring_shorter_than_ngram(folder):
+    with pytest.raises(ValueError):
+        FilenameIndex(str(folder), ngram=4, min_substring=3)
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+def test_runs_all_items_through_every_stage():
+    results = []
+    lock = threading.Lock()
+
+    def collect(item):
+        with lock:
+            results.append(item)
+
+    stats = Pipeline(range(20), [Stage("double", lambda x: x * 2, workers=3, queue_size=2),
+                                 Stage("collect", collect)]).run()
+
+    assert sorted(results) == [x * 2 for x in range(20)]
+    assert stats["double"]["items_in"] == 20
+    assert stats["collect"]["items_in"] == 20
+
+
+def test_stream_stage_sees_every_item():
+    seen = []
+
+    def consume(items):
+        seen.extend(items)
+        return None
+
+    Pipeline(range(5), [Stage("copy", consume, stream=True)]).run()
+
+    assert seen == list(range(5))
+
+
+def test_stage_error_is_reraised_and_stops_the_pipeline():
+    processed = []
+
+    def fail_on_three(item):
+        if item == 3:
+            raise ValueError("bad item")
+        return item
+
+    def source():
+        # 에러 뒤에도 입력이 끝없이 이어지면 중단되지 않는 한 run()이 끝나지 않음
+        item = 0
+        while True:
+            yield item
+            item += 1
+
+    with pytest.raises(ValueError, match="bad item"):
+        Pipeline(source(), [Stage("check", fail_on_three, queue_size=1), Stage("sink", processed.append)]).run()
+    assert 3 not in processed
+
+
+def test_source_error_is_reraised():
+    def source():
+        yield 1
+        raise OSError("disk gone")
+
+    with pytest.raises(OSError, match="disk gone"):
+        Pipeline(source(), [Stage("noop", lambda item: None)]).run()
+
+
+def test_concurrent_worker_errors_are_reraised():
+    barrier = threading.Barrier(2)
+
+    def fail(item):
+        barrier.wait(timeout=5)
+        raise KeyError(item)
+
+    with pytest.raises(KeyError):
+        Pipeline(range(2), [Stage("fail", fail, workers=2)]).run()
+
+
+def test_stage_requires_a_worker():
+    with pytest.raises(ValueError):
+        Stage("empty", lambda item: item, workers=0)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from rag_core import aspect_size, tile_boxes
+
+
+def covered(boxes, width, height):
+    mask = np.zeros((height, width), dtype=bool)
+    for x, y, w, h in boxes:
+        mask[y:y + h, x:x + w] = True
+    return mask.all()
+
+
+def test_tile_boxes_cover_image_with_edge_aligned_last_tile():
+    boxes = tile_boxes(100, 60, 40, 0.25)
+
+    assert {x for x, _, _, _ in boxes} == {0, 30, 60}
+    assert {y for _, y, _, _ in boxes} == {0, 20}
+    assert all(w == 40 and h == 40 for _, _, w, h in boxes)
+    assert covered(boxes, 100, 60)
+
+
+def test_tile_boxes_small_side_gets_one_tile():
+    assert tile_boxes(30, 20, 40, 0.25) == [(0, 0, 30, 20)]
+    assert tile_boxes(100, 20, 40, 0.0) == [(0, 0, 40, 20), (40, 0, 40, 20), (60, 0, 40, 20)]
+
+
+@pytest.mark.parametrize("overlap", [0.0, 0.5, 0.99])
+def test_tile_boxes_stay_inside_image(overlap):
+    boxes = tile_boxes(517, 333, 224, overlap)
+
+    assert all(x + w <= 517 and y + h <= 333 for x, y, w, h in boxes)
+    assert len(set(boxes)) == len(boxes)
+    assert covered(boxes, 517, 333)
+
+
+def test_aspect_size_keeps_ratio_on_patch_grid():
+    # 300x60 스크래치 크롭 -> 긴 변 518, 짧은 변 103.6을 14의 배수로 반올림
+    assert aspect_size(300, 60, 518) == (518, 98)
+    assert aspect_size(60, 300, 518) == (98, 518)
+    assert aspect_size(1000, 1000, 518) == (518, 518)
+
+
+@pytest.mark.parametrize("width, height", [(1, 1), (5000, 3), (3, 5000), (640, 480), (518, 517)])
+def test_aspect_size_is_multiple_of_patch_and_at_least_one_patch(width, height):
+    new_width, new_height = aspect_size(width, height, 518)
+
+    assert new_width % 14 == 0 and new_height % 14 == 0
+    assert 14 <= new_width <= 518 and 14 <= new_height <= 518
+    assert max(new_width, new_height) == 518
@@ -0,0 +1,78 @@
+from rag_core import DefectRAG_Local
+from result_cache import ResultCache
+
+VERSION = "dinov2_vitl14/resize518"
+
+
+def test_hit_returns_copy():
+    cache = ResultCache()
+    key = ResultCache.make_key("h", VERSION, 5, {})
+    cache.put(key, 1, [("crack", "a.png", 0.9, 1)])
+
+    results = cache.get(key, 1)
+    results.append("mutated")
+
+    assert cache.get(key, 1) == [("crack", "a.png", 0.9, 1)]
+    assert cache.stats()["hits"] == 2
+
+
+def test_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    for name in "ab":
+        cache.put(name, 1, [name])
+    cache.get("a", 1)  # a를 최근에 사용 -> b가 가장 오래 안 쓴 항목
+    cache.put("c", 1, ["c"])
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == ["a"]
+    assert cache.get("c", 1) == ["c"]
+
+
+def test_new_generation_invalidates_everything():
+    cache = ResultCache()
+    cache.put("a", 1, ["a"])
+
+    assert cache.get("a", 2) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_stale_generation_is_neither_read_nor_stored():
+    cache = ResultCache()
+    cache.put("a", 2, ["new"])
+    # 세대 2를 본 뒤에 끝난 세대 1의 검색 결과는 버림
+    cache.put("b", 1, ["old"])
+
+    assert cache.get("a", 1) is None
+    assert cache.get("b", 2) is None
+    assert cache.get("a", 2) == ["new"]
+
+
+def test_make_key_normalizes_filters_and_option_order():
+    first = ResultCache.make_key("h", VERSION, 5, {"filters": {"line": "L1"}, "ef_search": 40})
+    second = ResultCache.make_key("h", VERSION, 5, {"ef_search": 40, "filters": {"line": ["L1"]}})
+
+    assert first == second
+    assert first != ResultCache.make_key("h", VERSION, 10, {"ef_search": 40, "filters": {"line": ["L1"]}})
+    hash(first)
+
+
+def test_key_depends_on_model_version():
+    cache = ResultCache()
+    cache.put(ResultCache.make_key("h", VERSION, 5, {}), 1, ["square"])
+
+    assert cache.get(ResultCache.make_key("h", "dinov2_vitl14/aspect518", 5, {}), 1) is None
+    assert cache.get(ResultCache.make_key("h", "dinov2_vitb14/resize518", 5, {}), 1) is None
+    assert cache.get(ResultCache.make_key("h", VERSION, 5, {}), 1) == ["square"]
+
+
+def test_search_key_version_follows_resize_mode_and_runtime(tmp_path):
+    # DefectRAG_Postgres.search는 cache_version을 키에 넣음 (모델은 첫 임베딩 때 로드하므로 여기서는 로드하지 않음)
+    rag = DefectRAG_Local(str(tmp_path / "store"))
+    square = rag.cache_version
+    rag.resize_mode = "aspect"
+
+    assert rag.cache_version != square
+    rag.resize_mode = "square"
+    assert rag.cache_version == square
+    assert DefectRAG_Local(str(tmp_path / "store"), runtime="int8").cache_version != square
@@ -0,0 +1,40 @@
+import pytest
+
+from service import _check_options, _group_calls
+
+
+def test_group_calls_returns_results_in_input_order():
+    calls = []
+
+    def call(vectors, options):
+        calls.append((list(vectors), options))
+        return [f"{options['top_k']}:{vector}" for vector in vectors]
+
+    items = [("a", 5, {"top_k": 5}), ("b", 10, {"top_k": 10}), ("c", 5, {"top_k": 5}), ("d", 10, {"top_k": 10})]
+
+    assert _group_calls(items, call) == ["5:a", "10:b", "5:c", "10:d"]
+    assert calls == [(["a", "c"], {"top_k": 5}), (["b", "d"], {"top_k": 10})]
+
+
+def test_group_calls_fails_only_the_failing_group():
+    def call(vectors, options):
+        if options["bad"]:
+            raise RuntimeError("bad group")
+        return [vector.upper() for vector in vectors]
+
+    results = _group_calls([("a", 0, {"bad": False}), ("b", 1, {"bad": True}), ("c", 0, {"bad": False})], call)
+
+    assert results[0] == "A" and results[2] == "C"
+    assert isinstance(results[1], RuntimeError)
+
+
+@pytest.mark.parametrize("options", [
+    {"unknown": 1},
+    {"ef_search": 0},
+    {"classes": True},
+    {"filters": {"nope": "x"}},
+    [],
+])
+def test_check_options_rejects_bad_requests(options):
+    with pytest.raises(ValueError):
+        _check_options(options)
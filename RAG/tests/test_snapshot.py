@@ -0,0 +1,85 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from snapshot import export_snapshot, read_snapshot, verify_snapshot
+from vector_store import DefectRow, LocalVectorStore
+
+
+def make_rows(count, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    types = ["crack", "scratch", "dent"]
+    return [
+        DefectRow(f"img_{i}.png", types[i % 3], rng.standard_normal(dim).astype(np.float32) * (i + 1), f"hash{i}",
+                  "dinov2_vitl14/resize518", f"/data/{types[i % 3]}/img_{i}.png", f"L{i % 2}", None,
+                  datetime.date(2024, 5, 1 + i), None)
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def source(tmp_path):
+    # PostgreSQL처럼 원본 벡터를 저장하는 저장소
+    store = LocalVectorStore(str(tmp_path / "source"), dim=8, normalize=False)
+    store.add(make_rows(12))
+    store.delete([2])
+    return store
+
+
+def test_round_trip_keeps_raw_vectors_and_metadata(source, tmp_path):
+    info = export_snapshot(source, str(tmp_path / "snap"))
+    snapshot = LocalVectorStore(str(tmp_path / "snap"))
+
+    assert info["rows"] == 11
+    assert info["model_version"] == "dinov2_vitl14/resize518"
+    assert snapshot.active_version == "dinov2_vitl14/resize518"
+    assert snapshot.normalized is False
+
+    expected = [row for chunk in source.iter_rows() for row in chunk]
+    actual = [row for chunk in snapshot.iter_rows(chunk_size=4) for row in chunk]
+    assert [row._replace(embedding=None) for row in actual] == [row._replace(embedding=None) for row in expected]
+    np.testing.assert_allclose(np.stack([row.embedding for row in actual]),
+                               np.stack([row.embedding for row in expected]), rtol=1e-6)
+
+
+def test_snapshot_search_matches_source(source, tmp_path):
+    export_snapshot(source, str(tmp_path / "snap"))
+    snapshot = LocalVectorStore(str(tmp_path / "snap"))
+    query = np.random.default_rng(1).standard_normal(8)
+
+    expected = source.search(query, top_k=5)
+    actual = snapshot.search(query, top_k=5)
+    # 스냅샷은 id를 1부터 다시 매기므로 파일 이름과 유사도로 비교
+    assert [(t, f) for t, f, _, _ in actual] == [(t, f) for t, f, _, _ in expected]
+    np.testing.assert_allclose([s for _, _, s, _ in actual], [s for _, _, s, _ in expected], rtol=1e-5)
+
+
+def test_float16_snapshot_is_close(source, tmp_path):
+    export_snapshot(source, str(tmp_path / "snap16"), dtype="float16")
+    vectors = np.stack([row.embedding for chunk in LocalVectorStore(str(tmp_path / "snap16")).iter_rows()
+                        for row in chunk])
+    expected = np.stack([row.embedding for chunk in source.iter_rows() for row in chunk])
+
+    np.testing.assert_allclose(vectors, expected, rtol=1e-2, atol=1e-2)
+
+
+def test_verify_detects_corruption(source, tmp_path):
+    out_dir = tmp_path / "snap"
+    export_snapshot(source, str(out_dir))
+    assert verify_snapshot(str(out_dir))["count"] == 11
+
+    with open(out_dir / LocalVectorStore.EMBEDDINGS_FILE, "r+b") as f:
+        f.write(b"\xff\xff\xff\xff")
+    with pytest.raises(ValueError):
+        verify_snapshot(str(out_dir))
+
+
+def test_export_refuses_existing_folder_and_read_rejects_plain_store(source, tmp_path):
+    (tmp_path / "taken").mkdir()
+    with pytest.raises(FileExistsError):
+        export_snapshot(source, str(tmp_path / "taken"))
+    with pytest.raises(ValueError):
+        read_snapshot(source.store_dir)
+    with pytest.raises(FileNotFoundError):
+        read_snapshot(str(tmp_path / "missing"))
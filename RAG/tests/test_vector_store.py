@@ -0,0 +1,106 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from vector_store import DefectRow, LocalVectorStore, filter_sql, normalize_filters
+
+
+def make_row(filename, defect_type, vector, **fields):
+    values = dict(content_hash=None, model_version="test", source_path=None,
+                  line=None, layer=None, capture_date=None, source_folder=None)
+    values.update(fields)
+    return DefectRow(filename, defect_type, np.asarray(vector, dtype=np.float32), **values)
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "store"), dim=4, block_size=2)
+    store.add([
+        make_row("crack_0.png", "crack", [1, 0, 0, 0]),
+        make_row("crack_1.png", "crack", [0.9, 0.1, 0, 0]),
+        make_row("scratch_0.png", "scratch", [0, 1, 0, 0]),
+        make_row("dent_0.png", "dent", [0, 0, 3, 0]),
+    ], chunk_size=3)
+    return store
+
+
+def test_local_search_orders_by_cosine(local_store):
+    results = local_store.search([2, 0, 0, 0], top_k=3)
+
+    assert [filename for _, filename, _, _ in results] == ["crack_0.png", "crack_1.png", "scratch_0.png"]
+    assert results[0][2] == pytest.approx(1.0)
+    assert [row_id for *_, row_id in results] == [1, 2, 3]
+
+
+def test_local_search_many_matches_search(local_store):
+    queries = [[0, 0, 1, 0], [0, 1, 0, 0]]
+
+    assert local_store.search_many(queries, top_k=2) == [local_store.search(query, top_k=2) for query in queries]
+
+
+def test_local_delete_hides_rows_and_persists(local_store):
+    local_store.delete([1])
+
+    assert local_store.count() == 3
+    assert [filename for _, filename, _, _ in local_store.search([1, 0, 0, 0], top_k=1)] == ["crack_1.png"]
+
+    reopened = LocalVectorStore(local_store.store_dir)
+    assert reopened.count() == 3
+    assert reopened.search([1, 0, 0, 0], top_k=1) == local_store.search([1, 0, 0, 0], top_k=1)
+
+
+def test_local_add_after_reopen_continues_ids(local_store):
+    reopened = LocalVectorStore(local_store.store_dir)
+    reopened.add([make_row("particle_0.png", "particle", [0, 0, 0, 1])])
+
+    assert reopened.count() == 5
+    assert reopened.search([0, 0, 0, 1], top_k=1)[0] == ("particle", "particle_0.png", pytest.approx(1.0), 5)
+
+
+def test_local_rebuild_replaces_rows(local_store):
+    local_store.add([make_row("particle_0.png", "particle", [0, 0, 0, 1])], rebuild=True)
+
+    assert local_store.count() == 1
+    assert [filename for _, filename, _, _ in local_store.search([1, 0, 0, 0], top_k=5)] == ["particle_0.png"]
+
+
+def test_filter_sql_quotes_line_literals():
+    where, params = filter_sql(normalize_filters({"line": ["L1", "O'Brien", "50%"]}))
+
+    # line은 부분 인덱스 조건과 맞추려고 리터럴로 들어감: 따옴표는 두 번, %는 psycopg 자리표시와 겹치지 않게 %%
+    assert where == "WHERE line IN ('L1', 'O''Brien', '50%%')"
+    assert params == {}
+
+
+def test_filter_sql_passes_other_filters_as_parameters():
+    where, params = filter_sql(normalize_filters({
+        "layer": "M1'; DROP TABLE defect_images; --",
+        "capture_date": ("2024-05-01", None),
+        "source_folder": None,
+    }))
+
+    assert where == "WHERE layer = ANY(%(filter_layer)s) AND capture_date >= %(capture_date_from)s"
+    assert params == {"filter_layer": ["M1'; DROP TABLE defect_images; --"],
+                      "capture_date_from": datetime.date(2024, 5, 1)}
+
+
+def test_filter_sql_without_filters():
+    assert filter_sql(normalize_filters(None)) == ("", {})
+
+
+def test_normalize_filters_rejects_unknown_column():
+    with pytest.raises(ValueError):
+        normalize_filters({"defect_type": "crack"})
+
+
+def test_local_search_applies_filters(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "store"), dim=2)
+    store.add([
+        make_row("a.png", "crack", [1, 0], line="L1", capture_date=datetime.date(2024, 5, 1)),
+        make_row("b.png", "crack", [1, 0.1], line="L2", capture_date=datetime.date(2024, 5, 2)),
+    ])
+
+    assert [filename for _, filename, _, _ in store.search([1, 0], top_k=2, filters={"line": "L2"})] == ["b.png"]
+    assert [filename for _, filename, _, _ in store.search(
+        [1, 0], top_k=2, filters={"capture_date": (None, "2024-05-01")})] == ["a.png"]
@@ -0,0 +1,1966 @@
+import datetime
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import psycopg  # psycopg 3 버전
+from psycopg import sql
+from pgvector.psycopg import register_vector
+from psycopg_pool import ConnectionPool
+
+from projection import EmbeddingProjection
+from prototypes import clusters_for, normalize, spherical_kmeans
+
+
+# 저장 단위 행. 앞의 3개 필드만 있는 (filename, defect_type, embedding) 튜플도 그대로 받음
+# content_hash: 이미지 파일 내용의 sha256, model_version: 임베딩을 만든 모델/전처리, source_path: 원본 절대 경로
+# line, layer, capture_date, source_folder: 검색 필터용 메타데이터 (METADATA_FIELDS, 모르면 None)
+DefectRow = namedtuple(
+    "DefectRow",
+    ["filename", "defect_type", "embedding", "content_hash", "model_version", "source_path",
+     "line", "layer", "capture_date", "source_folder"],
+    defaults=(None,) * 7,
+)
+
+# 검색 필터로 쓸 수 있는 메타데이터 컬럼 (제품 라인, 공정 레이어, 촬영 날짜, ingest한 폴더)
+METADATA_FIELDS = ("line", "layer", "capture_date", "source_folder")
+
+# 타일 모드 저장 단위 행: 큰 이미지를 겹치게 자른 타일 1장 (x, y, width, height: 원본 이미지 픽셀 좌표)
+TileRow = namedtuple(
+    "TileRow",
+    ["filename", "defect_type", "embedding", "x", "y", "width", "height", "content_hash", "model_version",
+     "source_path"],
+    defaults=(None, None, None),
+)
+
+# 결함 종류별 투표 집계 결과 (점수 내림차순으로 정렬된 목록의 원소)
+# score: temperature가 없으면 유사도*100의 합 (기존 판정 점수와 동일), 있으면 softmax(sim/T) 가중치 합 (0~1)
+# evidence: 그 결함 종류에서 유사도가 가장 높은 근거 파일 [(filename, similarity, id), ...]
+ClassVote = namedtuple("ClassVote", ["defect_type", "score", "votes", "evidence"])
+
+COPY_SQL = f"COPY defect_images ({', '.join(DefectRow._fields)}) FROM STDIN WITH (FORMAT BINARY)"
+COPY_TYPES = ["text", "text", "vector", "text", "text", "text", "text", "text", "date", "text"]
+TILE_COPY_SQL = f"COPY defect_tiles ({', '.join(TileRow._fields)}) FROM STDIN WITH (FORMAT BINARY)"
+TILE_COPY_TYPES = ["text", "text", "vector", "int4", "int4", "int4", "int4", "text", "text", "text"]
+# 사영(차원 축소) 테이블도 함께 채울 때는 id를 미리 받아서 같이 적재
+COPY_WITH_ID_SQL = f"COPY defect_images (id, {', '.join(DefectRow._fields)}) FROM STDIN WITH (FORMAT BINARY)"
+
+# DB 세대 번호: 검색 결과가 달라지는 변경(적재/삭제/경로 변경/ANN 인덱스/프로토타입/사영/모델 전환)마다 1 증가
+# 변경과 같은 트랜잭션에서 올리므로, 세대 번호를 읽은 뒤 실행한 검색은 항상 그 세대 이후의 데이터를 봄
+# -> 질의 결과 캐시(result_cache.py)는 세대 번호가 바뀌면 이전 결과를 버림 (다른 프로세스의 변경도 반영)
+BUMP_GENERATION_SQL = "UPDATE defect_generation SET generation = generation + 1, updated_at = now()"
+
+# 구조 세대 번호: 저장소 객체가 들고 있는 상태(임베딩 차원, 활성 모델 버전, 등록된 사영, 프로토타입 유무)가 바뀌는
+# 변경(모델 전환/스냅샷 가져오기, 사영 등록/삭제, 프로토타입 생성/삭제)에서만 1 증가
+# -> 다른 프로세스의 PostgresVectorStore는 검색/적재 전에 이 값을 비교해서 바뀌었으면 refresh()
+BUMP_SCHEMA_SQL = "UPDATE defect_generation SET schema_generation = schema_generation + 1"
+
+# =================================================================
+# SQL 쿼리: 코사인 거리(<=>)
+# ANN 인덱스(HNSW/IVFFlat)를 타려면 ORDER BY가 반드시 "embedding <=> query" 형태여야 함
+# (1 - 거리)로 정렬하면 인덱스를 쓰지 못하고 전체 순차 스캔이 발생
+# 코사인 유사도(1 - 거리)는 정렬이 끝난 top_k 행에 대해서만 계산
+# =================================================================
+
+# 저장 방식(storage)별 "질의 1개의 최근접 top_k" 서브쿼리. {query}는 질의 벡터 식 (파라미터 또는 LATERAL 컬럼)
+# {dim}은 defect_images.embedding 컬럼의 차원 (모델 버전마다 다를 수 있음), {where}는 메타데이터 필터 (filter_sql 참고)
+#   float32 : vector 그대로 정확한 거리로 정렬
+#   halfvec : embedding::halfvec({dim}) 식 인덱스로 shortlist개 후보 -> float32 거리로 재정렬 (인덱스 크기 1/2)
+#   bit     : binary_quantize(embedding) 식 인덱스의 해밍 거리(<~>)로 shortlist개 후보 -> float32 거리로 재정렬
+#             (인덱스 크기 1/32)
+# 재정렬에 쓰는 float32 embedding은 TOAST에 있어 후보 행만 읽으므로, 메모리에 올라야 하는 것은 인덱스뿐
+# (halfvec/bit는 pgvector 0.7 이상 필요)
+NEAREST_SQL = {
+    "float32": """
+        SELECT id, defect_type, filename, embedding <=> {query} AS distance
+        FROM defect_images
+        {where}
+        ORDER BY distance
+        LIMIT %(top_k)s
+    """,
+    "halfvec": """
+        SELECT id, defect_type, filename, embedding <=> {query} AS distance
+        FROM (
+            SELECT id, defect_type, filename, embedding
+            FROM defect_images
+            {where}
+            ORDER BY embedding::halfvec({dim}) <=> ({query})::halfvec({dim})
+            LIMIT %(shortlist)s
+        ) shortlist
+        ORDER BY distance
+        LIMIT %(top_k)s
+    """,
+    "bit": """
+        SELECT id, defect_type, filename, embedding <=> {query} AS distance
+        FROM (
+            SELECT id, defect_type, filename, embedding
+            FROM defect_images
+            {where}
+            ORDER BY binary_quantize(embedding)::bit({dim}) <~> binary_quantize({query})
+            LIMIT %(shortlist)s
+        ) shortlist
+        ORDER BY distance
+        LIMIT %(top_k)s
+    """,
+}
+
+# 사영(PCA) 검색: 축소 테이블(defect_images_<version>)에서 top_k를 찾고 파일 정보는 원본 테이블에서 가져옴
+PROJECTED_NEAREST_SQL = """
+    SELECT p.id, i.defect_type, i.filename, p.distance
+    FROM (
+        SELECT id, embedding <=> {query} AS distance
+        FROM {table}
+        ORDER BY distance
+        LIMIT %(top_k)s
+    ) p
+    JOIN defect_images i ON i.id = p.id
+"""
+
+# 프로토타입 2단계 검색 (DB 크기와 상관없이 프로토타입 수 + 후보 클러스터 행 수만큼만 스캔)
+#   1단계: 결함 종류별 서브 중심(defect_prototypes)만 순위를 매겨 상위 %(classes)s개 결함 종류를 고름
+#   2단계: 고른 결함 종류마다 질의와 가까운 %(cells)s개 클러스터의 행만 정확한 거리로 정렬
+#          -> 훑는 행 수는 classes * cells * cluster_size(build_prototypes) 정도로 DB가 커져도 고정
+# OFFSET 0: 서브쿼리를 펼치지 못하게 막아 2단계 정렬이 defect_images의 ANN 인덱스 스캔으로 바뀌지 않도록 함
+PROTOTYPE_NEAREST_SQL = """
+    SELECT id, defect_type, filename, distance
+    FROM (
+        SELECT i.id, i.defect_type, i.filename, i.embedding <=> {query} AS distance
+        FROM (
+            SELECT defect_type, cluster
+            FROM (
+                SELECT p.defect_type, p.cluster,
+                       row_number() OVER (PARTITION BY p.defect_type ORDER BY p.centroid <=> {query}) AS rank
+                FROM defect_prototypes p
+                WHERE p.defect_type IN (
+                    SELECT defect_type
+                    FROM defect_prototypes
+                    GROUP BY defect_type
+                    ORDER BY min(centroid <=> {query})
+                    LIMIT %(classes)s
+                )
+            ) ranked
+            WHERE rank <= %(cells)s
+        ) cell
+        JOIN defect_prototype_members m ON m.defect_type = cell.defect_type AND m.cluster = cell.cluster
+        JOIN defect_images i ON i.id = m.id
+        {where}
+        OFFSET 0
+    ) candidates
+    ORDER BY distance
+    LIMIT %(top_k)s
+"""
+
+# 프로토타입 2단계 검색에서 결함 종류마다 훑을 기본 클러스터 수 (search(cells=None))
+# 클수록 경계 근처 질의의 이웃을 덜 놓쳐 전체 정확한 판정과 더 일치하지만, 훑는 행 수가 cells에 비례해 늘어남
+# (일치율/지연시간 trade-off는 benchmark.py prototypes로 측정. 전부 훑으려면 클러스터 수보다 큰 값을 지정)
+PROTOTYPE_CELLS = 4
+
+# 프로토타입 클러스터 배정 (defect_images를 참조하므로 모델 버전 전환 때 새 테이블을 참조하도록 다시 만듦)
+PROTOTYPE_MEMBERS_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS defect_prototype_members (
+        id INTEGER PRIMARY KEY REFERENCES defect_images (id) ON DELETE CASCADE,
+        defect_type TEXT NOT NULL,
+        cluster INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS defect_prototype_members_cell_idx
+    ON defect_prototype_members (defect_type, cluster)
+    """,
+]
+
+# 저장 방식별 ANN 인덱스 대상 식과 연산자 클래스 (검색 쿼리의 ORDER BY 식과 똑같아야 인덱스를 탐, {dim}은 NEAREST_SQL과 동일)
+INDEX_TARGETS = {
+    "float32": ("embedding", "vector_cosine_ops"),
+    "halfvec": ("(embedding::halfvec({dim}))", "halfvec_cosine_ops"),
+    "bit": ("(binary_quantize(embedding)::bit({dim}))", "bit_hamming_ops"),
+}
+
+SEARCH_SQL = """
+    SELECT defect_type, filename, 1 - distance AS similarity, id
+    FROM ({nearest}) nearest
+    ORDER BY distance
+"""
+
+# 타일 검색: 어떤 이미지의 어느 타일(좌표)이 맞았는지 함께 반환
+SEARCH_TILES_SQL = """
+    SELECT defect_type, filename, 1 - distance AS similarity, id, x, y, width, height
+    FROM (
+        SELECT id, defect_type, filename, x, y, width, height, embedding <=> %(query)s AS distance
+        FROM defect_tiles
+        ORDER BY distance
+        LIMIT %(top_k)s
+    ) nearest
+    ORDER BY distance
+"""
+
+# 여러 질의를 한 번에: 질의 벡터 배열을 unnest로 펼치고, 질의마다 LATERAL 서브쿼리로 top_k 검색
+# (서브쿼리 안의 ORDER BY가 "embedding <=> 질의" 형태라 질의마다 ANN 인덱스를 그대로 탐)
+SEARCH_MANY_SQL = """
+    SELECT q.ord, nearest.defect_type, nearest.filename, 1 - nearest.distance AS similarity, nearest.id
+    FROM unnest(%(vectors)s::vector[]) WITH ORDINALITY AS q(query, ord)
+    CROSS JOIN LATERAL ({nearest}) nearest
+    ORDER BY q.ord, nearest.distance
+"""
+
+# 결함 종류별 투표를 DB 안에서 집계: top_k 행 대신 (질의, 결함 종류)마다 요약 1행만 전송
+# temperature가 있으면 dinov2/eval/knn.py KnnModule과 같은 softmax(sim / T) 가중 투표
+# (exp 오버플로를 막기 위해 질의별 최대 유사도를 빼고 계산, softmax 값은 동일)
+VERDICT_MANY_SQL = """
+    WITH nearest AS (
+        SELECT q.ord, n.id, n.defect_type, n.filename, 1 - n.distance AS similarity
+        FROM unnest(%(vectors)s::vector[]) WITH ORDINALITY AS q(query, ord)
+        CROSS JOIN LATERAL ({nearest}) n
+    ), weighted AS (
+        SELECT ord, id, defect_type, filename, similarity,
+               CASE WHEN %(temperature)s::float8 IS NULL THEN similarity * 100
+                    ELSE exp((similarity - max(similarity) OVER (PARTITION BY ord)) / %(temperature)s::float8)
+               END AS weight,
+               row_number() OVER (PARTITION BY ord, defect_type ORDER BY similarity DESC) AS rank
+        FROM nearest
+    )
+    SELECT ord, defect_type,
+           CASE WHEN %(temperature)s::float8 IS NULL THEN sum(weight)
+                ELSE sum(weight) / sum(sum(weight)) OVER (PARTITION BY ord)
+           END AS score,
+           count(*) AS votes,
+           array_agg(filename ORDER BY rank) FILTER (WHERE rank <= %(evidence)s),
+           array_agg(similarity ORDER BY rank) FILTER (WHERE rank <= %(evidence)s),
+           array_agg(id ORDER BY rank) FILTER (WHERE rank <= %(evidence)s)
+    FROM weighted
+    GROUP BY ord, defect_type
+    ORDER BY ord, score DESC
+"""
+
+SEARCH_TEMPLATES = {"search": SEARCH_SQL, "search_many": SEARCH_MANY_SQL, "verdict_many": VERDICT_MANY_SQL}
+
+
+def build_search_sql(template, storage, table=None, nearest=None, dim=1024, where=""):
+    """
+    SEARCH_SQL/SEARCH_MANY_SQL/VERDICT_MANY_SQL 템플릿에 저장 방식별 최근접 서브쿼리를 채움
+    table: 사영 검색이면 축소 테이블 이름
+    nearest: 저장 방식 대신 쓸 최근접 서브쿼리 (예: PROTOTYPE_NEAREST_SQL)
+    dim: 임베딩 차원 (halfvec/bit 캐스트에 사용)
+    where: 메타데이터 필터 WHERE 절 (사영 검색에는 쓸 수 없음)
+    """
+    query = "%(query)s" if template is SEARCH_SQL else "q.query"
+    if nearest is not None:
+        return template.format(nearest=nearest.format(query=query, where=where))
+    if table is not None:
+        return template.format(nearest=PROJECTED_NEAREST_SQL.format(query=query, table=table))
+    return template.format(nearest=NEAREST_SQL[storage].format(query=query, dim=dim, where=where))
+
+
+def as_date(value):
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+
+def normalize_filters(filters):
+    """
+    검색 필터 -> {컬럼: 값 목록} (capture_date는 양쪽 포함 (시작, 끝) 날짜, None이면 그쪽은 열린 구간)
+    filters 예: {"line": "L1" 또는 ["L1", "L2"], "layer": "M1", "source_folder": "D:/data/lot42",
+                 "capture_date": "2024-05-01" 또는 ("2024-05-01", None)}
+    값이 None인 키는 무시
+    """
+    normalized = {}
+    for name, value in (filters or {}).items():
+        if value is None:
+            continue
+        if name not in METADATA_FIELDS:
+            raise ValueError(f"지원하지 않는 필터입니다: {name} ({', '.join(METADATA_FIELDS)})")
+        if name == "capture_date":
+            start, end = value if isinstance(value, (tuple, list)) else (value, value)
+            normalized[name] = (as_date(start), as_date(end))
+        else:
+            normalized[name] = [value] if isinstance(value, str) else list(value)
+    return normalized
+
+
+def filter_sql(filters):
+    """
+    normalize_filters() 결과 -> (WHERE 절, 파라미터)
+    line은 값을 SQL 리터럴로 넣어 라인별 부분 인덱스(create_index(line=...))의 조건과 맞춤
+    (파라미터로 넘기면 플래너가 부분 인덱스를 고를 수 없음). 나머지는 파라미터
+    """
+    conditions, params = [], {}
+    for name, value in filters.items():
+        if name == "line":
+            # 값 quoting은 psycopg(sql.Literal). 검색 쿼리는 파라미터와 함께 실행되므로 리터럴 안의 %는 %%로
+            predicate = sql.SQL("line IN ({})").format(sql.SQL(", ").join(sql.Literal(str(line)) for line in value))
+            conditions.append(predicate.as_string(None).replace("%", "%%"))
+        elif name == "capture_date":
+            start, end = value
+            if start is not None:
+                conditions.append("capture_date >= %(capture_date_from)s")
+                params["capture_date_from"] = start
+            if end is not None:
+                conditions.append("capture_date <= %(capture_date_to)s")
+                params["capture_date_to"] = end
+        else:
+            conditions.append(f"{name} = ANY(%(filter_{name})s)")
+            params[f"filter_{name}"] = value
+    return ("WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def matches_filters(record, filters):
+    """
+    메타데이터 딕셔너리(LocalVectorStore 행)가 normalize_filters() 조건을 모두 만족하는지
+    """
+    for name, value in filters.items():
+        if name == "capture_date":
+            date = record.get("capture_date")
+            start, end = value
+            if date is None or (start is not None and date < start.isoformat()) or \
+                    (end is not None and date > end.isoformat()):
+                return False
+        elif record.get(name) not in value:
+            return False
+    return True
+
+
+def projection_table(version):
+    return f"defect_images_{version}"
+
+
+def embedding_dim(conn, table):
+    # vector(n) 컬럼의 atttypmod = n
+    return conn.execute(
+        "SELECT atttypmod FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'embedding'", (table,)
+    ).fetchone()[0]
+
+
+def as_array(value):
+    # pgvector 버전에 따라 vector 컬럼이 numpy 배열 또는 Vector 객체로 읽힘
+    return np.asarray(value.to_numpy() if hasattr(value, "to_numpy") else value, dtype=np.float32)
+
+
+HNSW_DEFAULT_EF_SEARCH = 40  # pgvector 기본값. ef_search보다 많은 결과는 돌려주지 않음
+
+
+def aggregate_votes(results, temperature=None, evidence=3):
+    """
+    search() 결과 1개 -> 결함 종류별 ClassVote 목록 (점수 내림차순). VERDICT_MANY_SQL과 같은 계산
+    """
+    if not results:
+        return []
+    sims = np.array([row[2] for row in results], dtype=np.float64)
+    if temperature is None:
+        weights = sims * 100
+    else:
+        weights = np.exp((sims - sims.max()) / temperature)
+        weights /= weights.sum()
+
+    groups = {}
+    for (defect_type, filename, sim, row_id, *_), weight in zip(results, weights.tolist()):
+        group = groups.setdefault(defect_type, [0.0, 0, []])
+        group[0] += weight
+        group[1] += 1
+        group[2].append((filename, sim, row_id))
+
+    votes = []
+    for defect_type, (score, count, files) in groups.items():
+        files.sort(key=lambda item: item[1], reverse=True)
+        votes.append(ClassVote(defect_type, score, count, files[:evidence]))
+    votes.sort(key=lambda vote: vote.score, reverse=True)
+    return votes
+
+
+def chunked(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class VectorStore:
+    """
+    임베딩 저장소 백엔드 인터페이스
+    DefectRAG는 이 메서드들만 사용하므로, 백엔드를 바꿔도 ingest/search 코드는 그대로 동작
+    """
+
+    name = "Base"
+
+    def add(self, rows, chunk_size=5000, rebuild=False):
+        """
+        rows: DefectRow(또는 (filename, defect_type, embedding) 튜플) 이터러블. chunk_size 행 단위로 커밋
+        rebuild=True: 기존 데이터를 모두 지우고 새로 적재
+        반환값: 적재한 행 수
+        """
+        raise NotImplementedError
+
+    def search(self, query_vector, top_k=5, **options):
+        """
+        코사인 유사도 상위 top_k -> [(defect_type, filename, similarity, id), ...] (유사도 내림차순)
+        """
+        raise NotImplementedError
+
+    def search_many(self, query_vectors, top_k=5, **options):
+        """
+        여러 질의를 한 번에 검색 -> 질의 순서대로 search() 결과 목록
+        기본 구현은 search()를 반복 호출 (백엔드가 더 빠른 방법이 있으면 재정의)
+        """
+        return [self.search(query_vector, top_k, **options) for query_vector in query_vectors]
+
+    def verdict_many(self, query_vectors, top_k=200, temperature=None, evidence=3, **options):
+        """
+        질의마다 top_k 이웃의 결함 종류별 투표 집계 -> 질의 순서대로 ClassVote 목록 (점수 내림차순)
+        temperature: None이면 유사도*100 합산, 값이 있으면 softmax(sim / T) 가중 투표
+        evidence: 결함 종류마다 돌려줄 근거 파일 수
+        """
+        return [aggregate_votes(results, temperature, evidence)
+                for results in self.search_many(query_vectors, top_k, **options)]
+
+    def add_tiles(self, rows, chunk_size=5000, rebuild=False):
+        """
+        rows: TileRow 이터러블 (타일 모드). 반환값: 적재한 행 수
+        """
+        raise NotImplementedError(f"{self.name} 저장소는 타일 모드를 지원하지 않습니다.")
+
+    def search_tiles(self, query_vector, top_k=5, **options):
+        """
+        타일 검색 -> [(defect_type, filename, similarity, id, x, y, width, height), ...] (유사도 내림차순)
+        """
+        raise NotImplementedError(f"{self.name} 저장소는 타일 모드를 지원하지 않습니다.")
+
+    def count(self):
+        raise NotImplementedError
+
+    def entries(self, model_version):
+        """
+        model_version으로 만들어졌고 content_hash가 있는 행 -> [(id, content_hash, source_path), ...]
+        """
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def update_paths(self, updates):
+        """
+        updates: [(id, filename, defect_type, source_path), ...]  (이동/이름 변경된 파일 반영)
+                 뒤에 line, layer, capture_date, source_folder를 붙이면 메타데이터도 함께 갱신
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PostgresVectorStore(VectorStore):
+    """
+    PostgreSQL + pgvector 백엔드 (defect_images 테이블)
+    """
+
+    name = "PostgreSQL"
+
+    def __init__(self, db_info, pool_size=4, pool_timeout=30.0, storage="float32", rerank_factor=4, projection=None,
+                 dim=1024):
+        """
+        db_info: DB 접속 정보 딕셔너리
+        pool_size: 커넥션 풀 크기 (동시에 검색/저장할 수 있는 최대 세션 수)
+        pool_timeout: 풀에서 커넥션을 기다리는 최대 시간(초)
+        storage: ANN 인덱스/1차 검색의 벡터 형식 ("float32", "halfvec", "bit"). 설명은 NEAREST_SQL 참고
+        rerank_factor: halfvec/bit에서 float32로 재정렬할 후보 수 = top_k * rerank_factor
+        projection: 검색에 쓸 PCA 사영 버전 태그 (projection.py fit으로 등록). 질의를 사영해 축소 테이블에서 검색
+        dim: defect_images를 새로 만들 때의 임베딩 차원 (이미 있으면 테이블의 컬럼 차원을 그대로 사용)
+        """
+        if storage not in NEAREST_SQL:
+            raise ValueError(f"지원하지 않는 저장 방식입니다: {storage} (float32, halfvec, bit)")
+        if projection is not None and storage != "float32":
+            raise ValueError("projection은 storage='float32'에서만 사용할 수 있습니다.")
+        self.db_info = db_info
+        self.storage = storage
+        self.rerank_factor = rerank_factor
+
+        # DB 연결 및 테이블 생성
+        with psycopg.connect(**self.db_info, autocommit=True) as conn:
+            conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            register_vector(conn)
+            conn.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS defect_images (
+                    id SERIAL PRIMARY KEY,
+                    filename TEXT,
+                    defect_type TEXT,
+                    embedding vector({})
+                )
+            """).format(sql.Literal(int(dim))))
+            self.dim = embedding_dim(conn, "defect_images")
+            # 증분 ingest용 컬럼 (기존 테이블에도 추가)
+            conn.execute("""
+                ALTER TABLE defect_images
+                    ADD COLUMN IF NOT EXISTS content_hash TEXT,
+                    ADD COLUMN IF NOT EXISTS model_version TEXT,
+                    ADD COLUMN IF NOT EXISTS source_path TEXT
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS defect_images_version_hash_idx
+                ON defect_images (model_version, content_hash)
+            """)
+            # 검색 필터용 메타데이터 컬럼 (METADATA_FIELDS)
+            conn.execute("""
+                ALTER TABLE defect_images
+                    ADD COLUMN IF NOT EXISTS line TEXT,
+                    ADD COLUMN IF NOT EXISTS layer TEXT,
+                    ADD COLUMN IF NOT EXISTS capture_date DATE,
+                    ADD COLUMN IF NOT EXISTS source_folder TEXT
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS defect_images_metadata_idx
+                ON defect_images (line, layer, capture_date)
+            """)
+            # 타일 모드: 큰 이미지의 타일별 임베딩과 좌표
+            conn.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS defect_tiles (
+                    id SERIAL PRIMARY KEY,
+                    filename TEXT,
+                    defect_type TEXT,
+                    embedding vector({}),
+                    x INTEGER,
+                    y INTEGER,
+                    width INTEGER,
+                    height INTEGER,
+                    content_hash TEXT,
+                    model_version TEXT,
+                    source_path TEXT
+                )
+            """).format(sql.Literal(self.dim)))
+            version = conn.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'").fetchone()[0]
+            self.pgvector_version = tuple(int(part) for part in version.split(".")[:2])
+            if storage != "float32" and self.pgvector_version < (0, 7):
+                raise RuntimeError(f"storage='{storage}'는 pgvector 0.7 이상이 필요합니다. (현재 {version})")
+
+            # 등록된 PCA 사영: 적재할 때 모든 사영의 축소 테이블도 함께 채움
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS defect_projections (
+                    version TEXT PRIMARY KEY,
+                    input_dim INTEGER NOT NULL,
+                    dim INTEGER NOT NULL,
+                    whiten BOOLEAN NOT NULL,
+                    mean BYTEA NOT NULL,
+                    components BYTEA NOT NULL,
+                    explained_variance DOUBLE PRECISION,
+                    num_samples INTEGER,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+
+            # 결함 종류별 프로토타입(서브 중심)과 각 행이 속한 클러스터: 프로토타입이 있으면 적재할 때 함께 갱신
+            conn.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS defect_prototypes (
+                    defect_type TEXT NOT NULL,
+                    cluster INTEGER NOT NULL,
+                    centroid vector({}) NOT NULL,
+                    count BIGINT NOT NULL,
+                    PRIMARY KEY (defect_type, cluster)
+                )
+            """).format(sql.Literal(self.dim)))
+            for statement in PROTOTYPE_MEMBERS_SQL:
+                conn.execute(statement)
+
+            # 모델 버전 등록부: 활성 버전(defect_images)과 재임베딩 중/전환 전 버전의 테이블, 진행 상황
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS defect_model_versions (
+                    id SERIAL PRIMARY KEY,
+                    version TEXT UNIQUE NOT NULL,
+                    dim INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    table_name TEXT,
+                    rows_total BIGINT,
+                    rows_done BIGINT NOT NULL DEFAULT 0,
+                    rows_missing BIGINT NOT NULL DEFAULT 0,
+                    last_id INTEGER NOT NULL DEFAULT 0,
+                    rows_per_second DOUBLE PRECISION,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    activated_at TIMESTAMPTZ
+                )
+            """)
+
+            # DB 세대 번호 (BUMP_GENERATION_SQL 참고): 행 1개짜리 테이블
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS defect_generation (
+                    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                    generation BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            conn.execute("ALTER TABLE defect_generation ADD COLUMN IF NOT EXISTS schema_generation BIGINT NOT NULL DEFAULT 0")
+            conn.execute("INSERT INTO defect_generation DEFAULT VALUES ON CONFLICT DO NOTHING")
+            self._state_lock = threading.Lock()
+            self._load_state(conn)
+            print(f"✅ DB 연결 및 테이블 확인 완료 (저장 방식: {storage}, {self.dim}차원, "
+                  f"활성 모델 버전: {self.active_version or '미등록'}, 등록된 사영 {len(self.projections)}개, "
+                  f"프로토타입 {'사용' if self.prototypes else '없음'})")
+
+        if projection is not None and projection not in self.projections:
+            raise ValueError(f"등록되지 않은 사영입니다: {projection} (등록된 사영: {list(self.projections)})")
+        self.projection = self.projections.get(projection)
+        self.search_table = projection_table(projection) if projection else "defect_images"
+        self._build_sql()
+
+        # =================================================================
+        # 커넥션 풀: 세션을 미리 열어두고(pre-warm) pgvector 타입은 세션당 1번만 등록
+        # 커넥션을 빌려줄 때마다 health check 후, 끊긴 세션은 새로 연결
+        # =================================================================
+        self.pool = ConnectionPool(
+            kwargs={**self.db_info, "autocommit": True},
+            min_size=pool_size,
+            max_size=pool_size,
+            timeout=pool_timeout,
+            configure=register_vector,
+            check=ConnectionPool.check_connection,
+            name="defect-rag",
+            open=True,
+        )
+        self.pool.wait()
+        print(f"✅ 커넥션 풀 준비 완료 (세션 {pool_size}개)")
+
+    def _load_state(self, conn):
+        """
+        DB에서 저장소 상태(임베딩 차원, 등록된 사영, 프로토타입 유무, 활성 모델 버전, 구조 세대 번호)를 읽음
+        """
+        self.schema_generation = conn.execute("SELECT schema_generation FROM defect_generation").fetchone()[0]
+        self.dim = embedding_dim(conn, "defect_images")
+        self.projections = {}
+        for version, input_dim, dim, whiten, mean, components, explained, num_samples in conn.execute(
+                "SELECT version, input_dim, dim, whiten, mean, components, explained_variance, num_samples "
+                "FROM defect_projections ORDER BY created_at"):
+            self.projections[version] = EmbeddingProjection(
+                np.frombuffer(mean, dtype=np.float32),
+                np.frombuffer(components, dtype=np.float32).reshape(input_dim, dim),
+                whiten=whiten, explained_variance=explained, num_samples=num_samples,
+            )
+        self.prototypes = conn.execute("SELECT EXISTS (SELECT 1 FROM defect_prototypes)").fetchone()[0]
+        row = conn.execute("SELECT version FROM defect_model_versions WHERE status = 'active'").fetchone()
+        self.active_version = row[0] if row else None
+
+    def refresh(self, conn=None):
+        """
+        다른 프로세스의 모델 전환/사영/프로토타입 변경을 반영해 상태를 다시 읽음
+        검색에 쓰던 사영이 삭제됐으면(모델 전환 등) 원본 테이블 검색으로 돌아감
+        """
+        if conn is None:
+            with self.pool.connection() as conn:
+                return self.refresh(conn)
+        with self._state_lock:
+            old_dim, old_version = self.dim, self.active_version
+            self._load_state(conn)
+            if self.projection is not None and self.projection.version not in self.projections:
+                print(f"⚠️ 검색에 쓰던 사영({self.projection.version})이 삭제되어 원본 테이블에서 검색합니다.")
+                self.projection = None
+                self.search_table = "defect_images"
+            self._build_sql()
+        if (old_dim, old_version) != (self.dim, self.active_version):
+            print(f"🔄 저장소 상태 갱신: 모델 버전 {old_version or '-'} -> {self.active_version or '-'}, "
+                  f"{old_dim} -> {self.dim}차원")
+
+    def _check_state(self, conn=None):
+        # 구조 세대 번호가 바뀌었으면(다른 프로세스의 전환/사영/프로토타입 변경) 상태를 다시 읽음
+        if conn is None:
+            with self.pool.connection() as conn:
+                return self._check_state(conn)
+        generation = conn.execute("SELECT schema_generation FROM defect_generation", prepare=True).fetchone()[0]
+        if generation != self.schema_generation:
+            self.refresh(conn)
+
+    def _build_sql(self):
+        self._sql_cache = {}
+
+    def _search_sql(self, kind, name, where=""):
+        """
+        검색 SQL (종류, 템플릿 이름, 필터 WHERE 절)마다 1번 만들어 보관
+        kind: "default"(저장 방식/사영), "exact"(원본 float32 전체 스캔, recall 기준값), "prototype"(2단계 검색)
+        """
+        key = (kind, name, where)
+        if key not in self._sql_cache:
+            template = SEARCH_TEMPLATES[name]
+            if kind == "prototype":
+                query = build_search_sql(template, "float32", nearest=PROTOTYPE_NEAREST_SQL, where=where)
+            elif kind == "exact":
+                query = build_search_sql(template, "float32", where=where)
+            elif self.projection is not None and not where:
+                query = build_search_sql(template, self.storage, self.search_table)
+            else:
+                # 사영 축소 테이블에는 메타데이터가 없으므로 필터 검색은 원본 테이블에서
+                query = build_search_sql(template, self.storage, dim=self.dim, where=where)
+            self._sql_cache[key] = query
+        return self._sql_cache[key]
+
+    def add(self, rows, chunk_size=5000, rebuild=False):
+        """
+        binary COPY로 chunk_size 행씩 스트리밍하며, chunk마다 트랜잭션 1개로 커밋
+        rebuild=True: 테이블을 비우고 ANN 인덱스(hnsw/ivfflat)를 drop -> 적재 -> 같은 정의로 재생성
+        등록된 PCA 사영이 있으면 같은 트랜잭션에서 사영한 벡터를 축소 테이블에도 적재
+        프로토타입이 있으면 같은 트랜잭션에서 새 행을 가장 가까운 서브 중심에 배정하고 중심을 갱신
+        (rebuild=True면 적재 후 같은 클러스터 크기로 프로토타입을 다시 만듦)
+        다른 프로세스가 모델을 전환했거나 사영/프로토타입을 바꿨으면 먼저 상태를 다시 읽음 (refresh)
+        """
+        self._check_state()
+        tables = ["defect_images"] + [projection_table(version) for version in self.projections]
+        total = 0
+        cluster_size = None
+        with self.pool.connection() as conn:
+            index_defs = []
+            if rebuild:
+                with conn.transaction():
+                    index_defs = self._drop_ann_indexes(conn, tables)
+                    if self.prototypes:
+                        cluster_size = conn.execute(
+                            "SELECT GREATEST(ceil(avg(count)), 1)::int FROM defect_prototypes").fetchone()[0]
+                        conn.execute("DELETE FROM defect_prototypes")
+                        conn.execute(BUMP_SCHEMA_SQL)
+                    conn.execute("TRUNCATE defect_images CASCADE")  # 축소 테이블, 클러스터 배정도 함께 비움
+                    conn.execute(BUMP_GENERATION_SQL)
+                print(f"🧹 테이블 초기화 완료 (ANN 인덱스 {len(index_defs)}개 임시 삭제)")
+
+            with conn.cursor() as cursor:
+                for chunk in chunked(rows, chunk_size):
+                    chunk = [DefectRow(*row) for row in chunk]
+                    with conn.transaction():
+                        if self.projections or self.prototypes:
+                            self._copy_with_ids(cursor, chunk)
+                        else:
+                            with cursor.copy(COPY_SQL) as copy:
+                                copy.set_types(COPY_TYPES)
+                                for row in chunk:
+                                    copy.write_row(row)
+                        cursor.execute(BUMP_GENERATION_SQL)
+                    total += len(chunk)
+
+            if index_defs:
+                print(f"🔧 ANN 인덱스 {len(index_defs)}개 재생성 중...")
+                for index_def in index_defs:
+                    conn.execute(index_def)
+                conn.execute(BUMP_GENERATION_SQL)
+
+        if cluster_size is not None:
+            self.build_prototypes(cluster_size)
+        return total
+
+    def add_tiles(self, rows, chunk_size=5000, rebuild=False):
+        """
+        타일 행을 defect_tiles에 binary COPY로 적재 (chunk마다 트랜잭션 1개)
+        rebuild=True: defect_tiles를 비우고 ANN 인덱스를 drop -> 적재 -> 재생성
+        """
+        total = 0
+        with self.pool.connection() as conn:
+            index_defs = []
+            if rebuild:
+                with conn.transaction():
+                    index_defs = self._drop_ann_indexes(conn, ["defect_tiles"])
+                    conn.execute("TRUNCATE defect_tiles")
+
+            with conn.cursor() as cursor:
+                for chunk in chunked(rows, chunk_size):
+                    with conn.transaction():
+                        with cursor.copy(TILE_COPY_SQL) as copy:
+                            copy.set_types(TILE_COPY_TYPES)
+                            for row in chunk:
+                                copy.write_row(TileRow(*row))
+                    total += len(chunk)
+
+            for index_def in index_defs:
+                conn.execute(index_def)
+        return total
+
+    def _copy_with_ids(self, cursor, chunk):
+        # id를 시퀀스에서 미리 받아 원본 행과 축소 행/클러스터 배정을 같은 id로 적재
+        ids = [row_id for row_id, in cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence('defect_images', 'id')) FROM generate_series(1, %s)",
+            (len(chunk),),
+        ).fetchall()]
+        with cursor.copy(COPY_WITH_ID_SQL) as copy:
+            copy.set_types(["int4"] + COPY_TYPES)
+            for row_id, row in zip(ids, chunk):
+                copy.write_row((row_id, *row))
+
+        embeddings = np.stack([as_array(row.embedding) for row in chunk])
+        for version, projection in self.projections.items():
+            self._copy_projected(cursor, version, ids, projection.apply(embeddings))
+        if self.prototypes:
+            self._assign_prototypes(cursor, ids, [row.defect_type for row in chunk], embeddings)
+
+    @staticmethod
+    def _assign_prototypes(cursor, ids, defect_types, embeddings):
+        """
+        새 행을 같은 결함 종류의 가장 가까운 서브 중심에 배정하고, 중심을 누적 평균으로 갱신 (online k-means)
+        처음 보는 결함 종류는 클러스터 0을 새로 만듦. 삭제된 행은 중심에서 빼지 않으므로 가끔 build_prototypes로 재생성
+        """
+        embeddings = normalize(embeddings)
+        defect_types = np.array(defect_types, dtype=object)
+        ids = np.array(ids)
+        members = []
+        for defect_type in dict.fromkeys(defect_types.tolist()):
+            mask = defect_types == defect_type
+            vectors = embeddings[mask]
+            # FOR UPDATE: 같은 결함 종류를 동시에 적재하는 다른 세션과 중심 갱신이 섞이지 않도록 잠금
+            rows = cursor.execute(
+                "SELECT cluster, centroid, count FROM defect_prototypes WHERE defect_type = %s "
+                "ORDER BY cluster FOR UPDATE",
+                (defect_type,),
+            ).fetchall()
+            if rows:
+                clusters = np.array([row[0] for row in rows])
+                centroids = np.stack([as_array(row[1]) for row in rows])
+                counts = np.array([row[2] for row in rows], dtype=np.float64)
+                assignment = (vectors @ normalize(centroids).T).argmax(axis=1)
+            else:
+                clusters = np.zeros(1, dtype=np.int64)
+                centroids = np.zeros((1, vectors.shape[1]), dtype=np.float32)
+                counts = np.zeros(1)
+                assignment = np.zeros(len(vectors), dtype=np.int64)
+
+            added = np.bincount(assignment, minlength=len(clusters))
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            touched = np.flatnonzero(added)
+            new_counts = counts[touched] + added[touched]
+            new_centroids = (centroids[touched] * counts[touched, None] + sums[touched]) / new_counts[:, None]
+            cursor.executemany("""
+                INSERT INTO defect_prototypes (defect_type, cluster, centroid, count) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (defect_type, cluster) DO UPDATE SET centroid = EXCLUDED.centroid, count = EXCLUDED.count
+            """, [(defect_type, int(cluster), centroid.astype(np.float32), int(count))
+                  for cluster, centroid, count in zip(clusters[touched], new_centroids, new_counts)])
+            members.extend(zip(ids[mask].tolist(), [defect_type] * len(vectors), clusters[assignment].tolist()))
+
+        with cursor.copy("COPY defect_prototype_members (id, defect_type, cluster) FROM STDIN WITH (FORMAT BINARY)") \
+                as copy:
+            copy.set_types(["int4", "text", "int4"])
+            for member in members:
+                copy.write_row(member)
+
+    @staticmethod
+    def _copy_projected(cursor, version, ids, vectors):
+        with cursor.copy(sql.SQL("COPY {} (id, embedding) FROM STDIN WITH (FORMAT BINARY)").format(
+                sql.Identifier(projection_table(version)))) as copy:
+            copy.set_types(["int4", "vector"])
+            for row_id, vector in zip(ids, vectors):
+                copy.write_row((row_id, vector))
+
+    def iter_embeddings(self, chunk_size=5000, model_version=None):
+        """
+        저장된 임베딩을 id 순서로 chunk_size개씩 -> (id 목록, defect_type 목록, (N, dim) 행렬) yield
+        model_version: 지정하면 그 모델로 만든 임베딩만
+        """
+        last_id = 0
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute("""
+                    SELECT id, defect_type, embedding
+                    FROM defect_images
+                    WHERE id > %s AND (%s::text IS NULL OR model_version = %s)
+                    ORDER BY id
+                    LIMIT %s
+                """, (last_id, model_version, model_version, chunk_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [row[0] for row in rows], [row[1] for row in rows], np.stack([as_array(row[2]) for row in rows])
+
+    def iter_rows(self, chunk_size=5000):
+        """
+        defect_images 전체를 id 순서로 chunk_size개씩 -> DefectRow 목록 yield (스냅샷 내보내기용)
+        """
+        last_id = 0
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute(sql.SQL("""
+                    SELECT id, {}
+                    FROM defect_images
+                    WHERE id > %s
+                    ORDER BY id
+                    LIMIT %s
+                """).format(sql.SQL(", ").join(map(sql.Identifier, DefectRow._fields))),
+                    (last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [DefectRow(*row[1:])._replace(embedding=as_array(row[3])) for row in rows]
+
+    def register_projection(self, projection, chunk_size=5000):
+        """
+        PCA 사영을 버전 태그로 저장하고 축소 테이블(defect_images_<version>)을 만들어 기존 행을 사영해 채움
+        이후 add()는 이 사영의 축소 행도 함께 적재
+        """
+        table = projection_table(projection.version)
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                conn.execute("""
+                    INSERT INTO defect_projections
+                        (version, input_dim, dim, whiten, mean, components, explained_variance, num_samples)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (version) DO NOTHING
+                """, (projection.version, projection.input_dim, projection.dim, projection.whiten,
+                      projection.mean.tobytes(), projection.components.tobytes(),
+                      projection.explained_variance, projection.num_samples))
+                conn.execute(sql.SQL("""
+                    CREATE TABLE IF NOT EXISTS {} (
+                        id INTEGER PRIMARY KEY REFERENCES defect_images (id) ON DELETE CASCADE,
+                        embedding vector({})
+                    )
+                """).format(sql.Identifier(table), sql.Literal(projection.dim)))
+                conn.execute(BUMP_SCHEMA_SQL)
+        self.projections[projection.version] = projection
+        added = self.sync_projection(projection.version, chunk_size)
+        print(f"✅ 사영 등록 완료: {projection.version} -> {table} ({added}개 사영)")
+
+    def sync_projection(self, version, chunk_size=5000):
+        """
+        축소 테이블에 없는 행(사영 등록 전/다른 프로세스가 적재한 행)을 사영해 채움 -> 채운 행 수
+        """
+        projection = self.projections[version]
+        table = sql.Identifier(projection_table(version))
+        last_id, total = 0, 0
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                while True:
+                    with conn.transaction():
+                        rows = cursor.execute(sql.SQL("""
+                            SELECT i.id, i.embedding
+                            FROM defect_images i
+                            WHERE i.id > %s AND NOT EXISTS (SELECT 1 FROM {} p WHERE p.id = i.id)
+                            ORDER BY i.id
+                            LIMIT %s
+                        """).format(table), (last_id, chunk_size)).fetchall()
+                        if not rows:
+                            return total
+                        ids = [row[0] for row in rows]
+                        vectors = projection.apply(np.stack([as_array(row[1]) for row in rows]))
+                        self._copy_projected(cursor, version, ids, vectors)
+                        cursor.execute(BUMP_GENERATION_SQL)
+                    last_id = ids[-1]
+                    total += len(rows)
+
+    def drop_projection(self, version):
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(projection_table(version))))
+                conn.execute("DELETE FROM defect_projections WHERE version = %s", (version,))
+                conn.execute(BUMP_GENERATION_SQL)
+                conn.execute(BUMP_SCHEMA_SQL)
+        self.projections.pop(version, None)
+        print(f"🧹 사영 삭제 완료: {version}")
+
+    def build_prototypes(self, cluster_size=1000, iterations=20, model_version=None, chunk_size=5000, seed=0):
+        """
+        결함 종류마다 코사인 k-means로 서브 중심을 만들어 defect_prototypes/defect_prototype_members를 새로 채움
+        cluster_size: 서브 중심 1개가 대표할 평균 행 수 (결함 종류의 행 수 / cluster_size개 만큼 서브 중심 생성)
+                      -> 2단계 검색이 훑는 행 수가 DB 크기가 아니라 classes * cells * cluster_size 정도로 고정됨
+        model_version: 지정하면 그 모델로 만든 임베딩만 사용
+        이후 add()는 새 행을 이 프로토타입에 배정하며 중심을 갱신
+        """
+        start = time.perf_counter()
+        by_type = {}
+        for ids, defect_types, matrix in self.iter_embeddings(chunk_size, model_version):
+            for row_id, defect_type, vector in zip(ids, defect_types, normalize(matrix)):
+                group = by_type.setdefault(defect_type, ([], []))
+                group[0].append(row_id)
+                group[1].append(vector)
+
+        prototypes, members = [], []
+        for defect_type, (ids, vectors) in by_type.items():
+            vectors = np.stack(vectors)
+            centroids, assignment = spherical_kmeans(vectors, clusters_for(len(vectors), cluster_size), iterations, seed)
+            counts = np.bincount(assignment, minlength=len(centroids))
+            prototypes.extend((defect_type, cluster, centroid, int(count))
+                              for cluster, (centroid, count) in enumerate(zip(centroids, counts)) if count)
+            members.extend(zip(ids, [defect_type] * len(ids), assignment.tolist()))
+
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                with conn.cursor() as cursor:
+                    cursor.execute("TRUNCATE defect_prototype_members")
+                    cursor.execute("DELETE FROM defect_prototypes")
+                    with cursor.copy("COPY defect_prototypes (defect_type, cluster, centroid, count) "
+                                     "FROM STDIN WITH (FORMAT BINARY)") as copy:
+                        copy.set_types(["text", "int4", "vector", "int8"])
+                        for prototype in prototypes:
+                            copy.write_row(prototype)
+                    with cursor.copy("COPY defect_prototype_members (id, defect_type, cluster) "
+                                     "FROM STDIN WITH (FORMAT BINARY)") as copy:
+                        copy.set_types(["int4", "text", "int4"])
+                        for member in members:
+                            copy.write_row(member)
+                    cursor.execute(BUMP_GENERATION_SQL)
+                    cursor.execute(BUMP_SCHEMA_SQL)
+        self.prototypes = bool(prototypes)
+
+        stats = {
+            'classes': len(by_type),
+            'prototypes': len(prototypes),
+            'rows': len(members),
+            'seconds': time.perf_counter() - start,
+        }
+        print(f"✅ 프로토타입 생성 완료: 결함 종류 {stats['classes']}개, 서브 중심 {stats['prototypes']}개, "
+              f"행 {stats['rows']}개 ({stats['seconds']:.1f}초)")
+        return stats
+
+    def prototype_stats(self):
+        """
+        -> [(defect_type, 서브 중심 수, 배정된 행 수, 가장 큰 클러스터 행 수), ...]
+        """
+        with self.pool.connection() as conn:
+            return conn.execute("""
+                SELECT defect_type, count(*), sum(count)::bigint, max(count)
+                FROM defect_prototypes
+                GROUP BY defect_type
+                ORDER BY defect_type
+            """).fetchall()
+
+    def drop_prototypes(self):
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                conn.execute("TRUNCATE defect_prototype_members")
+                conn.execute("DELETE FROM defect_prototypes")
+                conn.execute(BUMP_GENERATION_SQL)
+                conn.execute(BUMP_SCHEMA_SQL)
+        self.prototypes = False
+        print("🧹 프로토타입 삭제 완료")
+
+    # =================================================================
+    # 모델 버전 전환: 새 모델의 임베딩을 그림자 테이블(defect_images_model<id>)에 채우는 동안
+    # 검색/적재는 계속 defect_images(활성 버전)에서 동작. 전환은 한 트랜잭션 안의 테이블 이름 교체라
+    # 검색은 항상 전환 전 버전 또는 전환 후 버전 하나만 봄. 이전 테이블은 gc_versions()까지 보관
+    # =================================================================
+    def _register_active(self, conn):
+        """
+        활성 버전 -> (등록부 id, version). 등록부가 없던 기존 DB면 defect_images를 활성 버전으로 등록
+        (버전 이름은 가장 많은 행의 model_version)
+        """
+        row = conn.execute("SELECT id, version FROM defect_model_versions WHERE status = 'active'").fetchone()
+        if row:
+            return row
+        row = conn.execute("""
+            SELECT model_version FROM defect_images
+            WHERE model_version IS NOT NULL
+            GROUP BY model_version
+            ORDER BY count(*) DESC
+            LIMIT 1
+        """).fetchone()
+        return conn.execute("""
+            INSERT INTO defect_model_versions (version, dim, status, table_name, activated_at)
+            VALUES (%s, %s, 'active', 'defect_images', now())
+            ON CONFLICT (version) DO UPDATE
+                SET dim = EXCLUDED.dim, status = 'active', table_name = 'defect_images', activated_at = now()
+            RETURNING id, version
+        """, (row[0] if row else "legacy", self.dim)).fetchone()
+
+    def begin_version(self, version, dim):
+        """
+        version(새 모델의 model_version)의 재임베딩 시작 -> 등록부 행 (versions() 형식)
+        dim: 새 모델의 임베딩 차원
+        이미 그 버전을 재임베딩 중이면 이어서 진행 (last_id 다음 행부터). 다른 버전을 재임베딩 중이면 에러
+        """
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                conn.execute("LOCK TABLE defect_model_versions IN EXCLUSIVE MODE")  # 동시에 시작하는 작업 방지
+                _, active = self._register_active(conn)
+                self.active_version = active
+                if version == active:
+                    raise ValueError(f"이미 활성 버전입니다: {version}")
+                building = conn.execute(
+                    "SELECT version, dim FROM defect_model_versions WHERE status = 'building'").fetchone()
+                if building and building[0] != version:
+                    raise RuntimeError(f"다른 버전을 재임베딩 중입니다: {building[0]} (abort 후 다시 시작하세요)")
+                if building and building[1] != dim:
+                    raise ValueError(f"재임베딩 중인 {version}의 차원({building[1]})과 다릅니다: {dim}")
+
+                if not building:
+                    version_id = conn.execute("""
+                        INSERT INTO defect_model_versions (version, dim, status) VALUES (%s, %s, 'building')
+                        ON CONFLICT (version) DO UPDATE
+                            SET dim = EXCLUDED.dim, status = 'building', rows_done = 0, rows_missing = 0,
+                                last_id = 0, rows_per_second = NULL, created_at = now(), updated_at = now(),
+                                activated_at = NULL
+                        RETURNING id
+                    """, (version, dim)).fetchone()[0]
+                    table = f"defect_images_model{version_id}"
+                    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table)))
+                    conn.execute(sql.SQL("""
+                        CREATE TABLE {table} (
+                            id INTEGER NOT NULL,
+                            filename TEXT,
+                            defect_type TEXT,
+                            embedding vector({dim}),
+                            content_hash TEXT,
+                            model_version TEXT,
+                            source_path TEXT,
+                            line TEXT,
+                            layer TEXT,
+                            capture_date DATE,
+                            source_folder TEXT,
+                            CONSTRAINT {pkey} PRIMARY KEY (id)
+                        )
+                    """).format(table=sql.Identifier(table), dim=sql.Literal(int(dim)),
+                                pkey=sql.Identifier(f"{table}_pkey")))
+                    conn.execute(sql.SQL("CREATE INDEX {} ON {} (model_version, content_hash)").format(
+                        sql.Identifier(f"{table}_version_hash_idx"), sql.Identifier(table)))
+                    conn.execute(sql.SQL("CREATE INDEX {} ON {} (line, layer, capture_date)").format(
+                        sql.Identifier(f"{table}_metadata_idx"), sql.Identifier(table)))
+                    conn.execute("UPDATE defect_model_versions SET table_name = %s WHERE id = %s",
+                                 (table, version_id))
+                    print(f"🔧 새 모델 버전 등록: {version} ({dim}차원) -> {table} (활성 버전: {active})")
+
+                conn.execute("""
+                    UPDATE defect_model_versions
+                    SET rows_total = rows_done + rows_missing
+                                     + (SELECT count(*) FROM defect_images WHERE id > last_id)
+                    WHERE version = %s
+                """, (version,))
+        return self.versions(version)[0]
+
+    def pending_rows(self, last_id, limit):
+        """
+        활성 테이블에서 id가 last_id보다 큰 행
+        -> [(id, filename, defect_type, content_hash, source_path, line, layer, capture_date, source_folder), ...] (id 순서)
+        """
+        with self.pool.connection() as conn:
+            return conn.execute("""
+                SELECT id, filename, defect_type, content_hash, source_path, line, layer, capture_date, source_folder
+                FROM defect_images
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, limit)).fetchall()
+
+    def add_version_rows(self, version, rows, last_id, missing=0, rows_per_second=None):
+        """
+        재임베딩한 행을 그림자 테이블에 적재하고 같은 트랜잭션에서 진행 상황을 기록
+        rows: [(활성 테이블의 id, DefectRow), ...]
+        last_id: 이번까지 처리한(적재 또는 건너뛴) 마지막 id. 중단 후 다시 시작하면 여기부터
+        missing: 원본 이미지가 없어 건너뛴 행 수 (전환하면 사라짐)
+        """
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                with conn.cursor() as cursor:
+                    table = cursor.execute(
+                        "SELECT table_name FROM defect_model_versions WHERE version = %s AND status = 'building' "
+                        "FOR UPDATE", (version,)).fetchone()
+                    if table is None:
+                        raise RuntimeError(f"재임베딩 중인 버전이 아닙니다: {version}")
+                    with cursor.copy(sql.SQL("COPY {} (id, {}) FROM STDIN WITH (FORMAT BINARY)").format(
+                            sql.Identifier(table[0]), sql.SQL(", ".join(DefectRow._fields)))) as copy:
+                        copy.set_types(["int4"] + COPY_TYPES)
+                        for row_id, row in rows:
+                            copy.write_row((row_id, *row))
+                    cursor.execute("""
+                        UPDATE defect_model_versions
+                        SET rows_done = rows_done + %s, rows_missing = rows_missing + %s, last_id = %s,
+                            rows_per_second = %s, updated_at = now(),
+                            rows_total = rows_done + rows_missing + %s + %s
+                                         + (SELECT count(*) FROM defect_images WHERE id > %s)
+                        WHERE version = %s
+                    """, (len(rows), missing, last_id, rows_per_second, len(rows), missing, last_id, version))
+
+    def prepare_version(self, version):
+        """
+        활성 테이블과 같은 ANN 인덱스를 그림자 테이블에 미리 생성 (전환 트랜잭션이 인덱스 빌드를 기다리지 않도록)
+        """
+        with self.pool.connection() as conn:
+            table, dim = conn.execute(
+                "SELECT table_name, dim FROM defect_model_versions WHERE version = %s AND status = 'building'",
+                (version,)).fetchone()
+            indexes = conn.execute("""
+                SELECT c.relname, am.amname, opc.opcname, c.reloptions, pg_get_expr(i.indpred, i.indrelid)
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_am am ON am.oid = c.relam
+                JOIN pg_opclass opc ON opc.oid = i.indclass[0]
+                WHERE i.indrelid = 'defect_images'::regclass AND am.amname IN ('hnsw', 'ivfflat')
+            """).fetchall()
+            storages = {opclass: storage for storage, (_, opclass) in INDEX_TARGETS.items()}
+            for name, method, opclass, options, predicate in indexes:
+                index_name = table + name[len("defect_images"):]
+                target = INDEX_TARGETS[storages[opclass]][0].format(dim=dim)
+                start = time.perf_counter()
+                conn.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(index_name)))
+                conn.execute(sql.SQL("CREATE INDEX {} ON {} USING {} ({} {}){}{}").format(
+                    sql.Identifier(index_name), sql.Identifier(table), sql.SQL(method), sql.SQL(target),
+                    sql.SQL(opclass), sql.SQL(f" WITH ({', '.join(options)})" if options else ""),
+                    sql.SQL(f" WHERE {predicate}" if predicate else "")))
+                print(f"✅ {method.upper()} 인덱스 생성 완료 ({table}, {time.perf_counter() - start:.1f}초)")
+        return len(indexes)
+
+    @staticmethod
+    def _rename_indexes(conn, table, old_prefix, new_prefix):
+        # 인덱스 이름은 "<테이블 이름>_..." 규칙이라 테이블 이름을 바꿀 때 접두어도 같이 바꿔 이름 충돌을 막음
+        for name, in conn.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (table,)).fetchall():
+            if name.startswith(old_prefix):
+                conn.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                    sql.Identifier(name), sql.Identifier(new_prefix + name[len(old_prefix):])))
+
+    def activate_version(self, version):
+        """
+        재임베딩한 version으로 원자적 전환 -> {'activated', 'pending', 'deleted', 'updated', 'cluster_size'}
+        한 트랜잭션에서: defect_images 쓰기 잠금(검색은 계속) -> 그 사이 삭제/이동된 행 반영 -> 테이블 이름 교체
+        pending: 아직 재임베딩하지 않은 새 행 수. 0이 아니면 전환하지 않음 (이어서 재임베딩 후 다시 호출)
+        PCA 사영은 이전 모델의 임베딩 공간이라 삭제. 프로토타입은 비우고, 있었다면 cluster_size로 다시 만들어야 함
+        """
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                state = conn.execute("""
+                    SELECT id, status, table_name, dim, last_id FROM defect_model_versions
+                    WHERE version = %s FOR UPDATE
+                """, (version,)).fetchone()
+                if state is None or state[1] != "building":
+                    raise ValueError(f"재임베딩 중인 버전이 아닙니다: {version}")
+                version_id, _, table, dim, last_id = state
+
+                # EXCLUSIVE: 적재/삭제만 막고 검색(SELECT)은 그대로 허용
+                conn.execute("LOCK TABLE defect_images IN EXCLUSIVE MODE")
+                pending = conn.execute("SELECT count(*) FROM defect_images WHERE id > %s", (last_id,)).fetchone()[0]
+                if pending:
+                    return {'activated': False, 'pending': pending, 'deleted': 0, 'updated': 0, 'cluster_size': None}
+
+                old_id, old_version = self._register_active(conn)
+                table_id = sql.Identifier(table)
+                deleted = conn.execute(sql.SQL(
+                    "DELETE FROM {} s WHERE NOT EXISTS (SELECT 1 FROM defect_images i WHERE i.id = s.id)"
+                ).format(table_id)).rowcount
+                updated = conn.execute(sql.SQL("""
+                    UPDATE {} s SET filename = i.filename, defect_type = i.defect_type, source_path = i.source_path,
+                                    line = i.line, layer = i.layer, capture_date = i.capture_date,
+                                    source_folder = i.source_folder
+                    FROM defect_images i
+                    WHERE i.id = s.id
+                      AND (s.filename, s.defect_type, s.source_path, s.line, s.layer, s.capture_date, s.source_folder)
+                          IS DISTINCT FROM
+                          (i.filename, i.defect_type, i.source_path, i.line, i.layer, i.capture_date, i.source_folder)
+                """).format(table_id)).rowcount
+
+                for projection_version, in conn.execute("SELECT version FROM defect_projections").fetchall():
+                    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(
+                        sql.Identifier(projection_table(projection_version))))
+                conn.execute("DELETE FROM defect_projections")
+                cluster_size = conn.execute(
+                    "SELECT GREATEST(ceil(avg(count)), 1)::int FROM defect_prototypes").fetchone()[0]
+                conn.execute("DROP TABLE defect_prototype_members")
+                conn.execute("DELETE FROM defect_prototypes")
+                conn.execute(sql.SQL("ALTER TABLE defect_prototypes ALTER COLUMN centroid TYPE vector({})").format(
+                    sql.Literal(dim)))
+
+                # id 시퀀스를 새 테이블로 옮겨 전환 후 적재하는 행도 기존 id 다음 번호를 받도록 함
+                sequence = conn.execute("SELECT pg_get_serial_sequence('defect_images', 'id')").fetchone()[0]
+                conn.execute("ALTER TABLE defect_images ALTER COLUMN id DROP DEFAULT")
+                conn.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.id").format(sql.SQL(sequence), table_id))
+                conn.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN id SET DEFAULT nextval({})").format(
+                    table_id, sql.Literal(sequence)))
+
+                retired = f"defect_images_model{old_id}"
+                self._rename_indexes(conn, "defect_images", "defect_images", retired)
+                conn.execute(sql.SQL("ALTER TABLE defect_images RENAME TO {}").format(sql.Identifier(retired)))
+                self._rename_indexes(conn, table, table, "defect_images")
+                conn.execute(sql.SQL("ALTER TABLE {} RENAME TO defect_images").format(table_id))
+                for statement in PROTOTYPE_MEMBERS_SQL:
+                    conn.execute(statement)
+                conn.execute(BUMP_GENERATION_SQL)
+                conn.execute(BUMP_SCHEMA_SQL)
+
+                conn.execute("""
+                    UPDATE defect_model_versions SET status = 'retired', table_name = %s, updated_at = now()
+                    WHERE id = %s
+                """, (retired, old_id))
+                conn.execute("""
+                    UPDATE defect_model_versions
+                    SET status = 'active', table_name = 'defect_images', updated_at = now(), activated_at = now()
+                    WHERE id = %s
+                """, (version_id,))
+
+        self.refresh()
+        print(f"✅ 모델 버전 전환 완료: {old_version} -> {version} (삭제 반영 {deleted}개, 경로 갱신 {updated}개, "
+              f"이전 테이블 {retired}은 gc까지 보관)")
+        return {'activated': True, 'pending': 0, 'deleted': deleted, 'updated': updated, 'cluster_size': cluster_size}
+
+    def gc_versions(self):
+        """
+        전환 후 보관 중인 이전 버전 테이블을 삭제 -> 삭제한 버전 목록
+        """
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                rows = conn.execute("SELECT id, version, table_name FROM defect_model_versions "
+                                    "WHERE status = 'retired' FOR UPDATE").fetchall()
+                for version_id, _, table in rows:
+                    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table)))
+                    conn.execute("UPDATE defect_model_versions SET status = 'dropped', table_name = NULL, "
+                                 "updated_at = now() WHERE id = %s", (version_id,))
+        for _, version, table in rows:
+            print(f"🧹 이전 모델 버전 삭제: {version} ({table})")
+        return [version for _, version, _ in rows]
+
+    def set_active_version(self, version):
+        """
+        defect_images 전체를 version의 임베딩으로 바꿔 넣은 뒤(스냅샷 가져오기) 등록부의 활성 버전을 version으로 기록
+        이전 활성 버전의 행은 이미 없으므로 dropped로 표시. 같은 버전이 전환 전 테이블로 보관 중이었다면 그 테이블도 삭제
+        """
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                conn.execute("LOCK TABLE defect_model_versions IN EXCLUSIVE MODE")
+                row = conn.execute("SELECT status, table_name FROM defect_model_versions WHERE version = %s",
+                                   (version,)).fetchone()
+                if row and row[0] == "building":
+                    raise RuntimeError(f"재임베딩 중인 버전입니다: {version} (먼저 abort 하세요)")
+                if row and row[0] == "retired":
+                    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(row[1])))
+                conn.execute("""
+                    UPDATE defect_model_versions SET status = 'dropped', table_name = NULL, updated_at = now()
+                    WHERE status = 'active' AND version <> %s
+                """, (version,))
+                conn.execute("""
+                    INSERT INTO defect_model_versions (version, dim, status, table_name, activated_at)
+                    VALUES (%s, %s, 'active', 'defect_images', now())
+                    ON CONFLICT (version) DO UPDATE
+                        SET dim = EXCLUDED.dim, status = 'active', table_name = 'defect_images',
+                            updated_at = now(), activated_at = now()
+                """, (version, self.dim))
+                conn.execute(BUMP_SCHEMA_SQL)
+        self.refresh()
+
+    def abort_version(self, version):
+        """
+        재임베딩 중인 version을 취소하고 그림자 테이블 삭제
+        """
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                row = conn.execute("DELETE FROM defect_model_versions WHERE version = %s AND status = 'building' "
+                                   "RETURNING table_name", (version,)).fetchone()
+                if row is None:
+                    raise ValueError(f"재임베딩 중인 버전이 아닙니다: {version}")
+                conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(row[0])))
+        print(f"🧹 재임베딩 취소: {version} ({row[0]} 삭제)")
+
+    def versions(self, version=None):
+        """
+        모델 버전 등록부 -> [{'version', 'dim', 'status', 'table', 'rows_total', 'rows_done', 'rows_missing',
+                             'last_id', 'rows_per_second', 'eta_seconds', 'updated_at', 'activated_at'}, ...]
+        status: building(재임베딩 중) / active(검색 중) / retired(전환 후 보관) / dropped(gc 완료)
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute("""
+                SELECT version, dim, status, table_name, rows_total, rows_done, rows_missing, last_id,
+                       rows_per_second, updated_at, activated_at
+                FROM defect_model_versions
+                WHERE %s::text IS NULL OR version = %s
+                ORDER BY id
+            """, (version, version)).fetchall()
+        versions = []
+        for version, dim, status, table, total, done, missing, last_id, rate, updated_at, activated_at in rows:
+            remaining = max((total or 0) - done - missing, 0)
+            versions.append({
+                'version': version, 'dim': dim, 'status': status, 'table': table,
+                'rows_total': total, 'rows_done': done, 'rows_missing': missing, 'last_id': last_id,
+                'rows_per_second': rate,
+                'eta_seconds': remaining / rate if status == "building" and rate else None,
+                'updated_at': updated_at, 'activated_at': activated_at,
+            })
+        return versions
+
+    def count(self):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM defect_images").fetchone()[0]
+
+    def generation(self):
+        """
+        현재 DB 세대 번호 (BUMP_GENERATION_SQL 참고). 질의 결과 캐시의 키에 들어감
+        """
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT generation FROM defect_generation").fetchone()[0]
+
+    def entries(self, model_version):
+        with self.pool.connection() as conn:
+            return conn.execute("""
+                SELECT id, content_hash, source_path
+                FROM defect_images
+                WHERE model_version = %s AND content_hash IS NOT NULL
+            """, (model_version,)).fetchall()
+
+    def delete(self, ids):
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                conn.execute("DELETE FROM defect_images WHERE id = ANY(%s)", (list(ids),))
+                conn.execute(BUMP_GENERATION_SQL)
+
+    def update_paths(self, updates):
+        self._check_state()
+        paths = [(filename, defect_type, source_path, row_id)
+                 for row_id, filename, defect_type, source_path, *metadata in updates if not metadata]
+        with_metadata = [(filename, defect_type, source_path, *metadata, row_id)
+                         for row_id, filename, defect_type, source_path, *metadata in updates if metadata]
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                with conn.cursor() as cursor:
+                    if paths:
+                        cursor.executemany(
+                            "UPDATE defect_images SET filename = %s, defect_type = %s, source_path = %s WHERE id = %s",
+                            paths
+                        )
+                    if with_metadata:
+                        cursor.executemany(
+                            "UPDATE defect_images SET filename = %s, defect_type = %s, source_path = %s, "
+                            "line = %s, layer = %s, capture_date = %s, source_folder = %s WHERE id = %s",
+                            with_metadata
+                        )
+                    if self.prototypes:
+                        self._reassign_prototypes(cursor, [update[0] for update in updates])
+                    cursor.execute(BUMP_GENERATION_SQL)
+
+    def _reassign_prototypes(self, cursor, ids):
+        """
+        결함 종류가 바뀐 행(재분류)을 예전 종류의 클러스터에서 빼고 새 종류의 가장 가까운 서브 중심에 다시 배정
+        (예전 중심에서는 빼지 않음. 삭제와 마찬가지로 가끔 build_prototypes로 재생성)
+        """
+        moved = cursor.execute(
+            "DELETE FROM defect_prototype_members m USING defect_images i "
+            "WHERE m.id = i.id AND m.id = ANY(%s) AND m.defect_type <> i.defect_type "
+            "RETURNING i.id, i.defect_type, i.embedding",
+            (list(ids),),
+        ).fetchall()
+        if moved:
+            self._assign_prototypes(cursor, [row[0] for row in moved], [row[1] for row in moved],
+                                    np.stack([as_array(row[2]) for row in moved]))
+
+    def create_index(self, method="hnsw", m=16, ef_construction=64, lists=None, maintenance_work_mem=None, tiles=False,
+                     line=None):
+        """
+        저장 방식(storage)에 맞는 ANN 인덱스 생성 (float32/halfvec: 코사인 거리, bit: 해밍 거리). 기존 ANN 인덱스는 먼저 삭제
+        method="hnsw"    : m(노드당 연결 수), ef_construction(빌드 시 후보 수)
+        method="ivfflat" : lists(클러스터 수). 미지정 시 행 수/1000 (최소 10)
+        maintenance_work_mem: 예) "2GB". 인덱스 빌드 메모리 (크면 빌드가 빨라짐)
+        projection을 지정한 저장소는 축소 테이블에 인덱스를 만듦
+        tiles=True: 타일 테이블(defect_tiles)에 float32 코사인 인덱스를 만듦
+        line: 지정하면 그 제품 라인 행만 담은 부분 인덱스(WHERE line = ...)를 만듦 (다른 라인/전체 인덱스는 유지)
+              filters={"line": line} 검색은 이 인덱스를 타서 다른 라인 행을 훑거나 걸러내지 않음
+        """
+        if line is not None and (tiles or self.projection is not None):
+            raise ValueError("라인별 부분 인덱스는 defect_images(사영/타일 아님)에만 만들 수 있습니다.")
+        table = "defect_tiles" if tiles else self.search_table
+        storage = "float32" if tiles else self.storage
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                if maintenance_work_mem:
+                    conn.execute("SELECT set_config('maintenance_work_mem', %s, true)", (maintenance_work_mem,))
+                if line is None:
+                    self._drop_ann_indexes(conn, [table], partial=False)
+
+                if method == "hnsw":
+                    options = sql.SQL("m = {}, ef_construction = {}").format(
+                        sql.Literal(int(m)), sql.Literal(int(ef_construction))
+                    )
+                elif method == "ivfflat":
+                    if lists is None:
+                        row_count = conn.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(
+                            sql.Identifier(table))).fetchone()[0]
+                        lists = max(row_count // 1000, 10)
+                    options = sql.SQL("lists = {}").format(sql.Literal(int(lists)))
+                else:
+                    raise ValueError(f"지원하지 않는 인덱스 방식입니다: {method} (hnsw 또는 ivfflat)")
+
+                target, opclass = INDEX_TARGETS[storage]
+                target = target.format(dim=self.dim)
+                if storage == "float32":
+                    index_name = f"{table}_embedding_{method}_idx"
+                else:
+                    index_name = f"defect_images_{storage}_{method}_idx"
+                predicate = sql.SQL("")
+                if line is not None:
+                    index_name = index_name[:-len("_idx")] + "_line_" + re.sub(r"\W", "_", str(line)) + "_idx"
+                    conn.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(index_name)))
+                    # filter_sql과 같은 식(line = 리터럴)이어야 플래너가 이 인덱스를 고름
+                    predicate = sql.SQL(" WHERE line = {}").format(sql.Literal(str(line)))
+
+                start = time.perf_counter()
+                conn.execute(sql.SQL(
+                    "CREATE INDEX {} ON {} USING {} ({} {}) WITH ({}){}"
+                ).format(sql.Identifier(index_name), sql.Identifier(table), sql.SQL(method),
+                         sql.SQL(target), sql.SQL(opclass), options, predicate))
+                conn.execute(BUMP_GENERATION_SQL)  # ANN 검색 결과가 달라질 수 있음
+        print(f"✅ {method.upper()} 인덱스 생성 완료 ({table}, {storage}{f', line={line}' if line is not None else ''}, "
+              f"{time.perf_counter() - start:.1f}초)")
+
+    def drop_index(self):
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                index_defs = self._drop_ann_indexes(conn, [self.search_table])
+                conn.execute(BUMP_GENERATION_SQL)
+        print(f"🧹 ANN 인덱스 {len(index_defs)}개 삭제")
+
+    def index_info(self):
+        """
+        검색 테이블(defect_images 또는 사영 축소 테이블)의 ANN 인덱스 목록 -> [(인덱스 이름, 크기, 정의), ...]
+        """
+        with self.pool.connection() as conn:
+            return conn.execute("""
+                SELECT indexname, pg_size_pretty(pg_relation_size((quote_ident(schemaname) || '.' || quote_ident(indexname))::regclass)), indexdef
+                FROM pg_indexes
+                WHERE tablename = %s AND indexdef ~* 'USING (hnsw|ivfflat)'
+            """, (self.search_table,)).fetchall()
+
+    @staticmethod
+    def _drop_ann_indexes(conn, tables, partial=None):
+        """
+        tables의 ANN 인덱스를 drop하고, 재생성용 CREATE INDEX 문 목록을 반환
+        partial=False: 라인별 부분 인덱스(WHERE 절 있음)는 남기고 전체 인덱스만 drop
+        """
+        index_rows = conn.execute("""
+            SELECT schemaname, indexname, indexdef
+            FROM pg_indexes
+            WHERE tablename = ANY(%s) AND indexdef ~* 'USING (hnsw|ivfflat)'
+              AND (%s::boolean IS NULL OR (indexdef ~* ' WHERE ') = %s)
+        """, (list(tables), partial, partial)).fetchall()
+
+        for schema, name, _ in index_rows:
+            conn.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(schema, name)))
+        return [index_def for _, _, index_def in index_rows]
+
+    def close(self):
+        self.pool.close()
+
+    def pool_stats(self):
+        """
+        커넥션 풀 상태 (pool_size, pool_available, requests_num, requests_waiting 등)
+        """
+        return self.pool.get_stats()
+
+    def check_pool(self):
+        """
+        풀에 있는 유휴 세션 전체를 점검하고, 끊긴 세션은 새 세션으로 교체
+        """
+        self.pool.check()
+
+    @staticmethod
+    def _search_settings(limit, ef_search=None, probes=None, exact=False, iterative=False):
+        """
+        검색 옵션 -> 트랜잭션 범위로 적용할 [(설정 이름, 값), ...]
+        limit: 인덱스에서 받아야 할 행 수 (top_k, halfvec/bit는 shortlist)
+        iterative: 필터 검색. ANN 인덱스가 필터에 걸러진 만큼 후보를 더 탐색해 limit개를 채움 (pgvector 0.8 이상)
+        """
+        if ef_search is None and limit > HNSW_DEFAULT_EF_SEARCH:
+            ef_search = limit
+        elif ef_search is not None:
+            ef_search = max(ef_search, limit)
+
+        settings = []
+        if ef_search is not None:
+            settings.append(("hnsw.ef_search", str(ef_search)))
+        if probes is not None:
+            settings.append(("ivfflat.probes", str(probes)))
+        if exact:
+            settings.append(("enable_indexscan", "off"))
+        if iterative:
+            settings.extend([("hnsw.iterative_scan", "relaxed_order"), ("ivfflat.iterative_scan", "relaxed_order")])
+        return settings
+
+    def _plan(self, name, top_k, ef_search, probes, exact, shortlist, classes=None, cells=None, filters=None):
+        """
+        -> (SQL, 기본 파라미터, 설정, 질의 사영 함수 또는 None)
+        shortlist: halfvec/bit에서 재정렬할 후보 수 (None이면 top_k * rerank_factor)
+        classes, cells: 프로토타입 2단계 검색 (PROTOTYPE_NEAREST_SQL 참고)
+        filters: 메타데이터 필터 (normalize_filters 참고). 유사도 쿼리 안의 WHERE로 들어가므로 top_k를 파이썬에서
+                 걸러내지 않음 (필터에 맞는 행 중 top_k)
+        """
+        self._check_state()
+        where, filter_params = filter_sql(normalize_filters(filters))
+        iterative = bool(where) and self.pgvector_version >= (0, 8)
+        if classes is not None:
+            if not self.prototypes:
+                raise RuntimeError("프로토타입이 없습니다. build_prototypes()를 먼저 실행하세요.")
+            return self._search_sql("prototype", name, where), \
+                dict(filter_params, top_k=top_k, classes=classes,
+                     cells=PROTOTYPE_CELLS if cells is None else cells), [], None
+        if exact:
+            return self._search_sql("exact", name, where), dict(filter_params, top_k=top_k), \
+                self._search_settings(top_k, probes=probes, exact=True), None
+        if self.storage == "float32":
+            project = self.projection.apply if self.projection is not None and not where else None
+            return self._search_sql("default", name, where), dict(filter_params, top_k=top_k), \
+                self._search_settings(top_k, ef_search, probes, iterative=iterative), project
+        shortlist = max(shortlist or top_k * self.rerank_factor, top_k)
+        return self._search_sql("default", name, where), dict(filter_params, top_k=top_k, shortlist=shortlist), \
+            self._search_settings(shortlist, ef_search, probes, iterative=iterative), None
+
+    def _fetch(self, query, params, settings):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                if not settings:
+                    # prepare=True: 세션별로 서버에 prepared statement로 등록되어 파싱/플래닝 재사용
+                    cursor.execute(query, params, prepare=True)
+                    return cursor.fetchall()
+
+                # 검색 파라미터는 SET LOCAL(트랜잭션 범위)로만 적용해 풀의 다른 사용자에게 새지 않도록 함
+                with conn.transaction():
+                    for name, value in settings:
+                        cursor.execute("SELECT set_config(%s, %s, true)", (name, value), prepare=True)
+                    cursor.execute(query, params, prepare=True)
+                    return cursor.fetchall()
+
+    def search(self, query_vector, top_k=5, ef_search=None, probes=None, exact=False, shortlist=None,
+               classes=None, cells=None, filters=None):
+        """
+        ef_search: HNSW 탐색 후보 수 (클수록 recall↑, 속도↓). 인덱스에서 받을 행 수보다 작으면 그 값으로 올림
+        probes   : IVFFlat 탐색 클러스터 수 (클수록 recall↑, 속도↓)
+        exact    : True면 인덱스를 끄고 원본 float32로 정확한 전체 스캔 (recall 기준값 측정용)
+        shortlist: halfvec/bit 저장 방식에서 float32로 재정렬할 후보 수
+        classes  : 프로토타입 2단계 검색. 서브 중심으로 고른 상위 classes개 결함 종류 안에서만 정확한 검색
+        cells    : 2단계에서 결함 종류마다 훑을 서브 중심(클러스터) 수 (None이면 PROTOTYPE_CELLS. 정확도 trade-off 참고)
+        filters  : 메타데이터 필터 {"line", "layer", "capture_date", "source_folder"} (normalize_filters 참고)
+                   라인별 부분 인덱스(create_index(line=...))가 있으면 그 라인만의 ANN 인덱스로 검색
+        """
+        query, params, settings, project = self._plan("search", top_k, ef_search, probes, exact, shortlist,
+                                                      classes, cells, filters)
+        if project is not None:
+            query_vector = project(as_array(query_vector))
+        return self._fetch(query, dict(params, query=query_vector), settings)
+
+    def search_many(self, query_vectors, top_k=5, ef_search=None, probes=None, exact=False, shortlist=None,
+                    classes=None, cells=None, filters=None):
+        """
+        모든 질의 벡터를 쿼리 1개(왕복 1회)로 검색. 옵션은 search()와 동일
+        """
+        query_vectors = [as_array(query_vector) for query_vector in query_vectors]
+        results = [[] for _ in query_vectors]
+        if not query_vectors:
+            return results
+
+        query, params, settings, project = self._plan("search_many", top_k, ef_search, probes, exact, shortlist,
+                                                      classes, cells, filters)
+        if project is not None:
+            query_vectors = list(project(np.stack(query_vectors)))
+        for ord_, *row in self._fetch(query, dict(params, vectors=query_vectors), settings):
+            results[ord_ - 1].append(tuple(row))
+        return results
+
+    def search_tiles(self, query_vector, top_k=5, ef_search=None, probes=None, exact=False):
+        """
+        defect_tiles에서 검색 (항상 float32 원본 차원). 옵션은 search()와 동일
+        """
+        settings = self._search_settings(top_k, ef_search, probes, exact)
+        return self._fetch(SEARCH_TILES_SQL, {"query": as_array(query_vector), "top_k": top_k}, settings)
+
+    def verdict_many(self, query_vectors, top_k=200, temperature=None, evidence=3,
+                     ef_search=None, probes=None, exact=False, shortlist=None, classes=None, cells=None,
+                     filters=None):
+        """
+        결함 종류별 투표 집계를 SQL(VERDICT_MANY_SQL)로 수행해 요약 행만 받음. 검색 옵션은 search()와 동일
+        (classes를 주면 프로토타입 2단계 검색 결과로 집계 -> 지연시간이 DB 전체 크기와 무관)
+        """
+        query_vectors = [as_array(query_vector) for query_vector in query_vectors]
+        votes = [[] for _ in query_vectors]
+        if not query_vectors:
+            return votes
+
+        query, params, settings, project = self._plan("verdict_many", top_k, ef_search, probes, exact, shortlist,
+                                                      classes, cells, filters)
+        if project is not None:
+            query_vectors = list(project(np.stack(query_vectors)))
+        params = dict(params, vectors=query_vectors, temperature=temperature, evidence=evidence)
+        for ord_, defect_type, score, count, filenames, sims, ids in self._fetch(query, params, settings):
+            votes[ord_ - 1].append(ClassVote(defect_type, score, count, list(zip(filenames or [], sims or [], ids or []))))
+        return votes
+
+
+class LocalVectorStore(VectorStore):
+    """
+    DB 서버 없이 쓰는 로컬 파일 백엔드 (단독 검사 PC, 테스트용)
+
+    store_dir/
+        embeddings.bin    : (N, dim) 행렬 (float16 또는 float32, 메모리 맵으로 읽음). 기본은 L2 정규화해서 저장
+                            (normalize=False로 만든 스냅샷은 원본 벡터 그대로 -> 검색할 때 행 노름으로 나눔)
+        metadata.N.jsonl  : 행마다 {"id", "filename", "defect_type", ...} 한 줄 (삭제된 행은 "deleted": true)
+        meta.json         : dim, dtype, 커밋된 행 수(count), 현재 메타데이터 파일 이름과 커밋 바이트 수
+                            (snapshot.py로 내보낸 폴더면 "snapshot": 모델 버전, 원본, 내보낸 시각, 체크섬)
+
+    meta.json이 커밋 지점: append 도중 중단되면 count 이후의 꼬리 데이터는 무시되고, 다음 append 때 잘라냄
+    삭제/경로 변경은 메타데이터 파일을 새 세대(N+1)로 다시 쓴 뒤 meta.json을 교체해서 반영
+    검색은 행렬을 block_size 행씩 읽어 matmul + 부분 정렬하는 정확한(exact) top-k 코사인 검색
+    """
+
+    name = "Local"
+
+    EMBEDDINGS_FILE = "embeddings.bin"
+    META_FILE = "meta.json"
+
+    def __init__(self, store_dir, dim=1024, dtype="float32", block_size=65536, normalize=True):
+        """
+        normalize: 새 저장소를 만들 때만 사용. False면 원본 벡터를 저장 (PCA 사영이 원본 벡터로 학습되므로 스냅샷용)
+                   기존 저장소는 meta.json의 normalized 값을 따름
+        """
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"지원하지 않는 dtype입니다: {dtype} (float16 또는 float32)")
+
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        self.block_size = block_size
+        self._lock = threading.Lock()
+
+        meta_path = os.path.join(store_dir, self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                self.meta = json.load(f)
+            self.meta.setdefault("metadata_file", "metadata.jsonl")  # 세대 번호가 없던 이전 형식
+        else:
+            self.meta = {
+                "dim": dim, "dtype": dtype, "count": 0,
+                "metadata_file": "metadata.0.jsonl", "metadata_bytes": 0, "normalized": normalize,
+            }
+            self._write_meta()
+
+        self.dim = self.meta["dim"]
+        self.normalized = self.meta.get("normalized", True)  # 값이 없던 이전 형식은 정규화해서 저장했음
+        self.active_version = self.meta.get("snapshot", {}).get("model_version")
+
+        # 행렬/메타데이터는 첫 검색 때 연결 (시작 시 파일을 읽지 않음)
+        self._matrix = None
+        self._metadata = None
+        self._deleted = None
+        print(f"✅ 로컬 저장소 준비 완료 ({store_dir}, {self.meta['count']}개, {self.meta['dtype']})")
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def _write_meta(self):
+        tmp_path = self._path(self.META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(self.META_FILE))
+
+    def _truncate_uncommitted(self):
+        # 커밋되지 않은 꼬리 데이터 제거 (memmap이 열려 있으면 Windows에서 truncate 불가하므로 먼저 해제)
+        self._matrix = None
+        row_bytes = self.meta["dim"] * np.dtype(self.meta["dtype"]).itemsize
+        for name, size in [
+            (self.EMBEDDINGS_FILE, self.meta["count"] * row_bytes),
+            (self.meta["metadata_file"], self.meta["metadata_bytes"]),
+        ]:
+            with open(self._path(name), "ab") as f:
+                f.truncate(size)
+
+    @staticmethod
+    def _encode_records(records):
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+
+    def _load_metadata(self):
+        if self._metadata is None:
+            self._metadata = []
+            if self.meta["count"] > 0:
+                with open(self._path(self.meta["metadata_file"]), "rb") as f:
+                    data = f.read(self.meta["metadata_bytes"])
+                self._metadata = [json.loads(line) for line in data.decode("utf-8").splitlines()]
+        return self._metadata
+
+    def _rewrite_metadata(self, records, **meta_updates):
+        """
+        메타데이터 전체를 새 세대 파일로 쓰고 meta.json 교체로 커밋 (중간에 중단되어도 이전 세대가 유효)
+        meta_updates: 같은 커밋에 함께 반영할 meta.json 값 (예: count)
+        """
+        generation = self.meta["metadata_file"].split(".")[1]
+        generation = int(generation) + 1 if generation.isdigit() else 1
+        new_file = f"metadata.{generation}.jsonl"
+        data = self._encode_records(records)
+        with open(self._path(new_file), "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        old_file = self.meta["metadata_file"]
+        self.meta.update(metadata_file=new_file, metadata_bytes=len(data), **meta_updates)
+        self._write_meta()
+        os.remove(self._path(old_file))
+        self._metadata = records
+        self._deleted = None
+
+    def add(self, rows, chunk_size=5000, rebuild=False):
+        total = 0
+        with self._lock:
+            if rebuild:
+                self._rewrite_metadata([], count=0)
+            self._truncate_uncommitted()
+
+            with open(self._path(self.EMBEDDINGS_FILE), "ab") as f_emb, \
+                    open(self._path(self.meta["metadata_file"]), "ab") as f_meta:
+                for chunk in chunked(rows, chunk_size):
+                    chunk = [DefectRow(*row) for row in chunk]
+                    vectors = np.stack([np.asarray(row.embedding, dtype=np.float32) for row in chunk])
+                    if self.normalized:
+                        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+                    first_id = self.meta["count"] + 1
+                    records = []
+                    for i, row in enumerate(chunk):
+                        record = {"id": first_id + i}
+                        record.update((k, v.isoformat() if isinstance(v, datetime.date) else v)
+                                      for k, v in row._asdict().items() if k != "embedding" and v is not None)
+                        records.append(record)
+                    lines = self._encode_records(records)
+
+                    f_emb.write(vectors.astype(self.meta["dtype"]).tobytes())
+                    f_meta.write(lines)
+                    f_emb.flush()
+                    f_meta.flush()
+                    os.fsync(f_emb.fileno())
+                    os.fsync(f_meta.fileno())
+
+                    self.meta["count"] += len(chunk)
+                    self.meta["metadata_bytes"] += len(lines)
+                    self._write_meta()
+
+                    if self._metadata is not None:
+                        self._metadata.extend(records)
+                    self._matrix = None
+                    total += len(chunk)
+
+        return total
+
+    def count(self):
+        with self._lock:
+            return sum(1 for record in self._load_metadata() if not record.get("deleted"))
+
+    def entries(self, model_version):
+        with self._lock:
+            return [
+                (record["id"], record["content_hash"], record.get("source_path"))
+                for record in self._load_metadata()
+                if not record.get("deleted") and record.get("model_version") == model_version
+                and record.get("content_hash")
+            ]
+
+    def delete(self, ids):
+        ids = set(ids)
+        with self._lock:
+            records = [dict(record, deleted=True) if record["id"] in ids else record
+                       for record in self._load_metadata()]
+            self._rewrite_metadata(records)
+
+    def update_paths(self, updates):
+        updates = {row_id: (filename, defect_type, source_path, metadata)
+                   for row_id, filename, defect_type, source_path, *metadata in updates}
+        with self._lock:
+            records = []
+            for record in self._load_metadata():
+                if record["id"] in updates:
+                    filename, defect_type, source_path, metadata = updates[record["id"]]
+                    record = dict(record, filename=filename, defect_type=defect_type, source_path=source_path)
+                    for name, value in zip(METADATA_FIELDS, metadata):
+                        record.pop(name, None)
+                        if value is not None:
+                            record[name] = value.isoformat() if isinstance(value, datetime.date) else value
+                records.append(record)
+            self._rewrite_metadata(records)
+
+    def set_snapshot_info(self, info):
+        """
+        내보낸 스냅샷 정보(모델 버전, 원본, 체크섬 등)를 meta.json에 기록
+        """
+        with self._lock:
+            self.meta["snapshot"] = info
+            self._write_meta()
+        self.active_version = info.get("model_version")
+
+    def iter_rows(self, chunk_size=5000):
+        """
+        삭제되지 않은 행을 저장 순서대로 chunk_size개씩 -> DefectRow 목록 yield
+        embedding은 float32로 변환한 저장 벡터 (normalized 저장소는 정규화 벡터, 스냅샷은 원본 벡터)
+        """
+        matrix, metadata, deleted = self._snapshot()
+        alive = np.setdiff1d(np.arange(len(metadata)), deleted)
+        for start in range(0, len(alive), chunk_size):
+            rows = alive[start:start + chunk_size]
+            vectors = np.asarray(matrix[rows], dtype=np.float32)
+            chunk = []
+            for row, vector in zip(rows.tolist(), vectors):
+                fields = {field: metadata[row].get(field) for field in DefectRow._fields if field != "embedding"}
+                fields["capture_date"] = as_date(fields["capture_date"])
+                chunk.append(DefectRow(embedding=vector, **fields))
+            yield chunk
+
+    def _snapshot(self):
+        """
+        현재 커밋된 (행렬, 메타데이터, 삭제된 행 번호) 묶음
+        append와 동시에 검색해도 같은 시점의 데이터를 보도록 lock 안에서 획득
+        """
+        with self._lock:
+            count, dim = self.meta["count"], self.meta["dim"]
+            if self._matrix is None:
+                if count == 0:
+                    self._matrix = np.empty((0, dim), dtype=self.meta["dtype"])
+                else:
+                    self._matrix = np.memmap(
+                        self._path(self.EMBEDDINGS_FILE), dtype=self.meta["dtype"], mode="r", shape=(count, dim)
+                    )
+            metadata = self._load_metadata()
+            if self._deleted is None:
+                self._deleted = np.array(
+                    [i for i, record in enumerate(metadata) if record.get("deleted")], dtype=np.int64
+                )
+            return self._matrix, metadata, self._deleted
+
+    def _topk(self, matrix, queries, top_k, deleted):
+        """
+        queries: (M, dim) 정규화된 질의 행렬
+        블록 단위 matmul로 질의마다 (유사도, 행 번호) 상위 top_k를 구함 (유사도 내림차순, 삭제된 행 제외)
+        -> [(유사도 배열, 행 번호 배열), ...] (질의 순서)
+        """
+        num_queries = len(queries)
+        best_sims = np.empty((0, num_queries), dtype=np.float32)
+        best_rows = np.empty((0, num_queries), dtype=np.int64)
+        for start in range(0, len(matrix), self.block_size):
+            block = np.asarray(matrix[start:start + self.block_size], dtype=np.float32)
+            block_sims = block @ queries.T  # (블록 행 수, M)
+            if not self.normalized:
+                block_sims /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+            block_deleted = deleted[(deleted >= start) & (deleted < start + len(block))]
+            block_sims[block_deleted - start] = -np.inf
+
+            sims = np.concatenate([best_sims, block_sims])
+            block_rows = np.broadcast_to(np.arange(start, start + len(block))[:, None], block_sims.shape)
+            rows = np.concatenate([best_rows, block_rows])
+            if len(sims) > top_k:
+                keep = np.argpartition(-sims, top_k - 1, axis=0)[:top_k]
+                sims, rows = np.take_along_axis(sims, keep, axis=0), np.take_along_axis(rows, keep, axis=0)
+            best_sims, best_rows = sims, rows
+
+        results = []
+        for sims, rows in zip(best_sims.T, best_rows.T):
+            alive = np.isfinite(sims)
+            sims, rows = sims[alive], rows[alive]
+            order = np.argsort(-sims, kind="stable")
+            results.append((sims[order], rows[order]))
+        return results
+
+    def search(self, query_vector, top_k=5, filters=None, **options):
+        """
+        항상 정확한(exact) 검색이므로 ef_search/probes/exact 옵션은 무시
+        filters: 메타데이터 필터 (PostgresVectorStore.search와 동일)
+        """
+        return self.search_many([query_vector], top_k, filters)[0]
+
+    def search_many(self, query_vectors, top_k=5, filters=None, **options):
+        """
+        질의 행렬 1개로 블록마다 matmul 1번에 모든 질의를 함께 계산 (행렬을 질의 수만큼 반복해서 읽지 않음)
+        filters에 맞지 않는 행은 삭제된 행처럼 matmul 단계에서 제외 (top_k를 다시 거르지 않음)
+        """
+        matrix, metadata, deleted = self._snapshot()
+        filters = normalize_filters(filters)
+        if filters:
+            excluded = [i for i, record in enumerate(metadata) if not matches_filters(record, filters)]
+            deleted = np.union1d(deleted, np.array(excluded, dtype=np.int64))
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(-1, self.meta["dim"])
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        results = []
+        for sims, rows in self._topk(matrix, queries, top_k, deleted):
+            query_results = []
+            for sim, row in zip(sims.tolist(), rows.tolist()):
+                record = metadata[row]
+                query_results.append((record["defect_type"], record["filename"], sim, record["id"]))
+            results.append(query_results)
+        return results